@@ -19,6 +19,16 @@ def timed_command(coro):
     return wrapper
 
 
+def _job_progress_message(progress):
+    counts = progress.count_by_status
+    msg = (f'`{progress.job}`: {progress.completed} of {progress.total} contests, '
+           f'{counts["done"]} saved, {counts["empty"]} empty, {counts["error"]} failed')
+    eta = progress.eta()
+    if counts['pending'] and eta is not None:
+        msg += f', about {cf_common.pretty_time_format(eta, shorten=True)} left'
+    return msg
+
+
 class CacheControl(commands.Cog):
     """Cog to manually trigger update of cached data. Intended for dev/admin use."""
 
@@ -57,25 +67,34 @@ class CacheControl(commands.Cog):
             await ctx.send("Bruh...You don't own this instance of TLE")
         
 
-    @cache.command(usage='[missing|all|contest_id]')
+    @cache.command(usage='[missing|all|progress|contest_id]')
     @commands.has_role('Admin')
     @commands.has_role('Developer')
     @timed_command
     async def ratingchanges(self, ctx, contest_id='missing'):
-        """Defaults to 'missing'. Mode 'all' clears existing cached changes.
-        Mode 'contest_id' clears existing changes with the given contest id.
+        """Defaults to 'missing'. Mode 'all' refetches changes for all finished
+        contests. Both resume the previous run if it was interrupted. Mode
+        'progress' shows how far the latest of these runs got. Mode 'contest_id'
+        refetches changes for the contest with the given id.
         """
         if str(ctx.author.id) == TLEconstants.OWNER_ID:
-            if contest_id not in ('all', 'missing'):
+            if contest_id not in ('all', 'missing', 'progress'):
                 try:
                     contest_id = int(contest_id)
                 except ValueError:
                     return
+            if contest_id == 'progress':
+                progress = cf_common.cache2.rating_changes_cache.backfill_progress
+                if progress is None:
+                    await ctx.send('No rating changes have been fetched since startup')
+                else:
+                    await ctx.send(_job_progress_message(progress))
+                return
             if contest_id == 'all':
-                await ctx.send('This will take a while')
+                await ctx.send('This will take a while, check with `;cache ratingchanges progress`')
                 count = await cf_common.cache2.rating_changes_cache.fetch_all_contests()
             elif contest_id == 'missing':
-                await ctx.send('This may take a while')
+                await ctx.send('This may take a while, check with `;cache ratingchanges progress`')
                 count = await cf_common.cache2.rating_changes_cache.fetch_missing_contests()
             else:
                 count = await cf_common.cache2.rating_changes_cache.fetch_contest(contest_id)
@@ -88,8 +107,9 @@ class CacheControl(commands.Cog):
     @commands.has_role('Developer')
     @timed_command
     async def problemsets(self, ctx, contest_id):
-        """Mode 'all' clears all existing cached problems. Mode 'contest_id'
-        clears existing problems with the given contest id.
+        """Mode 'all' refetches the problemsets of all finished contests, resuming
+        the previous run if it was interrupted. Mode 'contest_id' refetches the
+        problemset of the contest with the given id.
         """
         if str(ctx.author.id) == TLEconstants.OWNER_ID:
             if contest_id == 'all':
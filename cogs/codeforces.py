@@ -80,7 +80,7 @@ class Codeforces(commands.Cog):
         args = filt.parse(args)
         handles = args
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        submissions = [await cf.user.status(handle=handle) for handle in handles]
+        submissions = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_submissions, handles)
         submissions = [sub for subs in submissions for sub in subs]
         submissions = filt.filter_subs(submissions)
 
@@ -118,24 +118,21 @@ class Codeforces(commands.Cog):
 
         handles = handles or ('!' + str(ctx.author),)
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        resp = [await cf.user.status(handle=handle) for handle in handles]
+        resp = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_submissions, handles)
         submissions = [sub for user in resp for sub in user]
         solved = {sub.problem.name for sub in submissions}
         info = await cf.user.info(handles=handles)
         rating = int(round(sum(user.effective_rating for user in info) / len(handles), -2))
-        problems = [prob for prob in cf_common.cache2.problem_cache.problems
-                    if abs(prob.rating - rating) <= 100 and prob.name not in solved
-                    and not any(cf_common.is_contest_writer(prob.contestId, handle) for handle in handles)
-                    and not cf_common.is_nonstandard_problem(prob)]
-        if tags:
-            problems = [prob for prob in problems if prob.tag_matches(tags)]
+        problem_cache = cf_common.cache2.problem_cache
+        problems = problem_cache.standard_problems_in_rating_range(rating - 100, rating + 100,
+                                                                   tags)
+        problems = [prob for prob in problems
+                    if prob.name not in solved
+                    and not any(cf_common.is_contest_writer(prob.contestId, handle) for handle in handles)]
 
         if len(problems) < 4:
             raise CodeforcesCogError('Problems not found within the search parameters')
 
-        problems.sort(key=lambda problem: cf_common.cache2.contest_cache.get_contest(
-            problem.contestId).startTimeSeconds)
-
         choices = []
         for i in range(4):
             k = max(random.randrange(len(problems) - i) for _ in range(2))
@@ -281,7 +278,7 @@ class Codeforces(commands.Cog):
             return user.maxRating if peak else user.rating
 
         if is_entire_server:
-            res = cf_common.user_db.get_cf_users_for_guild(ctx.guild.id)
+            res = await cf_common.user_db.get_cf_users_for_guild(ctx.guild.id)
             ratings = [(rating(user), 1) for user_id, user in res if user.rating is not None]
             user_str = '+server'
         else:
@@ -114,18 +114,21 @@ class Contests(commands.Cog):
         self.finished_contests = self.finished_contests[:_FINISHED_CONTESTS_LIMIT]
 
         self.logger.info(f'Refreshed cache')
-        self.start_time_map.clear()
+        start_time_map = defaultdict(list)
         for contest in self.future_contests:
             if not cf_common.is_nonstandard_contest(contest):
                 # Exclude non-standard contests from reminders.
-                self.start_time_map[contest.startTimeSeconds].append(contest)
-        self._reschedule_all_tasks()
+                start_time_map[contest.startTimeSeconds].append(contest)
+        if start_time_map != self.start_time_map:
+            # Reminders are only affected by changes to the upcoming contests.
+            self.start_time_map = start_time_map
+            await self._reschedule_all_tasks()
 
-    def _reschedule_all_tasks(self):
+    async def _reschedule_all_tasks(self):
         for guild in self.bot.guilds:
-            self._reschedule_tasks(guild.id)
+            await self._reschedule_tasks(guild.id)
 
-    def _reschedule_tasks(self, guild_id):
+    async def _reschedule_tasks(self, guild_id):
         for task in self.task_map[guild_id]:
             task.cancel()
         self.task_map[guild_id].clear()
@@ -133,7 +136,7 @@ class Contests(commands.Cog):
         if not self.start_time_map:
             return
         try:
-            settings = cf_common.user_db.get_reminder_settings(guild_id)
+            settings = await cf_common.user_db.get_reminder_settings(guild_id)
         except db.DatabaseDisabledError:
             return
         if settings is None:
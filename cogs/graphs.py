@@ -1,4 +1,3 @@
-import bisect
 import collections
 import datetime as dt
 import time
@@ -7,11 +6,10 @@ import math
 from typing import List
 
 import discord
-import numpy as np
 import pandas as pd
 import seaborn as sns
 from discord.ext import commands
-from matplotlib import pyplot as plt
+from matplotlib import rcParams
 from matplotlib import patches as patches
 from matplotlib import lines as mlines
 from matplotlib import dates as mdates
@@ -21,6 +19,7 @@ from util import codeforces_api as cf
 from util import codeforces_common as cf_common
 from util import discord_common
 from util import graph_common as gc
+from util.rating_index import RatingIndex
 
 pd.plotting.register_matplotlib_converters()
 
@@ -38,7 +37,7 @@ def nice_sub_type(types):
                 'PRACTICE':'Practice: {}'}
     return [nice_map[t] for t in types]
 
-def _plot_rating(resp, mark='o'):
+def _plot_rating(ax, resp, mark='o'):
 
     for rating_changes in resp:
         ratings, times = [], []
@@ -46,16 +45,16 @@ def _plot_rating(resp, mark='o'):
             ratings.append(rating_change.newRating)
             times.append(dt.datetime.fromtimestamp(rating_change.ratingUpdateTimeSeconds))
 
-        plt.plot(times,
-                 ratings,
-                 linestyle='-',
-                 marker=mark,
-                 markersize=3,
-                 markerfacecolor='white',
-                 markeredgewidth=0.5)
+        ax.plot(times,
+                ratings,
+                linestyle='-',
+                marker=mark,
+                markersize=3,
+                markerfacecolor='white',
+                markeredgewidth=0.5)
 
-    gc.plot_rating_bg(cf.RATED_RANKS)
-    plt.gcf().autofmt_xdate()
+    gc.plot_rating_bg(ax, cf.RATED_RANKS)
+    ax.figure.autofmt_xdate()
 
 def _classify_submissions(submissions):
     solved_by_type = {sub_type: [] for sub_type in cf.Party.PARTICIPANT_TYPES}
@@ -64,11 +63,11 @@ def _classify_submissions(submissions):
     return solved_by_type
 
 
-def _plot_scatter(regular, practice, virtual, point_size):
+def _plot_scatter(ax, regular, practice, virtual, point_size):
     for contest in [practice, regular, virtual]:
         if contest:
             times, ratings = zip(*contest)
-            plt.scatter(times, ratings, zorder=10, s=point_size)
+            ax.scatter(times, ratings, zorder=10, s=point_size)
 
 
 def _running_mean(x, bin_size):
@@ -88,7 +87,7 @@ def _running_mean(x, bin_size):
 
 
 
-def _plot_average(practice, bin_size, label: str = ''):
+def _plot_average(ax, practice, bin_size, label: str = ''):
     if len(practice) > bin_size:
         sub_times, ratings = map(list, zip(*practice))
 
@@ -97,13 +96,153 @@ def _plot_average(practice, bin_size, label: str = ''):
         mean_sub_times = [dt.datetime.fromtimestamp(timestamp) for timestamp in mean_sub_timestamps]
         mean_ratings = _running_mean(ratings, bin_size)
 
-        plt.plot(mean_sub_times,
-                 mean_ratings,
-                 linestyle='-',
-                 marker='',
-                 markerfacecolor='white',
-                 markeredgewidth=0.5,
-                 label=label)
+        ax.plot(mean_sub_times,
+                mean_ratings,
+                linestyle='-',
+                marker='',
+                markerfacecolor='white',
+                markeredgewidth=0.5,
+                label=label)
+
+
+# The functions below draw the figures of the commands. They run in the worker processes of
+# gc.render, so they take plain data rather than reading the caches.
+
+def _draw_rating(fig, resp, labels, ylim):
+    ax = fig.add_subplot()
+    ax.set_prop_cycle(gc.rating_color_cycler)
+    _plot_rating(ax, resp)
+    ax.legend(labels, loc='upper left')
+    if ylim is not None:
+        ax.set_ylim(*ylim)
+
+
+def _draw_solved(fig, all_ratings, hist_bins, labels, legend_title):
+    ax = fig.add_subplot()
+    ax.set_xlabel('Problem rating')
+    ax.set_ylabel('Number solved')
+    if legend_title is not None:
+        # Solved problems of a single user, stacked by type.
+        ax.hist(all_ratings, stacked=True, bins=hist_bins, label=labels)
+        ax.legend(title=legend_title, title_fontsize=rcParams['legend.fontsize'],
+                  loc='upper right')
+    else:
+        ax.hist(all_ratings, bins=hist_bins)
+        ax.legend(labels, loc='upper right')
+
+
+def _draw_hist(fig, all_times, hist_range, bins, labels, legend_title):
+    ax = fig.add_subplot()
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Number solved')
+    if legend_title is not None:
+        # Solved problems of a single user, stacked by type.
+        ax.hist(all_times, stacked=True, label=labels, range=hist_range, bins=bins)
+        ax.legend(title=legend_title, title_fontsize=rcParams['legend.fontsize'])
+    else:
+        ax.hist(all_times, range=hist_range, bins=bins)
+        ax.legend(labels)
+
+    # NOTE: In case of nested list, matplotlib decides type using 1st sublist,
+    # it assumes float when 1st sublist is empty.
+    # Hence explicitly assigning locator and formatter is must here.
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+
+    fig.autofmt_xdate()
+
+
+def _draw_curve(fig, all_times, end_time, labels):
+    ax = fig.add_subplot()
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Cumulative solve count')
+    for times in all_times:
+        cumulative_solve_count = list(range(1, len(times)+1)) + [len(times)]
+        timestretched = times + [end_time]
+        ax.plot(timestretched, cumulative_solve_count)
+    ax.legend(labels)
+    fig.autofmt_xdate()
+
+
+def _draw_scatter(fig, regular, practice, virtual, point_size, labels, bin_size, rating_resp,
+                  rating_bounds):
+    ax = fig.add_subplot()
+    _plot_scatter(ax, regular, practice, virtual, point_size)
+    if labels:
+        ax.legend(labels, loc='upper left')
+    _plot_average(ax, practice, bin_size)
+    _plot_rating(ax, rating_resp, mark='')
+
+    # zoom
+    ymin, ymax = ax.get_ylim()
+    rlo, rhi = rating_bounds
+    ax.set_ylim(max(ymin, rlo - 100), min(ymax, rhi + 100))
+
+
+def _draw_rating_hist(fig, x, height, width, colors, tick_labels, xlim, log):
+    ax = fig.add_subplot()
+    ax.set_xlim(*xlim)
+    ax.bar(x, height, width, color=colors, linewidth=0, tick_label=tick_labels, log=log)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_xlabel('Rating')
+    ax.set_ylabel('Number of users')
+
+
+def _draw_centile(fig, ratings, perc, users_to_mark, xlim, ylim, exact):
+    ax = fig.add_subplot()
+    ax.plot(ratings, perc, color='#00000099')
+
+    ax.set_xlabel('Rating')
+    ax.set_ylabel('Percentile')
+
+    for pos in ['right','top','bottom','left']:
+        ax.spines[pos].set_visible(False)
+    ax.tick_params(axis='both', which='both',length=0)
+
+    # Color intervals by rank
+    for rank in cf.RATED_RANKS:
+        alpha = '99'
+        l,r = rank.low, rank.high
+        col = rank.color_graph + alpha
+        rect = patches.Rectangle((l,-50), r-l, 200,
+                                 edgecolor='none',
+                                 facecolor=col)
+        ax.add_patch(rect)
+
+    xmin, xmax = xlim
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+
+    # Mark users in plot
+    for user, point in users_to_mark.items():
+        astr = f'{user} ({round(point[1], 2)})' if exact else user
+        apos = ('left', 'top') if point[0] <= (xmax + xmin) // 2 else ('right', 'bottom')
+        ax.annotate(astr,
+                    xy=point,
+                    xytext=(0, 0),
+                    textcoords='offset points',
+                    ha=apos[0],
+                    va=apos[1])
+        ax.plot(*point,
+                marker='o',
+                markersize=5,
+                color='red',
+                markeredgecolor='darkred')
+
+    # Draw tick lines
+    linecolor = '#00000022'
+    inf = 10000
+    def horz_line(y):
+        l = mlines.Line2D([-inf,inf], [y,y], color=linecolor)
+        ax.add_line(l)
+    def vert_line(x):
+        l = mlines.Line2D([x,x], [-inf,inf], color=linecolor)
+        ax.add_line(l)
+    for y in ax.get_yticks():
+        horz_line(y)
+    for x in ax.get_xticks():
+        vert_line(x)
 
 
 class Graphs(commands.Cog):
@@ -128,7 +267,7 @@ class Graphs(commands.Cog):
         args = filt.parse(args)
         handles = args or ('!' + str(ctx.author),)
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        resp = [await cf.user.rating(handle=handle) for handle in handles]
+        resp = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_rating_history, handles)
         resp = [filt.filter_rating_changes(rating_changes) for rating_changes in resp]
 
         if not any(resp):
@@ -154,13 +293,10 @@ class Graphs(commands.Cog):
         if peak:
             resp = [max_prefix(user) for user in resp]
 
-        plt.clf()
-        plt.axes().set_prop_cycle(gc.rating_color_cycler)
-        _plot_rating(resp)
         current_ratings = [rating_changes[-1].newRating if rating_changes else 'Unrated' for rating_changes in resp]
         labels = [gc.StrWrap(f'{handle} ({rating})') for handle, rating in zip(handles, current_ratings)]
-        plt.legend(labels, loc='upper left')
 
+        ylim = None
         if not zoom:
             min_rating = 1100
             max_rating = 1800
@@ -168,9 +304,9 @@ class Graphs(commands.Cog):
                 for rating in rating_changes:
                     min_rating = min(min_rating, rating.newRating)
                     max_rating = max(max_rating, rating.newRating)
-            plt.ylim(min_rating - 100, max_rating + 200)
+            ylim = min_rating - 100, max_rating + 200
 
-        discord_file = gc.get_current_figure_as_file()
+        discord_file = await gc.render_as_file(_draw_rating, resp, labels, ylim)
         embed = discord_common.cf_color_embed(title='Rating graph on Codeforces')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
@@ -186,15 +322,12 @@ class Graphs(commands.Cog):
         args = filt.parse(args)
         handles = args or ('!' + str(ctx.author),)
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        resp = [await cf.user.status(handle=handle) for handle in handles]
-        all_solved_subs = [filt.filter_subs(submissions) for submissions in resp]
+        resp = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_submission_frame, handles)
+        all_solved_subs = [filt.filter_subs(frame) for frame in resp]
 
         if not any(all_solved_subs):
             raise GraphCogError(f'There are no problems within the specified parameters.')
 
-        plt.clf()
-        plt.xlabel('Problem rating')
-        plt.ylabel('Number solved')
         if len(handles) == 1:
             # Display solved problem separately by type for a single user.
             handle, solved_by_type = handles[0], _classify_submissions(all_solved_subs[0])
@@ -207,10 +340,8 @@ class Graphs(commands.Cog):
             step = 100
             # shift the range to center the text
             hist_bins = list(range(filt.rlo - step // 2, filt.rhi + step // 2 + 1, step))
-            plt.hist(all_ratings, stacked=True, bins=hist_bins, label=labels)
             total = sum(map(len, all_ratings))
-            plt.legend(title=f'{handle}: {total}', title_fontsize=plt.rcParams['legend.fontsize'],
-                       loc='upper right')
+            legend_title = f'{handle}: {total}'
 
         else:
             all_ratings = [[sub.problem.rating for sub in solved_subs]
@@ -220,10 +351,10 @@ class Graphs(commands.Cog):
 
             step = 200 if filt.rhi - filt.rlo > 3000 // len(handles) else 100
             hist_bins = list(range(filt.rlo - step // 2, filt.rhi + step // 2 + 1, step))
-            plt.hist(all_ratings, bins=hist_bins)
-            plt.legend(labels, loc='upper right')
+            legend_title = None
 
-        discord_file = gc.get_current_figure_as_file()
+        discord_file = await gc.render_as_file(_draw_solved, all_ratings, hist_bins, labels,
+                                               legend_title)
         embed = discord_common.cf_color_embed(title='Histogram of problems solved on Codeforces')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
@@ -249,15 +380,12 @@ class Graphs(commands.Cog):
 
         handles = handles or ['!' + str(ctx.author)]
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        resp = [await cf.user.status(handle=handle) for handle in handles]
-        all_solved_subs = [filt.filter_subs(submissions) for submissions in resp]
+        resp = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_submission_frame, handles)
+        all_solved_subs = [filt.filter_subs(frame) for frame in resp]
 
         if not any(all_solved_subs):
             raise GraphCogError(f'There are no problems within the specified parameters.')
 
-        plt.clf()
-        plt.xlabel('Time')
-        plt.ylabel('Number solved')
         if len(handles) == 1:
             handle, solved_by_type = handles[0], _classify_submissions(all_solved_subs[0])
             all_times = [[dt.datetime.fromtimestamp(sub.creationTimeSeconds) for sub in solved_by_type[sub_type]]
@@ -269,15 +397,10 @@ class Graphs(commands.Cog):
             dlo = min(itertools.chain.from_iterable(all_times)).date()
             dhi = min(dt.datetime.today() + dt.timedelta(days=1), dt.datetime.fromtimestamp(filt.dhi)).date()
             phase_cnt = math.ceil((dhi - dlo) / phase_time)
-            plt.hist(
-                all_times,
-                stacked=True,
-                label=labels,
-                range=(dhi - phase_cnt * phase_time, dhi),
-                bins=min(40, phase_cnt))
+            bins = min(40, phase_cnt)
 
             total = sum(map(len, all_times))
-            plt.legend(title=f'{handle}: {total}', title_fontsize=plt.rcParams['legend.fontsize'])
+            legend_title = f'{handle}: {total}'
         else:
             all_times = [[dt.datetime.fromtimestamp(sub.creationTimeSeconds) for sub in solved_subs]
                          for solved_subs in all_solved_subs]
@@ -291,21 +414,12 @@ class Graphs(commands.Cog):
             dlo = min(itertools.chain.from_iterable(all_times)).date()
             dhi = min(dt.datetime.today() + dt.timedelta(days=1), dt.datetime.fromtimestamp(filt.dhi)).date()
             phase_cnt = math.ceil((dhi - dlo) / phase_time)
-            plt.hist(
-                all_times,
-                range=(dhi - phase_cnt * phase_time, dhi),
-                bins=min(40 // len(handles), phase_cnt))
-            plt.legend(labels)
-
-        # NOTE: In case of nested list, matplotlib decides type using 1st sublist,
-        # it assumes float when 1st sublist is empty.
-        # Hence explicitly assigning locator and formatter is must here.
-        locator = mdates.AutoDateLocator()
-        plt.gca().xaxis.set_major_locator(locator)
-        plt.gca().xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
-
-        plt.gcf().autofmt_xdate()
-        discord_file = gc.get_current_figure_as_file()
+            bins = min(40 // len(handles), phase_cnt)
+            legend_title = None
+
+        hist_range = (dhi - phase_cnt * phase_time, dhi)
+        discord_file = await gc.render_as_file(_draw_hist, all_times, hist_range, bins, labels,
+                                               legend_title)
         embed = discord_common.cf_color_embed(title='Histogram of number of solved problems over time')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
@@ -319,30 +433,20 @@ class Graphs(commands.Cog):
         args = filt.parse(args)
         handles = args or ('!' + str(ctx.author),)
         handles = await cf_common.resolve_handles(ctx, self.converter, handles)
-        resp = [await cf.user.status(handle=handle) for handle in handles]
-        all_solved_subs = [filt.filter_subs(submissions) for submissions in resp]
+        resp = await cf_common.fetch_for_handles(cf_common.cache2.user_history_cache.get_submission_frame, handles)
+        all_solved_subs = [filt.filter_subs(frame) for frame in resp]
 
         if not any(all_solved_subs):
             raise GraphCogError(f'There are no problems within the specified parameters.')
 
-        plt.clf()
-        plt.xlabel('Time')
-        plt.ylabel('Cumulative solve count')
-
         all_times = [[dt.datetime.fromtimestamp(sub.creationTimeSeconds) for sub in solved_subs]
                      for solved_subs in all_solved_subs]
-        for times in all_times:
-            cumulative_solve_count = list(range(1, len(times)+1)) + [len(times)]
-            timestretched = times + [min(dt.datetime.now(), dt.datetime.fromtimestamp(filt.dhi))]
-            plt.plot(timestretched, cumulative_solve_count)
+        end_time = min(dt.datetime.now(), dt.datetime.fromtimestamp(filt.dhi))
 
         labels = [gc.StrWrap(f'{handle}: {len(times)}')
                   for handle, times in zip(handles, all_times)]
 
-        plt.legend(labels)
-
-        plt.gcf().autofmt_xdate()
-        discord_file = gc.get_current_figure_as_file()
+        discord_file = await gc.render_as_file(_draw_curve, all_times, end_time, labels)
         embed = discord_common.cf_color_embed(title='Curve of number of solved problems over time')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
@@ -373,9 +477,9 @@ class Graphs(commands.Cog):
 
         handle = handle or '!' + str(ctx.author)
         handle, = await cf_common.resolve_handles(ctx, self.converter, (handle,))
-        rating_resp = [await cf.user.rating(handle=handle)]
+        rating_resp = [await cf_common.cache2.user_history_cache.get_rating_history(handle)]
         rating_resp = [filt.filter_rating_changes(rating_changes) for rating_changes in rating_resp]
-        submissions = filt.filter_subs(await cf.user.status(handle=handle))
+        submissions = filt.filter_subs(await cf_common.cache2.user_history_cache.get_submission_frame(handle))
 
         def extract_time_and_rating(submissions):
             return [(dt.datetime.fromtimestamp(sub.creationTimeSeconds), sub.problem.rating)
@@ -390,25 +494,18 @@ class Graphs(commands.Cog):
         practice = extract_time_and_rating(solved_by_type['PRACTICE'])
         virtual = extract_time_and_rating(solved_by_type['VIRTUAL'])
 
-        plt.clf()
-        _plot_scatter(regular, practice, virtual, point_size)
         labels = []
-        if practice:
-            labels.append('Practice')
-        if regular:
-            labels.append('Regular')
-        if virtual:
-            labels.append('Virtual')
         if legend:
-            plt.legend(labels, loc='upper left')
-        _plot_average(practice, bin_size)
-        _plot_rating(rating_resp, mark='')
-
-        # zoom
-        ymin, ymax = plt.gca().get_ylim()
-        plt.ylim(max(ymin, filt.rlo - 100), min(ymax, filt.rhi + 100))
-
-        discord_file = gc.get_current_figure_as_file()
+            if practice:
+                labels.append('Practice')
+            if regular:
+                labels.append('Regular')
+            if virtual:
+                labels.append('Virtual')
+
+        discord_file = await gc.render_as_file(_draw_scatter, regular, practice, virtual,
+                                               point_size, labels, bin_size, rating_resp,
+                                               (filt.rlo, filt.rhi))
         embed = discord_common.cf_color_embed(title=f'Rating vs solved problem rating for {handle}')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
@@ -431,9 +528,7 @@ class Graphs(commands.Cog):
                 colors.append('#' + '%06x' % rank.color_embed)
         assert len(colors) == bins, f'Expected {bins} colors, got {len(colors)}'
 
-        height = [0] * bins
-        for r in ratings:
-            height[r // binsize] += 1
+        height = RatingIndex(ratings).histogram(binsize, low, high).tolist()
 
         csum = 0
         cent = [0]
@@ -454,17 +549,9 @@ class Graphs(commands.Cog):
         colors = colors[l:r+1]
         height = height[l:r+1]
 
-        plt.clf()
-        fig = plt.figure(figsize=(15, 5))
-
-        plt.xticks(rotation=45)
-        plt.xlim(l * binsize - binsize//2, r * binsize + binsize//2)
-        plt.bar(x, height, binsize*0.9, color=colors, linewidth=0, tick_label=label, log=(mode == 'log'))
-        plt.xlabel('Rating')
-        plt.ylabel('Number of users')
-
-        discord_file = gc.get_current_figure_as_file()
-        plt.close(fig)
+        xlim = (l * binsize - binsize//2, r * binsize + binsize//2)
+        discord_file = await gc.render_as_file(_draw_rating_hist, x, height, binsize*0.9, colors,
+                                               label, xlim, mode == 'log', figsize=(15, 5))
 
         embed = discord_common.cf_color_embed(title=title)
         discord_common.attach_image(embed, discord_file)
@@ -478,13 +565,8 @@ class Graphs(commands.Cog):
         """Show percentile distribution of codeforces and mark given handles in the plot. If +zoom and handles are given, it zooms to the neighborhood of the handles."""
         (zoom, nomarker, exact), args = cf_common.filter_flags(args, ['+zoom', '+nomarker', '+exact'])
         # Prepare data
-        intervals = [(rank.low, rank.high) for rank in cf.RATED_RANKS]
-        colors = [rank.color_graph for rank in cf.RATED_RANKS]
-
-        ratings = cf_common.cache2.rating_changes_cache.get_all_ratings()
-        ratings = np.array(sorted(ratings))
-        n = len(ratings)
-        perc = 100*np.arange(n)/n
+        rating_index = cf_common.cache2.rating_changes_cache.rating_index
+        ratings, perc = rating_index.percentile_curve()
 
         users_to_mark = {}
         if not nomarker:
@@ -499,32 +581,9 @@ class Graphs(commands.Cog):
             for info in infos:
                 if info.rating is None:
                     raise GraphCogError(f'User `{info.handle}` is not rated')
-                ix = bisect.bisect_left(ratings, info.rating)
-                cent = 100*ix/len(ratings)
+                cent = rating_index.percentile(info.rating)
                 users_to_mark[info.handle] = info.rating,cent
 
-        # Plot
-        plt.clf()
-        fig,ax = plt.subplots(1)
-        ax.plot(ratings, perc, color='#00000099')
-
-        plt.xlabel('Rating')
-        plt.ylabel('Percentile')
-
-        for pos in ['right','top','bottom','left']:
-            ax.spines[pos].set_visible(False)
-        ax.tick_params(axis='both', which='both',length=0)
-
-        # Color intervals by rank
-        for interval,color in zip(intervals,colors):
-            alpha = '99'
-            l,r = interval
-            col = color + alpha
-            rect = patches.Rectangle((l,-50), r-l, 200,
-                                     edgecolor='none',
-                                     facecolor=col)
-            ax.add_patch(rect)
-
         if users_to_mark:
             ymin = min(point[1] for point in users_to_mark.values())
             ymax = max(point[1] for point in users_to_mark.values())
@@ -547,41 +606,10 @@ class Graphs(commands.Cog):
         else:
             xmin, xmax = ratings[0], ratings[-1]
 
-        plt.xlim(xmin, xmax)
-        plt.ylim(ymin, ymax)
-
-        # Mark users in plot
-        for user, point in users_to_mark.items():
-            astr = f'{user} ({round(point[1], 2)})' if exact else user
-            apos = ('left', 'top') if point[0] <= (xmax + xmin) // 2 else ('right', 'bottom')
-            plt.annotate(astr,
-                         xy=point,
-                         xytext=(0, 0),
-                         textcoords='offset points',
-                         ha=apos[0],
-                         va=apos[1])
-            plt.plot(*point,
-                     marker='o',
-                     markersize=5,
-                     color='red',
-                     markeredgecolor='darkred')
-
-        # Draw tick lines
-        linecolor = '#00000022'
-        inf = 10000
-        def horz_line(y):
-            l = mlines.Line2D([-inf,inf], [y,y], color=linecolor)
-            ax.add_line(l)
-        def vert_line(x):
-            l = mlines.Line2D([x,x], [-inf,inf], color=linecolor)
-            ax.add_line(l)
-        for y in ax.get_yticks():
-            horz_line(y)
-        for x in ax.get_xticks():
-            vert_line(x)
+        discord_file = await gc.render_as_file(_draw_centile, ratings, perc, users_to_mark,
+                                               (xmin, xmax), (ymin, ymax), exact)
 
         # Discord stuff
-        discord_file = gc.get_current_figure_as_file()
         embed = discord_common.cf_color_embed(title=f'Rating/percentile relationship')
         discord_common.attach_image(embed, discord_file)
         discord_common.set_author_footer(embed, ctx.author)
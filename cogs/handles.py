@@ -138,14 +138,14 @@ class Handles(commands.Cog):
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
-        cf_common.user_db.set_inactive([(member.guild.id, member.id)])
+        await cf_common.user_db.set_inactive([(member.guild.id, member.id)])
 
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        rc = cf_common.user_db.update_status(member.guild.id, [member.id])
+        rc = await cf_common.user_db.update_status(member.guild.id, [member.id])
         if rc == 1:
-            handle = cf_common.user_db.get_handle(member.id, member.guild.id)
+            handle = await cf_common.user_db.get_handle(member.id, member.guild.id)
             await self._update_ranks(member.guild, [(int(member.id), handle)])
 
     @tasks.task_spec(name='SetExUsersInactive',
@@ -154,10 +154,10 @@ class Handles(commands.Cog):
         # To set users inactive in case the bot was dead when they left.
         to_set_inactive = []
         for guild in self.bot.guilds:
-            user_id_handle_pairs = cf_common.user_db.get_handles_for_guild(guild.id)
+            user_id_handle_pairs = await cf_common.user_db.get_handles_for_guild(guild.id)
             to_set_inactive += [(guild.id, user_id) for user_id, _ in user_id_handle_pairs
                                 if guild.get_member(user_id) is None]
-        cf_common.user_db.set_inactive(to_set_inactive)
+        await cf_common.user_db.set_inactive(to_set_inactive)
 
     @events.listener_spec(name='RatingChangesListener',
                           event_cls=events.RatingChangesUpdate,
@@ -167,10 +167,10 @@ class Handles(commands.Cog):
         change_by_handle = {change.handle: change for change in changes}
 
         async def update_for_guild(guild):
-            if cf_common.user_db.has_auto_role_update_enabled(guild.id):
+            if await cf_common.user_db.has_auto_role_update_enabled(guild.id):
                 with contextlib.suppress(HandleCogError):
                     await self._update_ranks_all(guild)
-            channel_id = cf_common.user_db.get_rankup_channel(guild.id)
+            channel_id = await cf_common.user_db.get_rankup_channel(guild.id)
             channel = guild.get_channel(channel_id)
             if channel is not None:
                 with contextlib.suppress(HandleCogError):
@@ -216,7 +216,7 @@ class Handles(commands.Cog):
 
     async def _set(self, ctx, member, user):
         handle = user.handle
-        cf_common.user_db.cache_cf_user(user)
+        await cf_common.user_db.cache_cf_user(user)
 
         if user.rank == cf.UNRATED_RANK:
             role_to_assign = None
@@ -1,3 +1,4 @@
+import contextlib
 import os
 import subprocess
 import sys
@@ -5,9 +6,15 @@ import time
 import textwrap
 import discord
 from discord.ext import commands
+from util import codeforces_api as cf
+from util import codeforces_common as cf_common
+from util import db
+from util import loop_monitor
+from util import table
 from util.codeforces_common import pretty_time_format
 import TLEconstants 
 RESTART = 42
+_PERF_DB_QUERIES_SHOWN = 10
 
 
 class Meta(commands.Cog):
@@ -48,6 +55,47 @@ class Meta(commands.Cog):
         await ctx.send('TLE has been running for ' +
                        pretty_time_format(time.time() - self.start_time))
 
+    @meta.command(brief='Show performance statistics')
+    async def perf(self, ctx):
+        """Shows queue depth and wait times of Codeforces API queries, time spent decoding API
+        responses, the slowest database queries and how long the event loop has been blocked."""
+        style = table.Style('{:<}  {:>}  {:>}  {:>}  {:>}  {:>}')
+        t = table.Table(style)
+        t += table.Header('API lane', 'Queued', 'Served', 'Mean', 'P95', 'Max')
+        t += table.Line()
+        for stats in cf.get_ratelimit_stats():
+            t += table.Data(stats.lane, stats.queued, stats.served, f'{stats.mean_wait:.2f}s',
+                            f'{stats.p95_wait:.2f}s', f'{stats.max_wait:.2f}s')
+
+        decode_style = table.Style('{:<}  {:>}  {:>}  {:>}')
+        decode_t = table.Table(decode_style)
+        decode_t += table.Header('Decoded in', 'Count', 'Total', 'Max')
+        decode_t += table.Line()
+        for stats in cf.get_decode_stats():
+            decode_t += table.Data(stats.where, stats.count, f'{stats.total_time:.2f}s',
+                                   f'{stats.max_time:.3f}s')
+
+        db_stats = cf_common.cache2.conn.pool.get_latency_stats()
+        with contextlib.suppress(db.DatabaseDisabledError):
+            db_stats += cf_common.user_db.pool.get_latency_stats()
+        db_stats.sort(key=lambda stats: stats.total_latency, reverse=True)
+        db_style = table.Style('{:<}  {:>}  {:>}  {:>}  {:>}')
+        db_t = table.Table(db_style)
+        db_t += table.Header('DB query', 'Count', 'P50', 'P95', 'Max')
+        db_t += table.Line()
+        for stats in db_stats[:_PERF_DB_QUERIES_SHOWN]:
+            db_t += table.Data(f'{stats.database}.{stats.query}', stats.count,
+                               f'{stats.p50_latency * 1000:.0f}ms',
+                               f'{stats.p95_latency * 1000:.0f}ms',
+                               f'{stats.max_latency * 1000:.0f}ms')
+
+        lag = loop_monitor.monitor.get_stats()
+        last_block = ('never' if lag.last_block_time is None else
+                      pretty_time_format(time.time() - lag.last_block_time, shorten=True) + ' ago')
+        lag_str = (f'Event loop lag: p99 {lag.p99_lag * 1000:.0f}ms, max {lag.max_lag * 1000:.0f}ms, '
+                   f'{lag.blocks} blocks, last block {last_block}')
+        await ctx.send(f'```\n{t}\n\n{decode_t}\n\n{db_t}\n\n{lag_str}\n```')
+
     @meta.command(brief="Introduce the Bot")
     async def intro(self,ctx):
         desc = "Hi ! I am [TLE-Lite](https://github.com/s-i-d-d-i-s/TLE-Lite), I am a lightweight-ripoff of [TLE](https://github.com/cheran-senthil/TLE)"
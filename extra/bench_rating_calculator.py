@@ -0,0 +1,91 @@
+"""
+Times the rating change prediction on synthetic standings of contest sizes seen on Codeforces,
+and checks the results against a straightforward per-contestant implementation of the same
+formula.
+
+Run from the repository root:
+python -m extra.bench_rating_calculator
+"""
+
+import random
+import time
+
+import numpy as np
+from numpy.fft import fft, ifft
+
+from util.ranklist.rating_calculator import CodeforcesRatingCalculator, intdiv
+
+
+def reference_rating_changes(standings):
+    """Per-contestant version of the calculation, as the calculator used to do it."""
+    elo_win_prob = CodeforcesRatingCalculator(standings[:1]).elo_win_prob
+    count = np.zeros(len(elo_win_prob))
+    for _, _, _, rating in standings:
+        count[rating] += 1
+    seed = 1 + ifft(fft(count) * fft(elo_win_prob)).real
+
+    def get_seed(rating, own_rating):
+        return seed[rating] - elo_win_prob[rating - own_rating]
+
+    contestants = sorted(standings, key=lambda o: (-o[1], o[2]))
+    n = len(contestants)
+    ranks = [0] * n
+    points = penalty = rank = None
+    for i in reversed(range(n)):
+        if contestants[i][1] != points or contestants[i][2] != penalty:
+            rank = i + 1
+            points, penalty = contestants[i][1], contestants[i][2]
+        ranks[i] = rank
+
+    deltas = []
+    for (_, _, _, rating), rank in zip(contestants, ranks):
+        mid_rank = (rank * get_seed(rating, rating)) ** 0.5
+        left, right = 1, 8000
+        while right - left > 1:
+            mid = (left + right) // 2
+            if get_seed(mid, rating) < mid_rank:
+                right = mid
+            else:
+                left = mid
+        deltas.append(intdiv(left - rating, 2))
+
+    correction = intdiv(-sum(deltas), n) - 1
+    deltas = [delta + correction for delta in deltas]
+    by_rating = sorted(range(n), key=lambda i: -contestants[i][3])
+    zero_sum_count = min(4 * round(n ** 0.5), n)
+    delta_sum = -sum(deltas[i] for i in by_rating[:zero_sum_count])
+    correction = min(0, max(-10, intdiv(delta_sum, zero_sum_count)))
+    return {contestant[0]: delta + correction for contestant, delta in zip(contestants, deltas)}
+
+
+def synthetic_standings(n, rng):
+    standings = []
+    for i in range(n):
+        rating = max(1, min(4000, int(rng.gauss(1400, 400))))
+        # Few distinct scores so there are plenty of ties, as in real contests.
+        points = float(rng.randrange(0, 7) * 500)
+        penalty = rng.randrange(0, 300) if points else 0
+        standings.append((f'user{i}', points, penalty, rating))
+    return standings
+
+
+def main():
+    rng = random.Random(0)
+    for n in (10000, 30000, 60000):
+        standings = synthetic_standings(n, rng)
+
+        begin = time.perf_counter()
+        expected = reference_rating_changes(standings)
+        reference_time = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        deltas = CodeforcesRatingCalculator(standings).calculate_rating_changes()
+        vectorized_time = time.perf_counter() - begin
+
+        assert deltas == expected, f'deltas differ for {n} contestants'
+        print(f'{n:6} contestants: per-contestant {reference_time:7.3f}s, '
+              f'vectorized {vectorized_time:7.3f}s ({reference_time / vectorized_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
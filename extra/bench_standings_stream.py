@@ -0,0 +1,109 @@
+"""
+Times reading a synthetic contest.standings response of 50k rows, and how long the event loop is
+kept from running meanwhile, as seen by a task that wakes up every 5ms. The response is read as
+contest.standings does, and for comparison decoded whole on the loop and in the decoding
+executor. The network is assumed to deliver instantly, the worst case for the loop.
+
+Run from the repository root:
+python -m extra.bench_standings_stream [rows] [--no-gc]
+"""
+
+import asyncio
+import gc
+import json
+import sys
+import time
+
+from util import codeforces_api as cf
+
+_TICK = 0.005
+
+
+class _Content:
+    def __init__(self, body):
+        self.body = body
+        self.pos = 0
+
+    async def read(self, n):
+        await asyncio.sleep(0)
+        chunk = self.body[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+
+class _Response:
+    def __init__(self, body):
+        self.content = _Content(body)
+
+
+def synthetic_body(n):
+    problem_result = {'points': 500.0, 'rejectedAttemptCount': 1, 'type': 'FINAL',
+                      'bestSubmissionTimeSeconds': 600}
+    rows = [{'party': {'contestId': 1, 'members': [{'handle': f'user{i}'}],
+                       'participantType': 'CONTESTANT', 'ghost': False, 'room': i % 100,
+                       'startTimeSeconds': 1},
+             'rank': i + 1, 'points': 1234.0, 'penalty': 0, 'successfulHackCount': 0,
+             'unsuccessfulHackCount': 0, 'problemResults': [problem_result] * 7}
+            for i in range(n)]
+    result = {'contest': {'id': 1}, 'problems': [], 'rows': rows}
+    return json.dumps({'status': 'OK', 'result': result}).encode()
+
+
+async def measure(read):
+    """Returns the result of `read`, the time it took and the sorted lateness of the ticks."""
+    stop = False
+    lateness = []
+
+    async def ticker():
+        while not stop:
+            begin = time.perf_counter()
+            await asyncio.sleep(_TICK)
+            lateness.append(time.perf_counter() - begin - _TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(4 * _TICK)
+    begin = time.perf_counter()
+    result = await read()
+    elapsed = time.perf_counter() - begin
+    stop = True
+    await task
+    return result, elapsed, sorted(lateness)
+
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--no-gc']
+    if '--no-gc' in sys.argv:
+        gc.disable()
+    body = synthetic_body(int(args[0]) if args else 50000)
+    make_row = cf._ranklist_row_maker(None)
+    print(f'Response of {len(body) / 10**6:.1f} MB')
+
+    def parse(result):
+        return [make_row(row) for row in result['rows']]
+
+    async def loads_on_loop():
+        return parse(json.loads(body)['result'])
+
+    async def loads_in_executor():
+        return await cf._decode(body, parse)
+
+    async def streamed():
+        return (await cf._read_streaming(_Response(body), ('rows', make_row)))['rows']
+
+    expected = None
+    for name, read in (('json.loads on the loop', loads_on_loop),
+                       ('json.loads in the executor', loads_in_executor),
+                       ('streamed', streamed)):
+        result, elapsed, lateness = await measure(read)
+        assert expected is None or result == expected, f'{name} read different rows'
+        expected = result
+
+        def percentile(q):
+            return 1000 * lateness[int(q * (len(lateness) - 1))]
+
+        print(f'{name:28}: {elapsed:.2f}s, loop late by p50 {percentile(0.5):.0f}ms, '
+              f'p99 {percentile(0.99):.0f}ms, max {percentile(1):.0f}ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Times SubFilter on a synthetic history of 50k submissions, and checks the results against a
+straightforward per-submission implementation of the same filters. SubFilter is timed both on
+the list of submissions and on a frame built beforehand, as kept by UserHistoryCache.
+
+Run from the repository root:
+python -m extra.bench_sub_filter
+"""
+
+import random
+import time
+
+from util import cache_system2
+from util import codeforces_api as cf
+from util import codeforces_common as cf_common
+from util.submission_frame import SubmissionFrame
+
+_TAGS = ['dp', 'greedy', 'math', 'graphs', 'dfs and similar', 'number theory', 'trees',
+         'constructive algorithms', 'implementation', '*special']
+
+
+def reference_filter_subs(filt, submissions):
+    """Per-submission version of SubFilter.filter_subs, as it used to be done."""
+    contest_by_id = cf_common.cache2.contest_cache.contest_by_id
+    submissions = sorted(submissions, key=lambda sub: sub.creationTimeSeconds)
+    problems = set()
+    solved_subs = []
+    for submission in submissions:
+        problem = submission.problem
+        contest = contest_by_id.get(problem.contestId, None)
+        if submission.verdict == 'OK':
+            problem_key = (problem.name, contest.startTimeSeconds if contest else 0)
+            if problem_key not in problems:
+                solved_subs.append(submission)
+                problems.add(problem_key)
+
+    def is_nonstandard_problem(problem):
+        contest = contest_by_id[problem.contestId]
+        return (any(string in contest.name.lower()
+                    for string in cf_common._NONSTANDARD_CONTEST_INDICATORS) or
+                problem.tag_matches(['*special']))
+
+    filtered_subs = []
+    for submission in solved_subs:
+        problem = submission.problem
+        contest = contest_by_id.get(problem.contestId, None)
+        type_ok = submission.author.participantType in filt.types
+        date_ok = filt.dlo <= submission.creationTimeSeconds < filt.dhi
+        tag_ok = not filt.tags or problem.tag_matches(filt.tags)
+        index_ok = not filt.indices or any(index.lower() == problem.index.lower()
+                                           for index in filt.indices)
+        contest_ok = not filt.contests or (contest and contest.matches(filt.contests))
+        team_ok = filt.team or len(submission.author.members) == 1
+        if filt.rated:
+            problem_ok = (contest and contest.id < cf.GYM_ID_THRESHOLD and
+                          not is_nonstandard_problem(problem))
+            rating_ok = problem.rating and filt.rlo <= problem.rating <= filt.rhi
+        else:
+            problem_ok = (not contest or contest.id >= cf.GYM_ID_THRESHOLD
+                          or not is_nonstandard_problem(problem))
+            rating_ok = True
+        if (type_ok and date_ok and rating_ok and tag_ok and team_ok and problem_ok and
+                contest_ok and index_ok):
+            filtered_subs.append(submission)
+    return filtered_subs
+
+
+def synthetic_contests(rng):
+    names = ['Codeforces Round (Div. 2)', 'Educational Round', 'Kotlin Heroes', 'April Fools Day',
+             'Codeforces Global Round', 'Testing Round']
+    contests = [cf.Contest(contest_id, rng.choice(names), contest_id * 10**5, 7200, 'CF',
+                           'FINISHED', None)
+                for contest_id in range(1, 2000)]
+    contests += [cf.Contest(contest_id, 'Gym contest', contest_id * 10**5, 18000, 'ICPC',
+                            'FINISHED', None)
+                 for contest_id in range(cf.GYM_ID_THRESHOLD, cf.GYM_ID_THRESHOLD + 200)]
+    return contests
+
+
+def synthetic_submissions(n, contests, rng):
+    problems = []
+    for contest in contests:
+        for index in 'ABCDE':
+            rating = rng.choice([None, *range(800, 3600, 100)])
+            tags = rng.sample(_TAGS, rng.randrange(4))
+            problems.append(cf.Problem(contest.id, None, index, f'{contest.id}{index}',
+                                       'PROGRAMMING', None, rating, tags))
+    problems.append(cf.Problem(None, 'acmsguru', '100', 'A+B', 'PROGRAMMING', None, None, []))
+    submissions = []
+    for submission_id in range(n):
+        problem = rng.choice(problems)
+        members = [cf.Member('user')] * rng.choice([1, 1, 1, 3])
+        participant_type = rng.choice(cf.Party.PARTICIPANT_TYPES)
+        author = cf.Party(problem.contestId, members, participant_type, None, None, None, None,
+                          None)
+        verdict = rng.choice(['OK', 'OK', 'WRONG_ANSWER', 'TIME_LIMIT_EXCEEDED'])
+        submissions.append(cf.Submission(submission_id, problem.contestId, problem, author,
+                                         'GNU C++17', verdict, rng.randrange(10**9), 0))
+    return submissions
+
+
+def main():
+    rng = random.Random(0)
+    contests = synthetic_contests(rng)
+    cf_common.cache2 = cache_system2.CacheSystem(None)
+    contest_cache = cf_common.cache2.contest_cache
+    contest_cache.contest_by_id = {contest.id: contest for contest in contests}
+    contest_cache.nonstandard_contest_ids = frozenset(
+        contest.id for contest in contests if cf_common.is_nonstandard_contest_name(contest.name))
+    submissions = synthetic_submissions(50000, contests, rng)
+
+    begin = time.perf_counter()
+    frame = SubmissionFrame(submissions)
+    print(f'Building the frame: {time.perf_counter() - begin:.3f}s')
+
+    for args in ([], ['+dp'], ['+d', '+gr', 'r>=1500'], ['+team', '+virtual', 'c+round'],
+                 ['i+a', 'i+B', 'd>=01012000'], ['+practice']):
+        for rated in (True, False):
+            filt = cf_common.SubFilter(rated=rated)
+            filt.parse(args)
+
+            begin = time.perf_counter()
+            expected = reference_filter_subs(filt, submissions)
+            reference_time = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            filtered = filt.filter_subs(submissions)
+            list_time = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            filtered_frame = filt.filter_subs(frame)
+            frame_time = time.perf_counter() - begin
+
+            assert filtered == expected, f'filtered submissions differ for {args}'
+            assert filtered_frame == expected, f'filtered submissions differ for {args}'
+            print(f'{" ".join(args):30} rated={rated!s:5}: per-submission {reference_time:.3f}s, '
+                  f'from list {list_time:.3f}s ({reference_time / list_time:.1f}x), '
+                  f'from frame {frame_time:.3f}s ({reference_time / frame_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,11 @@ from logging.handlers import TimedRotatingFileHandler
 from os import environ
 from pathlib import Path
 
-import seaborn as sns
 from discord.ext import commands
-from matplotlib import pyplot as plt
 
 import TLEconstants
 from util import codeforces_common as cf_common
-from util import discord_common, font_downloader
+from util import discord_common, font_downloader, graph_common
 import os
 
 def setup():
@@ -30,14 +28,7 @@ def setup():
                                                            backupCount=3, utc=True)])
 
     # matplotlib and seaborn
-    plt.rcParams['figure.figsize'] = 7.0, 3.5
-    sns.set()
-    options = {
-        'axes.edgecolor': '#A0A0C5',
-        'axes.spines.top': False,
-        'axes.spines.right': False,
-    }
-    sns.set_style('darkgrid', options)
+    graph_common.set_style()
 
     # Download fonts if necessary
     font_downloader.maybe_download()
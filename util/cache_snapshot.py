@@ -0,0 +1,55 @@
+"""
+Snapshots of the in-memory state of the caches, written to a single file so that startup need not
+rebuild that state from the database.
+"""
+
+import logging
+import os
+import pickle
+import struct
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'TLECACHE'
+# Bump when the layout of the snapshot or of anything pickled in it changes.
+_VERSION = 1
+_HEADER = struct.Struct(f'<{len(_MAGIC)}sI')
+
+
+def save(path, state):
+    """Writes the state atomically, replacing any previous snapshot."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION))
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Returns the saved state, or None if there is no usable snapshot."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        magic, version = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            logger.warning(f'Ignoring cache snapshot `{path}`, it is not a snapshot')
+            return None
+        if version != _VERSION:
+            logger.info(f'Ignoring cache snapshot of version {version}, expected {_VERSION}')
+            return None
+        return pickle.loads(memoryview(data)[_HEADER.size:])
+    except Exception as e:
+        logger.warning(f'Ignoring unreadable cache snapshot. {e!r}')
+        return None
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
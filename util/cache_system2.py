@@ -1,25 +1,79 @@
 import asyncio
+import contextlib
 import logging
 import time
 from aiocache import cached
 
-from collections import defaultdict
+from collections import Counter, defaultdict, OrderedDict
+import numpy as np
 from discord.ext import commands
 
+from util import cache_snapshot
 from util import codeforces_common as cf_common
 from util import codeforces_api as cf
 from util import events
 from util import tasks
-from util import paginator
 from util.ranklist import Ranklist
+from util.rating_index import RatingIndex
+from util.submission_frame import SubmissionFrame
+from util.tag_index import TagIndex
 
 logger = logging.getLogger(__name__)
-_CONTESTS_PER_BATCH_IN_CACHE_UPDATES = 100
 CONTEST_BLACKLIST = {1308, 1309, 1431, 1432}
 
 def _is_blacklisted(contest):
     return contest.id in CONTEST_BLACKLIST
 
+
+def _is_ranklist_party(party):
+    # Exclude PRACTICE and MANAGER
+    return party.participantType in ('CONTESTANT', 'OUT_OF_COMPETITION', 'VIRTUAL')
+
+
+async def _fetch_concurrently(fetch, contest_ids, *, limit):
+    """Calls `fetch` for the contests, at most `limit` at once, yielding pairs of contest id and
+    result as they arrive.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def fetch_one(contest_id):
+        async with semaphore:
+            return contest_id, await fetch(contest_id)
+
+    pending = [asyncio.create_task(fetch_one(contest_id)) for contest_id in contest_ids]
+    try:
+        for next_done in asyncio.as_completed(pending):
+            yield await next_done
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class JobProgress:
+    """Progress of a job that fetches data for many contests, by status of the contests."""
+
+    def __init__(self, job, statuses):
+        self.job = job
+        self.total = len(statuses)
+        self.count_by_status = Counter(statuses.values())
+        self.begin = time.time()
+        self._pending_at_begin = self.count_by_status['pending']
+
+    @property
+    def completed(self):
+        return self.total - self.count_by_status['pending']
+
+    def advance(self, status):
+        self.count_by_status['pending'] -= 1
+        self.count_by_status[status] += 1
+
+    def eta(self):
+        """Returns the estimated seconds left, or None if no contest was completed yet."""
+        completed = self._pending_at_begin - self.count_by_status['pending']
+        if completed == 0:
+            return None
+        return (time.time() - self.begin) / completed * self.count_by_status['pending']
+
 class CacheError(commands.CommandError):
     pass
 
@@ -39,6 +93,13 @@ class ContestCache:
     _EXCEPTION_CONTEST_RELOAD_DELAY = 5 * 60
     _ACTIVE_CONTEST_RELOAD_DELAY = 5 * 60
     _ACTIVATE_BEFORE = 20 * 60
+    _DENSE_RELOAD_DELAY = 60
+    # Reloads are dense from this long before the expected phase change of a contest until this
+    # long after it.
+    _DENSE_WINDOW = 10 * 60
+    _EXPECTED_SYSTEM_TEST_DURATION = 60 * 60
+    # Rating changes are expected within this long after system testing is expected to end.
+    _RATING_UPDATE_WINDOW = 3 * 60 * 60
 
     _RUNNING_PHASES = ('CODING', 'PENDING_SYSTEM_TEST', 'SYSTEM_TEST')
 
@@ -49,6 +110,7 @@ class ContestCache:
         self.contest_by_id = {}
         self.contests_by_phase = {phase: [] for phase in cf.Contest.PHASES}
         self.contests_by_phase['_RUNNING'] = []
+        self.nonstandard_contest_ids = frozenset()
         self.contests_last_cache = 0
 
         self.reload_lock = asyncio.Lock()
@@ -84,12 +146,23 @@ class ContestCache:
     def get_problemset(self, contest_id):
         return self.cache_master.conn.get_problemset_from_contest(contest_id)
 
+    def is_nonstandard(self, contest):
+        """Looks up the classification of cached contests, classifying others by name."""
+        cached = self.contest_by_id.get(contest.id)
+        if cached is not None and cached.name == contest.name:
+            return contest.id in self.nonstandard_contest_ids
+        return cf_common.is_nonstandard_contest_name(contest.name)
+
     def get_contests_in_phase(self, phase):
         return self.contests_by_phase[phase]
 
     async def _try_disk(self):
         async with self.reload_lock:
-            contests = self.cache_master.conn.fetch_contests()
+            snapshot = self.cache_master.snapshot
+            if snapshot is not None:
+                contests = list(snapshot['contests'])
+            else:
+                contests = await self.cache_master.conn.fetch_contests()
             if not contests:
                 self.logger.info('Contest cache on disk is empty.')
                 return
@@ -111,18 +184,102 @@ class ContestCache:
         self.next_delay = self._EXCEPTION_CONTEST_RELOAD_DELAY
 
     async def _reload_contests(self):
-        contests = await cf.contest.list()
+        # Near the expected phase change of a running contest, it is enough to check just that
+        # contest, as long as the full list was reloaded recently. Standings cannot be fetched
+        # before a contest starts, so contests about to start are checked with the full list.
+        due_contests = [contest for contest in self.contests_by_phase['_RUNNING']
+                        if self._is_phase_change_due(contest)]
+        starting = any(self._is_phase_change_due(contest)
+                       for contest in self.contests_by_phase['BEFORE'])
+        recently_reloaded = (time.time() - self.contests_last_cache <
+                             self._ACTIVE_CONTEST_RELOAD_DELAY)
+        if (due_contests and not starting and recently_reloaded and
+                await self._unchanged(due_contests)):
+            return self._reload_delay()
+        with cf.background_priority():
+            contests = await cf.contest.list()
         delay = await self._update(contests)
         return delay
 
+    async def _unchanged(self, contests):
+        """Returns whether the phase and times of the contests are as cached, fetching each
+        with a single row of its standings.
+        """
+        for contest in contests:
+            try:
+                with cf.background_priority():
+                    fetched, _, _ = await cf.contest.standings(contest_id=contest.id, from_=1,
+                                                               count=1)
+            except cf.CodeforcesApiError as er:
+                self.logger.warning(f'Checking contest {contest.id} failed. {er!r}')
+                return False
+            if ((fetched.phase, fetched.startTimeSeconds, fetched.durationSeconds) !=
+                    (contest.phase, contest.startTimeSeconds, contest.durationSeconds)):
+                return False
+        return True
+
+    def _expected_phase_change(self, contest):
+        """Returns when the contest is expected to move to its next phase, or None if it is
+        finished.
+        """
+        if contest.phase == 'BEFORE':
+            return contest.startTimeSeconds
+        if contest.phase == 'CODING':
+            return contest.end_time
+        if contest.phase in ('PENDING_SYSTEM_TEST', 'SYSTEM_TEST'):
+            return contest.end_time + self._EXPECTED_SYSTEM_TEST_DURATION
+        return None
+
+    def _is_phase_change_due(self, contest):
+        at = self._expected_phase_change(contest)
+        return at is not None and abs(time.time() - at) <= self._DENSE_WINDOW
+
+    def is_rating_update_due(self, contest):
+        """Returns whether the finished contest is within the window after system testing in
+        which its rating changes are expected.
+        """
+        tested = contest.end_time + self._EXPECTED_SYSTEM_TEST_DURATION
+        return contest.phase == 'FINISHED' and time.time() <= tested + self._RATING_UPDATE_WINDOW
+
     async def _update(self, contests, from_api=True):
         self.logger.info(f'{len(contests)} contests fetched from {"API" if from_api else "disk"}')
         contests.sort(key=lambda contest: (contest.startTimeSeconds, contest.id))
 
         if from_api:
-            rc = self.cache_master.conn.cache_contests(contests)
-            self.logger.info(f'{rc} contests stored in database')
+            added, removed, changed = self._diff(contests)
+            self.logger.info(f'{len(added)} contests added, {len(changed)} changed and '
+                             f'{len(removed)} removed')
+            if added or changed:
+                with self.cache_master.snapshot_update():
+                    rc = await self.cache_master.conn.cache_contests(
+                        added + [contest for _, contest in changed])
+                self.logger.info(f'{rc} contests stored in database')
+        else:
+            added, removed, changed = contests, [], []
 
+        if added or removed or changed:
+            self._set_contests(contests)
+            cf_common.event_sys.dispatch(events.ContestListRefresh, self.contests.copy(),
+                                         added=added, removed=removed, changed=changed)
+        self.contests_last_cache = time.time()
+        return self._reload_delay()
+
+    def _diff(self, contests):
+        """Returns the contests not cached, the cached contests missing from `contests`, and
+        pairs of cached and new data of the contests whose data changed.
+        """
+        added, changed = [], []
+        for contest in contests:
+            cached = self.contest_by_id.get(contest.id)
+            if cached is None:
+                added.append(contest)
+            elif cached != contest:
+                changed.append((cached, contest))
+        contest_ids = {contest.id for contest in contests}
+        removed = [contest for contest in self.contests if contest.id not in contest_ids]
+        return added, removed, changed
+
+    def _set_contests(self, contests):
         contests_by_phase = {phase: [] for phase in cf.Contest.PHASES}
         contests_by_phase['_RUNNING'] = []
         contest_by_id = {}
@@ -131,30 +288,39 @@ class ContestCache:
             contest_by_id[contest.id] = contest
             if contest.phase in self._RUNNING_PHASES:
                 contests_by_phase['_RUNNING'].append(contest)
+        nonstandard_contest_ids = frozenset(
+            contest.id for contest in contests
+            if cf_common.is_nonstandard_contest_name(contest.name))
 
+        self.contests = contests
+        self.contests_by_phase = contests_by_phase
+        self.contest_by_id = contest_by_id
+        self.nonstandard_contest_ids = nonstandard_contest_ids
+
+    def _reload_delay(self):
         now = time.time()
         delay = self._NORMAL_CONTEST_RELOAD_DELAY
 
-        for contest in contests_by_phase['BEFORE']:
+        for contest in self.contests_by_phase['BEFORE']:
             at = contest.startTimeSeconds - self._ACTIVATE_BEFORE
             if at > now:
                 # Reload at _ACTIVATE_BEFORE before contest to monitor contest delays.
                 delay = min(delay, at - now)
             else:
                 # The contest starts in <= _ACTIVATE_BEFORE.
-                # Reload at contest start, or after _ACTIVE_CONTEST_RELOAD_DELAY, whichever comes first.
-                delay = min(contest.startTimeSeconds - now, self._ACTIVE_CONTEST_RELOAD_DELAY)
+                delay = min(delay, self._ACTIVE_CONTEST_RELOAD_DELAY)
 
-        if contests_by_phase['_RUNNING']:
+        if self.contests_by_phase['_RUNNING']:
             # If any contest is running, reload at an increased rate to detect FINISHED
             delay = min(delay, self._ACTIVE_CONTEST_RELOAD_DELAY)
 
-        self.contests = contests
-        self.contests_by_phase = contests_by_phase
-        self.contest_by_id = contest_by_id
-        self.contests_last_cache = time.time()
-
-        cf_common.event_sys.dispatch(events.ContestListRefresh, self.contests.copy())
+        # Reload densely around the moments contests are expected to change phase.
+        for contest in self.contests_by_phase['BEFORE'] + self.contests_by_phase['_RUNNING']:
+            at = self._expected_phase_change(contest)
+            if now < at - self._DENSE_WINDOW:
+                delay = min(delay, at - self._DENSE_WINDOW - now)
+            elif now <= at + self._DENSE_WINDOW:
+                delay = min(delay, self._DENSE_RELOAD_DELAY)
 
         return delay
 
@@ -167,6 +333,14 @@ class ProblemCache:
 
         self.problems = []
         self.problem_by_name = {}
+        self.tag_index = TagIndex()
+        # Whether each problem is tagged `*special`, by contest id and index.
+        self.special_by_id = {}
+        # Positions of the standard problems by rating, each sorted by the start time of their
+        # contests.
+        self.standard_positions_by_rating = {}
+        # Rank of each standard problem by the start time of its contest.
+        self.start_rank = np.array([], dtype=np.int64)
         self.problems_last_cache = 0
 
         self.reload_lock = asyncio.Lock()
@@ -194,14 +368,71 @@ class ProblemCache:
 
     async def _try_disk(self):
         async with self.reload_lock:
-            problems = self.cache_master.conn.fetch_problems()
+            snapshot = self.cache_master.snapshot
+            if snapshot is not None:
+                problems = snapshot['problems']
+            else:
+                problems = await self.cache_master.conn.fetch_problems()
             if not problems:
                 self.logger.info('Problem cache on disk is empty.')
                 return
-            self.problems = problems
-            self.problem_by_name = {problem.name: problem for problem in problems}
+            self._set_problems(problems)
             self.logger.info(f'{len(self.problems)} problems fetched from disk')
 
+    def _set_problems(self, problems):
+        """Sets the problems along with the indices over them."""
+        tag_index = TagIndex(problems)
+        special_by_id = {(problem.contestId, problem.index): False for problem in problems}
+        for position in tag_index.positions(['*special']):
+            problem = problems[position]
+            special_by_id[problem.contestId, problem.index] = True
+
+        contest_cache = self.cache_master.contest_cache
+        contest_by_id = contest_cache.contest_by_id
+        standard_positions = [position for position, problem in enumerate(problems)
+                              if problem.contestId in contest_by_id
+                              and not contest_cache.is_nonstandard(contest_by_id[problem.contestId])
+                              and not special_by_id[problem.contestId, problem.index]]
+        standard_positions.sort(
+            key=lambda position: contest_by_id[problems[position].contestId].startTimeSeconds)
+        start_rank = np.full(len(problems), -1, dtype=np.int64)
+        start_rank[standard_positions] = np.arange(len(standard_positions))
+        standard_positions_by_rating = defaultdict(list)
+        for position in standard_positions:
+            standard_positions_by_rating[problems[position].rating].append(position)
+
+        self.problems = problems
+        self.problem_by_name = {problem.name: problem for problem in problems}
+        self.tag_index = tag_index
+        self.special_by_id = special_by_id
+        self.standard_positions_by_rating = {
+            rating: np.array(positions, dtype=np.int64)
+            for rating, positions in standard_positions_by_rating.items()}
+        self.start_rank = start_rank
+
+    def is_special(self, problem):
+        """Looks up whether cached problems are tagged `*special`, checking the tags of others."""
+        special = self.special_by_id.get((problem.contestId, problem.index))
+        if special is None:
+            special = bool(problem.tag_matches(['*special']))
+        return special
+
+    def standard_problems_in_rating_range(self, lo, hi, tags=()):
+        """Returns the problems not from nonstandard contests nor tagged `*special` with rating
+        in [lo, hi], sorted by the start time of their contests. If tags are given, only the
+        problems for which every tag is a substring of some tag of the problem are returned.
+        """
+        buckets = [positions for rating, positions in self.standard_positions_by_rating.items()
+                   if rating is not None and lo <= rating <= hi]
+        if not buckets:
+            return []
+        positions = np.concatenate(buckets)
+        if tags:
+            positions = positions[np.isin(positions, self.tag_index.positions(tags),
+                                          assume_unique=True)]
+        positions = positions[np.argsort(self.start_rank[positions])]
+        return [self.problems[position] for position in positions.tolist()]
+
     @tasks.task_spec(name='ProblemCacheUpdate',
                      waiter=tasks.Waiter.fixed_delay(_RELOAD_INTERVAL))
     async def _update_task(self, _):
@@ -214,7 +445,8 @@ class ProblemCache:
         self.reload_exception = ex
 
     async def _reload_problems(self):
-        problems, _ = await cf.problemset.problems()
+        with cf.background_priority():
+            problems, _ = await cf.problemset.problems()
         await self._update(problems)
 
     async def _update(self, problems):
@@ -233,11 +465,11 @@ class ProblemCache:
         }
         self.logger.info(f'Keeping {len(problem_by_name)} problems')
 
-        self.problems = list(problem_by_name.values())
-        self.problem_by_name = problem_by_name
-        self.problems_last_cache = time.time()
+        with self.cache_master.snapshot_update():
+            self._set_problems(list(problem_by_name.values()))
+            self.problems_last_cache = time.time()
 
-        rc = self.cache_master.conn.cache_problems(self.problems)
+            rc = await self.cache_master.conn.cache_problems(self.problems)
         self.logger.info(f'{rc} problems stored in database')
 
 
@@ -253,6 +485,10 @@ class ProblemsetNotCached(ProblemsetCacheError):
 class ProblemsetCache:
     _MONITOR_PERIOD_SINCE_CONTEST_END = 14 * 24 * 60 * 60
     _RELOAD_DELAY = 60 * 60
+    _FETCH_CONCURRENCY = 4
+    # Number of contests whose problemsets are saved in one transaction by update_for_all.
+    _SAVE_BATCH_SIZE = 50
+    _UPDATE_ALL_JOB = 'problemset_all'
 
     def __init__(self, cache_master):
         self.problems = []
@@ -263,7 +499,11 @@ class ProblemsetCache:
         self.logger = logging.getLogger(self.__class__.__name__)
 
     async def run(self):
-        if self.cache_master.conn.problemset_empty():
+        snapshot = self.cache_master.snapshot
+        if snapshot is not None:
+            self.problems = snapshot['problemset']
+            self.problem_to_contests = defaultdict(list, snapshot['problem_to_contests'])
+        if not self.problems and await self.cache_master.conn.problemset_empty():
             self.logger.warning('Problemset cache on disk is empty. This must be populated '
                                 'manually before use.')
         self._update_task.start()
@@ -271,20 +511,59 @@ class ProblemsetCache:
     async def update_for_contest(self, contest_id):
         """Update problemset for a particular contest. Intended for manual trigger."""
         async with self.update_lock:
-            contest = self.cache_master.contest_cache.get_contest(contest_id)
-            problemset, _ = await self._fetch_problemsets([contest], force_fetch=True)
-            self.cache_master.conn.clear_problemset(contest_id)
-            self._save_problems(problemset)
+            self.cache_master.contest_cache.get_contest(contest_id)
+            problemset = await self._fetch_for_contest(contest_id)
+            if problemset is None:
+                return 0
+            with self.cache_master.snapshot_update():
+                await self.cache_master.conn.replace_problemsets([contest_id], problemset)
             return len(problemset)
 
     async def update_for_all(self):
-        """Update problemsets for all finished contests. Intended for manual trigger."""
+        """Update problemsets for all finished contests. Intended for manual trigger.
+
+        Progress is saved as the problemsets are, so if the previous run was interrupted, this
+        resumes it instead of starting over.
+        """
         async with self.update_lock:
-            contests = self.cache_master.contest_cache.contests_by_phase['FINISHED']
-            problemsets, _ = await self._fetch_problemsets(contests, force_fetch=True)
-            self.cache_master.conn.clear_problemset()
-            self._save_problems(problemsets)
-            return len(problemsets)
+            conn = self.cache_master.conn
+            statuses = await conn.get_contest_job_statuses(self._UPDATE_ALL_JOB)
+            contest_ids = [contest_id for contest_id, status in statuses.items()
+                           if status == 'pending']
+            if contest_ids:
+                self.logger.info(f'Resuming problemset update, {len(contest_ids)} of '
+                                 f'{len(statuses)} contests left')
+            else:
+                contests = self.cache_master.contest_cache.contests_by_phase['FINISHED']
+                contest_ids = [contest.id for contest in contests]
+                await conn.start_contest_job(self._UPDATE_ALL_JOB, contest_ids)
+
+            count = 0
+            batch_contest_ids, batch_problems = [], []
+
+            async def save_batch():
+                nonlocal count
+                count += await conn.replace_problemsets(batch_contest_ids, batch_problems,
+                                                        job=self._UPDATE_ALL_JOB)
+                self.logger.info(f'Saved problemsets of {len(batch_contest_ids)} contests')
+                batch_contest_ids.clear()
+                batch_problems.clear()
+
+            with self.cache_master.snapshot_update():
+                async for contest_id, problemset in _fetch_concurrently(
+                        self._fetch_for_contest, contest_ids, limit=self._FETCH_CONCURRENCY):
+                    if problemset is None:
+                        await conn.set_contest_job_status(self._UPDATE_ALL_JOB, [contest_id],
+                                                          'error')
+                        continue
+                    batch_contest_ids.append(contest_id)
+                    batch_problems += problemset
+                    if len(batch_contest_ids) >= self._SAVE_BATCH_SIZE:
+                        await save_batch()
+                if batch_contest_ids:
+                    await save_batch()
+                await self._update_from_disk()
+            return count
 
     @tasks.task_spec(name='ProblemsetCacheUpdate',
                      waiter=tasks.Waiter.fixed_delay(_RELOAD_DELAY))
@@ -292,62 +571,62 @@ class ProblemsetCache:
         async with self.update_lock:
             contests = self.cache_master.contest_cache.contests_by_phase['FINISHED']
             new_problems, updated_problems = await self._fetch_problemsets(contests)
-            self._save_problems(new_problems + updated_problems)
-            self._update_from_disk()
+            with self.cache_master.snapshot_update():
+                await self._save_problems(new_problems + updated_problems)
+                await self._update_from_disk()
             self.logger.info(f'{len(new_problems)} new problems saved and {len(updated_problems)} '
                              'saved problems updated.')
 
-    async def _fetch_problemsets(self, contests, *, force_fetch=False):
+    async def _fetch_problemsets(self, contests):
         # We assume it is possible for problems in the same contest to get assigned rating at
         # different times.
-        new_contest_ids = []
-        contests_to_refetch = []  # List of (id, set of saved rated problem indices) pairs.
-        if force_fetch:
-            new_contest_ids = [contest.id for contest in contests]
-        else:
-            now = time.time()
-            for contest in contests:
-                if now > contest.end_time + self._MONITOR_PERIOD_SINCE_CONTEST_END:
-                    # Contest too old, we do not want to check it.
-                    continue
-                problemset = self.cache_master.conn.fetch_problemset(contest.id)
-                if not problemset:
-                    new_contest_ids.append(contest.id)
-                    continue
-                rated_problem_idx = {prob.index for prob in problemset if prob.rating is not None}
-                if len(rated_problem_idx) < len(problemset):
-                    contests_to_refetch.append((contest.id, rated_problem_idx))
+        now = time.time()
+        # Older contests are not checked.
+        contest_ids = [contest.id for contest in contests
+                       if now <= contest.end_time + self._MONITOR_PERIOD_SINCE_CONTEST_END]
+        saved_contest_ids = await self.cache_master.conn.get_problemset_contest_ids()
+        # Saved rated problem indices of contests with unrated problems.
+        rated_indices_by_contest = await self.cache_master.conn.get_incomplete_problemsets()
+        contest_ids = [contest_id for contest_id in contest_ids
+                       if contest_id not in saved_contest_ids
+                       or contest_id in rated_indices_by_contest]
 
         new_problems, updated_problems = [], []
-        for contest_id in new_contest_ids:
-            new_problems += await self._fetch_for_contest(contest_id)
-        for contest_id, rated_problem_idx in contests_to_refetch:
-            updated_problems += [prob for prob in await self._fetch_for_contest(contest_id)
-                                 if prob.rating is not None and prob.index not in rated_problem_idx]
+        async for contest_id, problemset in _fetch_concurrently(
+                self._fetch_for_contest, contest_ids, limit=self._FETCH_CONCURRENCY):
+            problemset = problemset or []
+            if contest_id in rated_indices_by_contest:
+                rated_indices = rated_indices_by_contest[contest_id]
+                updated_problems += [prob for prob in problemset
+                                     if prob.rating is not None and prob.index not in rated_indices]
+            else:
+                new_problems += problemset
 
         return new_problems, updated_problems
 
     async def _fetch_for_contest(self, contest_id):
+        """Returns the problemset of the contest, or None if fetching it failed."""
         try:
-            _, problemset, _ = await cf.contest.standings(contest_id=contest_id, from_=1,
-                                                          count=1)
+            with cf.background_priority():
+                _, problemset, _ = await cf.contest.standings(contest_id=contest_id, from_=1,
+                                                              count=1)
         except cf.CodeforcesApiError as er:
             self.logger.warning(f'Problemset fetch failed for contest {contest_id}. {er!r}')
-            problemset = []
+            return None
         return problemset
 
-    def _save_problems(self, problems):
-        rc = self.cache_master.conn.cache_problemset(problems)
+    async def _save_problems(self, problems):
+        rc = await self.cache_master.conn.cache_problemset(problems)
         self.logger.info(f'Saved {rc} problems to database.')
 
-    def get_problemset(self, contest_id):
-        problemset = self.cache_master.conn.fetch_problemset(contest_id)
+    async def get_problemset(self, contest_id):
+        problemset = await self.cache_master.conn.fetch_problemset(contest_id)
         if not problemset:
             raise ProblemsetNotCached(contest_id)
         return problemset
 
-    def _update_from_disk(self):
-        self.problems = self.cache_master.conn.fetch_problems2()
+    async def _update_from_disk(self):
+        self.problems = await self.cache_master.conn.fetch_problems2()
         self.problem_to_contests = defaultdict(list)
         for problem in self.problems:
             try:
@@ -361,15 +640,32 @@ class ProblemsetCache:
 class RatingChangesCache:
     _RATED_DELAY = 36 * 60 * 60
     _RELOAD_DELAY = 10 * 60
+    _DENSE_RELOAD_DELAY = 60
+    _FETCH_CONCURRENCY = 4
+    _FETCH_ALL_JOB = 'rating_changes_all'
+    _FETCH_MISSING_JOB = 'rating_changes_missing'
 
     def __init__(self, cache_master):
         self.cache_master = cache_master
         self.monitored_contests = []
         self.handle_rating_cache = {}
+        self.rating_index = RatingIndex()
+        # Ids of the contests with rating changes saved in the database.
+        self.contest_ids_with_changes = set()
+        self.backfill_lock = asyncio.Lock()
+        # Progress of the latest fetch of rating changes for many contests.
+        self.backfill_progress = None
         self.logger = logging.getLogger(self.__class__.__name__)
 
     async def run(self):
-        self._refresh_handle_cache()
+        snapshot = self.cache_master.snapshot
+        if snapshot is not None:
+            self.handle_rating_cache = snapshot['handle_rating_cache']
+            self.rating_index = RatingIndex(list(self.handle_rating_cache.values()))
+        else:
+            await self._refresh_handle_cache()
+        self.contest_ids_with_changes = (
+            await self.cache_master.conn.get_contest_ids_with_rating_changes())
         if not self.handle_rating_cache:
             self.logger.warning('Rating changes cache on disk is empty. This must be populated '
                                 'manually before use.')
@@ -377,32 +673,73 @@ class RatingChangesCache:
 
     async def fetch_contest(self, contest_id):
         """Fetch rating changes for a particular contest. Intended for manual trigger."""
-        contest = self.cache_master.contest_cache.contest_by_id[contest_id]
-        changes = await self._fetch([contest])
-        self.cache_master.conn.clear_rating_changes(contest_id=contest_id)
-        self._save_changes(changes)
+        self.cache_master.contest_cache.get_contest(contest_id)
+        changes = await self._fetch_for_contest(contest_id) or []
+        with self.cache_master.snapshot_update():
+            await self.cache_master.conn.replace_contest_rating_changes(contest_id, changes)
+            if changes:
+                self.contest_ids_with_changes.add(contest_id)
+            else:
+                self.contest_ids_with_changes.discard(contest_id)
+            # Handles may have lost their only rating change along with the old changes.
+            await self._refresh_handle_cache()
         return len(changes)
 
     async def fetch_all_contests(self):
-        """Fetch rating changes for all contests. Intended for manual trigger."""
+        """Fetch rating changes for all contests. Intended for manual trigger.
+
+        Progress is saved contest by contest, so if the previous run was interrupted, this
+        resumes it instead of starting over.
+        """
         contests = self.cache_master.contest_cache.contests_by_phase['FINISHED']
-        changes = await self._fetch(contests)
-        self.cache_master.conn.clear_rating_changes()
-        self._save_changes(changes)
-        return len(changes)
+        return await self._backfill(self._FETCH_ALL_JOB, [contest.id for contest in contests])
 
     async def fetch_missing_contests(self):
         """Fetch rating changes for contests which are not saved in database. Intended for
-        manual trigger."""
+        manual trigger. Resumes the previous run if it was interrupted, like fetch_all_contests.
+        """
         contests = self.cache_master.contest_cache.contests_by_phase['FINISHED']
-        contests = [
-            contest for contest in contests if not self.has_rating_changes_saved(contest.id)]
-        total_changes = 0
-        for contests_chunk in paginator.chunkify(contests, _CONTESTS_PER_BATCH_IN_CACHE_UPDATES):
-            contests_chunk = await self._fetch(contests_chunk)
-            self._save_changes(contests_chunk)
-            total_changes += len(contests_chunk)
-        return total_changes
+        saved_contest_ids = await self.cache_master.conn.get_contest_ids_with_rating_changes()
+        return await self._backfill(self._FETCH_MISSING_JOB,
+                                    [contest.id for contest in contests
+                                     if contest.id not in saved_contest_ids])
+
+    async def _backfill(self, job, contest_ids):
+        """Fetches and saves the rating changes of the contests, one transaction per contest,
+        recording the status of each in the job. If the job has pending contests left from an
+        interrupted run, those are fetched instead of `contest_ids`.
+        """
+        async with self.backfill_lock:
+            conn = self.cache_master.conn
+            statuses = await conn.get_contest_job_statuses(job)
+            pending = [contest_id for contest_id, status in statuses.items()
+                       if status == 'pending']
+            if pending:
+                self.logger.info(f'Resuming {job}, {len(pending)} of {len(statuses)} contests '
+                                 'left')
+            else:
+                pending = contest_ids
+                statuses = dict.fromkeys(contest_ids, 'pending')
+                await conn.start_contest_job(job, contest_ids)
+            self.backfill_progress = progress = JobProgress(job, statuses)
+
+            count = 0
+            with self.cache_master.snapshot_update():
+                async for contest_id, changes in _fetch_concurrently(
+                        self._fetch_for_contest, pending, limit=self._FETCH_CONCURRENCY):
+                    if changes:
+                        status = 'done'
+                        count += await conn.replace_contest_rating_changes(contest_id, changes,
+                                                                           job=job)
+                        self.contest_ids_with_changes.add(contest_id)
+                    else:
+                        # Saved changes are kept if the contest has none now, as during the
+                        # hack phase.
+                        status = 'error' if changes is None else 'empty'
+                        await conn.set_contest_job_status(job, [contest_id], status)
+                    progress.advance(status)
+                await self._refresh_handle_cache()
+            return count
 
     def is_newly_finished_without_rating_changes(self, contest):
         now = time.time()
@@ -437,8 +774,7 @@ class RatingChangesCache:
             else:
                 self.monitored_contests = []
 
-    @tasks.task_spec(name='RatingChangesCacheUpdate.MonitorNewlyFinishedContests',
-                     waiter=tasks.Waiter.fixed_delay(_RELOAD_DELAY))
+    @tasks.task_spec(name='RatingChangesCacheUpdate.MonitorNewlyFinishedContests')
     async def _monitor_task(self, _):
         self.monitored_contests = [
             contest for contest in self.monitored_contests
@@ -455,51 +791,72 @@ class RatingChangesCache:
         # Sort by the rating update time of the first change in the list of changes, assuming
         # every change in the list has the same time.
         contest_changes_pairs.sort(key=lambda pair: pair[1][0].ratingUpdateTimeSeconds)
-        self._save_changes(contest_changes_pairs)
+        await self._save_changes(contest_changes_pairs)
         for contest, changes in contest_changes_pairs:
             cf_common.event_sys.dispatch(events.RatingChangesUpdate, contest=contest,
                                          rating_changes=changes)
 
+    @_monitor_task.waiter()
+    async def _monitor_task_waiter(self):
+        # Poll densely while rating changes of some monitored contest are expected.
+        contest_cache = self.cache_master.contest_cache
+        if any(contest_cache.is_rating_update_due(contest) for contest in self.monitored_contests):
+            await asyncio.sleep(self._DENSE_RELOAD_DELAY)
+        else:
+            await asyncio.sleep(self._RELOAD_DELAY)
+
     async def _fetch(self, contests):
         all_changes = []
         for contest in contests:
-            try:
-                changes = await cf.contest.ratingChanges(contest_id=contest.id)
-                self.logger.info(f'{len(changes)} rating changes fetched for contest {contest.id}')
-                if changes:
-                    all_changes.append((contest, changes))
-            except cf.CodeforcesApiError as er:
-                self.logger.warning(f'Fetch rating changes failed for contest {contest.id}, ignoring. {er!r}')
-                pass
+            changes = await self._fetch_for_contest(contest.id)
+            if changes:
+                all_changes.append((contest, changes))
         return all_changes
 
-    def _save_changes(self, contest_changes_pairs):
+    async def _fetch_for_contest(self, contest_id):
+        """Returns the rating changes of the contest, or None if fetching them failed."""
+        try:
+            with cf.background_priority():
+                changes = await cf.contest.ratingChanges(contest_id=contest_id)
+        except cf.CodeforcesApiError as er:
+            self.logger.warning(f'Fetch rating changes failed for contest {contest_id}, ignoring. {er!r}')
+            return None
+        self.logger.info(f'{len(changes)} rating changes fetched for contest {contest_id}')
+        return changes
+
+    async def _save_changes(self, contest_changes_pairs):
         flattened = [change for _, changes in contest_changes_pairs for change in changes]
         if not flattened:
             return
-        rc = self.cache_master.conn.save_rating_changes(flattened)
-        self.logger.info(f'Saved {rc} changes to database.')
-        self._refresh_handle_cache()
-
-    def _refresh_handle_cache(self):
-        changes = self.cache_master.conn.get_all_rating_changes()
-        handle_rating_cache = {}
-        for change in changes:
-            handle_rating_cache[change.handle] = change.newRating
+        with self.cache_master.snapshot_update():
+            rc = await self.cache_master.conn.save_rating_changes(flattened)
+            self.logger.info(f'Saved {rc} changes to database.')
+            self.contest_ids_with_changes.update(change.contestId for change in flattened)
+            # The saved changes need not be the latest of their handles, so the latest ratings
+            # are read back for just those handles.
+            handles = {change.handle for change in flattened}
+            rating_by_handle = await self.cache_master.conn.get_latest_rating_by_handle(handles)
+            for handle, rating in rating_by_handle.items():
+                self.rating_index.update(self.handle_rating_cache.get(handle), rating)
+                self.handle_rating_cache[handle] = rating
+
+    async def _refresh_handle_cache(self):
+        handle_rating_cache = await self.cache_master.conn.get_latest_rating_by_handle()
         self.handle_rating_cache = handle_rating_cache
+        self.rating_index = RatingIndex(list(handle_rating_cache.values()))
         self.logger.info(f'Ratings for {len(handle_rating_cache)} handles cached')
 
-    def get_users_with_more_than_n_contests(self, time_cutoff, n):
-        return self.cache_master.conn.get_users_with_more_than_n_contests(time_cutoff, n)
+    async def get_users_with_more_than_n_contests(self, time_cutoff, n):
+        return await self.cache_master.conn.get_users_with_more_than_n_contests(time_cutoff, n)
 
-    def get_rating_changes_for_contest(self, contest_id):
-        return self.cache_master.conn.get_rating_changes_for_contest(contest_id)
+    async def get_rating_changes_for_contest(self, contest_id):
+        return await self.cache_master.conn.get_rating_changes_for_contest(contest_id)
 
     def has_rating_changes_saved(self, contest_id):
-        return self.cache_master.conn.has_rating_changes_saved(contest_id)
+        return contest_id in self.contest_ids_with_changes
 
-    def get_rating_changes_for_handle(self, handle):
-        return self.cache_master.conn.get_rating_changes_for_handle(handle)
+    async def get_rating_changes_for_handle(self, handle):
+        return await self.cache_master.conn.get_rating_changes_for_handle(handle)
 
     def get_current_rating(self, handle, default_if_absent=False):
         return self.handle_rating_cache.get(handle,
@@ -582,16 +939,18 @@ class RanklistCache:
         for contest_id, ranklist in ranklist_by_contest.items():
             self.ranklist_by_contest[contest_id] = ranklist
 
-    async def generate_ranklist(self, contest_id, *, fetch_changes=False, predict_changes=False):
+    async def generate_ranklist(self, contest_id, *, fetch_changes=False, predict_changes=False,
+                                previous=None):
+        """`previous` may be the last ranklist generated for the contest, from which the
+        prediction is updated when predicting changes.
+        """
         assert fetch_changes ^ predict_changes
 
         contest, problems, standings = await cf.contest.standings(contest_id=contest_id,
-                                                                  show_unofficial=True)
+                                                                  show_unofficial=True,
+                                                                  party_filter=_is_ranklist_party)
         now = time.time()
 
-        # Exclude PRACTICE and MANAGER
-        standings = [row for row in standings
-                     if row.party.participantType in ('CONTESTANT', 'OUT_OF_COMPETITION', 'VIRTUAL')]
         if fetch_changes:
             # Fetch final rating changes from CF.
             # For older contests.
@@ -626,18 +985,20 @@ class RanklistCache:
                     current_rating = {handle: rating
                                       for handle, rating in current_rating.items() if rating < 2100}
                 ranklist = Ranklist(contest, problems, standings, now, is_rated=True)
-                ranklist.predict(current_rating)
+                ranklist.predict(current_rating, previous)
 
         return ranklist
 
     async def generate_vc_ranklist(self, contest_id, handle_to_member_id):
-        handles = list(handle_to_member_id.keys())
+        handles = set(handle_to_member_id.keys())
+
+        def keep_party(party):
+            # Exclude PRACTICE, MANAGER and OUR_OF_COMPETITION
+            return party.participantType == 'CONTESTANT' or party.members[0].handle in handles
+
         contest, problems, standings = await cf.contest.standings(contest_id=contest_id,
-                                                                  show_unofficial=True)
-        # Exclude PRACTICE, MANAGER and OUR_OF_COMPETITION
-        standings = [row for row in standings
-                     if row.party.participantType == 'CONTESTANT' or
-                        row.party.members[0].handle in handles]
+                                                                  show_unofficial=True,
+                                                                  party_filter=keep_party)
         standings.sort(key=lambda row: row.rank)
         standings = [row._replace(rank=i + 1) for i, row in enumerate(standings)]
         now = time.time()
@@ -649,24 +1010,23 @@ class RanklistCache:
         handles = [row.party.members[0].handle for row in standings
                    if row.party.members[0].handle in handles and
                       row.party.participantType == 'VIRTUAL']
-        current_vc_rating = {handle: cf_common.user_db.get_vc_rating(handle_to_member_id.get(handle))
+        current_vc_rating = {handle: await cf_common.user_db.get_vc_rating(handle_to_member_id.get(handle))
                                 for handle in handles}
         ranklist = Ranklist(contest, problems, standings, now, is_rated=True)
-        delta_by_handle = {}
-        for handle in handles:
-            mixed_ratings = current_official_rating.copy()
-            mixed_ratings[handle] = current_vc_rating.get(handle)
-            ranklist.predict(mixed_ratings)
-            delta_by_handle[handle] = ranklist.delta_by_handle.get(handle, 0)
-
-        ranklist.delta_by_handle = delta_by_handle
+        # Each virtual participant is rated against the official field alone.
+        ranklist.predict_inserted(current_official_rating, current_vc_rating)
+        ranklist.delta_by_handle = {handle: ranklist.delta_by_handle.get(handle, 0)
+                                    for handle in handles}
         return ranklist
 
     async def _fetch(self, contests):
         ranklist_by_contest = {}
         for contest in contests:
             try:
-                ranklist = await self.generate_ranklist(contest.id, predict_changes=True)
+                previous = self.ranklist_by_contest.get(contest.id)
+                with cf.background_priority():
+                    ranklist = await self.generate_ranklist(contest.id, predict_changes=True,
+                                                            previous=previous)
                 ranklist_by_contest[contest.id] = ranklist
                 self.logger.info(f'Ranklist fetched for contest {contest.id}')
             except cf.CodeforcesApiError as er:
@@ -675,21 +1035,222 @@ class RanklistCache:
         return ranklist_by_contest
 
 
+class UserHistoryCache:
+    """Keeps the submissions and rating history of handles in the database. Submissions are
+    refreshed incrementally, fetching pages of the newest submissions until a saved one is found.
+    """
+    _SUBMISSIONS_STALE_AFTER = 60
+    _SUBMISSIONS_FULL_REFRESH_AFTER = 7 * 24 * 60 * 60
+    _SUBMISSIONS_PAGE_SIZE = 100
+    _RATING_STALE_AFTER = 10 * 60
+    _SUBMISSION_FRAMES_KEPT = 32
+
+    def __init__(self, cache_master):
+        self.cache_master = cache_master
+        # Lock and number of holders and waiters by kind of data and handle, see _refresh_lock.
+        self.refresh_locks = {}
+        # Recently used submission frames by handle, along with the fetch time of their
+        # submissions, least recently used first.
+        self.submission_frames = OrderedDict()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(self):
+        self._rating_changes_task.start()
+
+    async def get_submissions(self, handle, *, max_age=None):
+        """Returns the submissions of the handle, newest first, refreshing them if they were
+        fetched more than `max_age` seconds ago.
+        """
+        key = await self._refresh_submissions_if_stale(handle, max_age)
+        return await self.cache_master.conn.fetch_submissions(key)
+
+    async def get_submission_frame(self, handle, *, max_age=None):
+        """Like `get_submissions`, but returns the submissions as a `SubmissionFrame`. The frames
+        of recently used handles are kept until their submissions are refreshed.
+        """
+        key = await self._refresh_submissions_if_stale(handle, max_age)
+        conn = self.cache_master.conn
+        fetch_time = await conn.get_user_fetch_time(key, 'status')
+        kept = self.submission_frames.get(key)
+        if kept is not None and kept[0] == fetch_time:
+            self.submission_frames.move_to_end(key)
+            return kept[1]
+        submissions = await conn.fetch_submissions(key)
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(None, SubmissionFrame, submissions)
+        self.submission_frames[key] = fetch_time, frame
+        self.submission_frames.move_to_end(key)
+        if len(self.submission_frames) > self._SUBMISSION_FRAMES_KEPT:
+            self.submission_frames.popitem(last=False)
+        return frame
+
+    @contextlib.asynccontextmanager
+    async def _refresh_lock(self, kind, key):
+        """Holds the lock for refreshing data of the kind for the handle. The lock is dropped
+        once no one holds or waits for it, so that locks are not kept for every handle ever seen.
+        """
+        lock_key = (kind, key)
+        entry = self.refresh_locks.get(lock_key)
+        if entry is None:
+            entry = self.refresh_locks[lock_key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.refresh_locks[lock_key]
+
+    async def _refresh_submissions_if_stale(self, handle, max_age):
+        max_age = self._SUBMISSIONS_STALE_AFTER if max_age is None else max_age
+        key = handle.lower()
+        async with self._refresh_lock('status', key):
+            await self._maybe_refresh(key, 'status', max_age,
+                                      lambda: self._refresh_submissions(handle, key))
+        return key
+
+    async def get_rating_history(self, handle, *, max_age=None):
+        """Returns the rating changes of the handle, refreshing them if they were fetched more
+        than `max_age` seconds ago.
+        """
+        max_age = self._RATING_STALE_AFTER if max_age is None else max_age
+        key = handle.lower()
+        conn = self.cache_master.conn
+        async with self._refresh_lock('rating', key):
+            await self._maybe_refresh(key, 'rating', max_age,
+                                      lambda: self._refresh_rating_history(handle, key))
+        return await conn.fetch_user_rating_changes(key)
+
+    async def _maybe_refresh(self, key, kind, max_age, refresh):
+        conn = self.cache_master.conn
+        fetch_time = await conn.get_user_fetch_time(key, kind)
+        now = time.time()
+        if fetch_time is not None and now - fetch_time <= max_age:
+            return
+        try:
+            await refresh()
+        except (cf.ClientError, cf.CallLimitExceededError) as er:
+            if fetch_time is None:
+                raise
+            self.logger.warning(f'Refreshing {kind} of `{key}` failed, serving data fetched '
+                                f'{now - fetch_time:.0f}s ago. {er!r}')
+            return
+        await conn.set_user_fetch_time(key, kind, now)
+
+    async def _refresh_submissions(self, handle, key):
+        conn = self.cache_master.conn
+        last_judged_id = await conn.get_last_judged_submission_id(key)
+        full_fetch_time = await conn.get_user_fetch_time(key, 'status_full')
+        now = time.time()
+        if (last_judged_id is None or full_fetch_time is None or
+                now - full_fetch_time > self._SUBMISSIONS_FULL_REFRESH_AFTER):
+            # Full refreshes pick up rejudged submissions, which incremental ones would miss.
+            submissions = await cf.user.status(handle=handle)
+            await conn.set_user_fetch_time(key, 'status_full', now)
+        else:
+            submissions = []
+            from_, count = 1, self._SUBMISSIONS_PAGE_SIZE
+            while True:
+                page = await cf.user.status(handle=handle, from_=from_, count=count)
+                submissions += page
+                if len(page) < count or any(sub.id <= last_judged_id for sub in page):
+                    break
+                from_ += count
+        rc = await conn.save_submissions(key, submissions)
+        self.logger.info(f'Saved {rc} submissions of `{handle}`')
+
+    async def _refresh_rating_history(self, handle, key):
+        changes = await cf.user.rating(handle=handle)
+        await self.cache_master.conn.save_user_rating_changes(key, changes)
+
+    @tasks.task_spec(name='UserHistoryCache.RatingChangesUpdate',
+                     waiter=tasks.Waiter.for_event(events.RatingChangesUpdate))
+    async def _rating_changes_task(self, _):
+        # New rating changes were published, saved rating histories are all outdated.
+        await self.cache_master.conn.clear_user_fetch_times('rating')
+
+
 class CacheSystem:
-    def __init__(self, conn):
+    _SNAPSHOT_DELAY = 30
+
+    def __init__(self, conn, snapshot_path=None):
+        """`snapshot_path` is where the in-memory state of the caches is saved for the next
+        startup. Without it, state is always loaded from the database.
+        """
         self.conn = conn
+        self.snapshot_path = snapshot_path
+        # The loaded snapshot, only during startup.
+        self.snapshot = None
+        self._snapshot_generation = 0
+        self._updates_in_progress = 0
+        self._snapshot_task = None
         self.contest_cache = ContestCache(self)
         self.problem_cache = ProblemCache(self)
         self.rating_changes_cache = RatingChangesCache(self)
         self.ranklist_cache = RanklistCache(self)
         self.problemset_cache = ProblemsetCache(self)
+        self.user_history_cache = UserHistoryCache(self)
 
     async def run(self):
-        await self.rating_changes_cache.run()
-        await self.ranklist_cache.run()
-        await self.contest_cache.run()
-        await self.problem_cache.run()
-        await self.problemset_cache.run()
+        if self.snapshot_path is not None:
+            loop = asyncio.get_running_loop()
+            self.snapshot = await loop.run_in_executor(None, cache_snapshot.load,
+                                                       self.snapshot_path)
+            if self.snapshot is not None:
+                logger.info('Loading caches from snapshot')
+        try:
+            await self.rating_changes_cache.run()
+            await self.ranklist_cache.run()
+            await self.contest_cache.run()
+            await self.problem_cache.run()
+            await self.problemset_cache.run()
+            await self.user_history_cache.run()
+        finally:
+            self.snapshot = None
+
+    @contextlib.contextmanager
+    def snapshot_update(self):
+        """Wraps an update of the database and of in-memory state held in the snapshot. The
+        snapshot is removed first, as it becomes stale once the database is written, and saved
+        again some time after the update.
+        """
+        self._updates_in_progress += 1
+        self._snapshot_generation += 1
+        if self.snapshot_path is not None:
+            cache_snapshot.remove(self.snapshot_path)
+        try:
+            yield
+        finally:
+            self._updates_in_progress -= 1
+            if self.snapshot_path is not None and self._snapshot_task is None:
+                self._snapshot_task = asyncio.create_task(self._save_snapshot_later())
+
+    async def _save_snapshot_later(self):
+        await asyncio.sleep(self._SNAPSHOT_DELAY)
+        self._snapshot_task = None
+        if self._updates_in_progress:
+            # The update schedules another save when done.
+            return
+        generation = self._snapshot_generation
+        state = {
+            'contests': self.contest_cache.contests,
+            'problems': self.problem_cache.problems,
+            'handle_rating_cache': self.rating_changes_cache.handle_rating_cache.copy(),
+            'problemset': self.problemset_cache.problems,
+            'problem_to_contests': dict(self.problemset_cache.problem_to_contests),
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, cache_snapshot.save, self.snapshot_path, state)
+        except OSError as e:
+            logger.warning(f'Saving cache snapshot failed. {e!r}')
+            return
+        if generation != self._snapshot_generation:
+            # An update began while saving, so what was saved may already be stale.
+            cache_snapshot.remove(self.snapshot_path)
+        else:
+            logger.info('Cache snapshot saved')
 
     @staticmethod
     @cached(ttl=30 * 60)
@@ -1,4 +1,9 @@
 import asyncio
+import codecs
+import concurrent.futures
+import contextlib
+import contextvars
+import json
 import logging
 import time
 import functools
@@ -18,6 +23,8 @@ ACMSGURU_BASE_URL = 'https://codeforces.com/problemsets/acmsguru/'
 GYM_ID_THRESHOLD = 100000
 DEFAULT_RATING = 1500
 MAX_HANDLES_PER_QUERY = 300 # To avoid sending too large requests.
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_OFFLOAD_THRESHOLD = 256 * 1024  # Responses of at least this many bytes are decoded off the loop.
 
 logger = logging.getLogger(__name__)
 
@@ -145,6 +152,59 @@ def make_from_dict(namedtuple_cls, dict_):
     return namedtuple_cls._make(field_vals)
 
 
+# The following do not modify the given dicts, since a response may be shared by several callers.
+
+def _make_party(party_dict):
+    members = [make_from_dict(Member, member) for member in party_dict['members']]
+    return make_from_dict(Party, party_dict)._replace(members=members)
+
+
+def _make_ranklist_row(row_dict, party_filter=None):
+    """Returns None if the party of the row is rejected by `party_filter`."""
+    party = _make_party(row_dict['party'])
+    if party_filter is not None and not party_filter(party):
+        return None
+    problem_results = [make_from_dict(ProblemResult, problem_result)
+                       for problem_result in row_dict['problemResults']]
+    return make_from_dict(RanklistRow, row_dict)._replace(party=party,
+                                                          problemResults=problem_results)
+
+
+def _make_contests(resp):
+    return [make_from_dict(Contest, contest_dict) for contest_dict in resp]
+
+
+def _make_rating_changes(resp):
+    return [make_from_dict(RatingChange, change_dict) for change_dict in resp]
+
+
+def _make_users(resp):
+    return [make_from_dict(User, user_dict) for user_dict in resp]
+
+
+def _make_submissions(resp):
+    return [_make_submission(submission_dict) for submission_dict in resp]
+
+
+def _make_problemset(resp):
+    problems = [make_from_dict(Problem, problem_dict) for problem_dict in resp['problems']]
+    problemstats = [make_from_dict(ProblemStatistics, problemstat_dict) for problemstat_dict in
+                    resp['problemStatistics']]
+    return problems, problemstats
+
+
+@functools.lru_cache(maxsize=32)
+def _ranklist_row_maker(party_filter):
+    # Cached so that equal filters give equal makers, which lets identical queries coalesce.
+    return functools.partial(_make_ranklist_row, party_filter=party_filter)
+
+
+def _make_submission(submission_dict):
+    problem = make_from_dict(Problem, submission_dict['problem'])
+    author = _make_party(submission_dict['author'])
+    return make_from_dict(Submission, submission_dict)._replace(problem=problem, author=author)
+
+
 # Error classes
 
 class CodeforcesApiError(commands.CommandError):
@@ -209,26 +269,215 @@ def _bool_to_str(value):
     raise TypeError(f'Expected bool, got {value} of type {type(value)}')
 
 
+# Rate limiting
+
+RateLimiterStats = namedtuple('RateLimiterStats', 'lane queued served mean_wait p95_wait max_wait')
+
+
+class RateLimiter:
+    """A token bucket shared by every query to the API. Callers that cannot get a token
+    immediately are queued by priority, all interactive callers are served before any background
+    caller, and callers of the same priority are served in FIFO order.
+    """
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    LANE_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+    _RECENT_WAITS_KEPT = 1000
+
+    def __init__(self, rate, burst):
+        """`rate` is the number of tokens added per second, `burst` the capacity of the bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.queues = {priority: deque() for priority in self.LANE_NAMES}
+        # The priority and future of each task queued for a token.
+        self.waiting = {}
+        self.dispatcher = None
+
+        self.served = {priority: 0 for priority in self.LANE_NAMES}
+        self.total_wait = {priority: 0.0 for priority in self.LANE_NAMES}
+        self.max_wait = {priority: 0.0 for priority in self.LANE_NAMES}
+        self.recent_waits = {priority: deque(maxlen=self._RECENT_WAITS_KEPT)
+                             for priority in self.LANE_NAMES}
+
+    async def acquire(self, priority):
+        """Waits until a token is available for a caller of the given priority and takes it."""
+        begin = time.monotonic()
+        self._refill()
+        if self.tokens >= 1 and not self._queued():
+            self.tokens -= 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.queues[priority].append(future)
+            task = asyncio.current_task()
+            self.waiting[task] = (priority, future)
+            if self.dispatcher is None or self.dispatcher.done():
+                self.dispatcher = asyncio.create_task(self._dispatch())
+            try:
+                # If the caller is cancelled the future is cancelled too and the dispatcher
+                # skips it.
+                await future
+            finally:
+                # The task may have been promoted while queued.
+                priority, _ = self.waiting.pop(task)
+        self._record_wait(priority, time.monotonic() - begin)
+
+    def promote(self, task, priority):
+        """Moves the task to the back of the queue of the given priority if it is queued with a
+        lower priority.
+        """
+        queued_priority, future = self.waiting.get(task, (None, None))
+        if future is None or future.done() or priority >= queued_priority:
+            return
+        self.queues[queued_priority].remove(future)
+        self.queues[priority].append(future)
+        self.waiting[task] = (priority, future)
+
+    def get_stats(self):
+        stats = []
+        for priority, name in self.LANE_NAMES.items():
+            queued = sum(not future.done() for future in self.queues[priority])
+            served = self.served[priority]
+            mean_wait = self.total_wait[priority] / served if served else 0.0
+            waits = sorted(self.recent_waits[priority])
+            p95_wait = waits[int(0.95 * (len(waits) - 1))] if waits else 0.0
+            stats.append(RateLimiterStats(name, queued, served, mean_wait, p95_wait,
+                                          self.max_wait[priority]))
+        return stats
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _queued(self):
+        return any(not future.done() for queue in self.queues.values() for future in queue)
+
+    def _pop_next(self):
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    async def _dispatch(self):
+        while True:
+            self._refill()
+            while self.tokens >= 1:
+                future = self._pop_next()
+                if future is None:
+                    return
+                self.tokens -= 1
+                future.set_result(None)
+            if not self._queued():
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _record_wait(self, priority, wait):
+        self.served[priority] += 1
+        self.total_wait[priority] += wait
+        self.max_wait[priority] = max(self.max_wait[priority], wait)
+        self.recent_waits[priority].append(wait)
+
+
+_limiter = RateLimiter(rate=5, burst=1)
+_priority = contextvars.ContextVar('cf_api_priority', default=RateLimiter.INTERACTIVE)
+# The coalesced query made by the current task, see `cf_singleflight`.
+_current_flight = contextvars.ContextVar('cf_api_flight', default=None)
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Queries made by the current task within this context yield to interactive queries."""
+    token = _priority.set(RateLimiter.BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _current_priority():
+    flight = _current_flight.get()
+    return flight.priority if flight is not None else _priority.get()
+
+
+def get_ratelimit_stats():
+    return _limiter.get_stats()
+
+
+# Decoding off the event loop
+
+DecodeStats = namedtuple('DecodeStats', 'where count total_time max_time')
+
+
+class _DecodeTimer:
+    def __init__(self, where):
+        self.where = where
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def stats(self):
+        return DecodeStats(self.where, self.count, self.total_time, self.max_time)
+
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2,
+                                                  thread_name_prefix='cf_api_decode')
+_offload_threshold = DEFAULT_OFFLOAD_THRESHOLD
+# Time spent decoding on the loop is time the loop is blocked for.
+_inline_decode_timer = _DecodeTimer('loop')
+_offloaded_decode_timer = _DecodeTimer('executor')
+
+
+def configure_decoding(*, executor=None, threshold=None):
+    """Sets the executor in which large responses are decoded and turned into models, and the
+    response size in bytes from which the executor is used.
+    """
+    global _executor
+    global _offload_threshold
+    if executor is not None:
+        _executor = executor
+    if threshold is not None:
+        _offload_threshold = threshold
+
+
+def get_decode_stats():
+    return [_inline_decode_timer.stats(), _offloaded_decode_timer.stats()]
+
+
+def _decode_result(body, parse):
+    result = json.loads(body)['result']
+    return parse(result) if parse is not None else result
+
+
+async def _decode(body, parse):
+    begin = time.perf_counter()
+    if len(body) < _offload_threshold:
+        result = _decode_result(body, parse)
+        _inline_decode_timer.record(time.perf_counter() - begin)
+    else:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_executor, _decode_result, body, parse)
+        _offloaded_decode_timer.record(time.perf_counter() - begin)
+    return result
+
+
 def cf_ratelimit(f):
     tries = 3
-    per_second = 5
-    last = deque([0]*per_second)
 
     @functools.wraps(f)
     async def wrapped(*args, **kwargs):
         for i in range(tries):
-            now = time.time()
-
-            # Next valid slot is 1s after the `per_second`th last request
-            next_valid = max(now, 1 + last[0])
-            last.append(next_valid)
-            last.popleft()
-
-            # Delay as needed
-            delay = next_valid - now
-            if delay > 0:
-                await asyncio.sleep(delay)
-
+            await _limiter.acquire(_current_priority())
             try:
                 return await f(*args, **kwargs)
             except (ClientError, CallLimitExceededError) as e:
@@ -242,21 +491,204 @@ def cf_ratelimit(f):
     return wrapped
 
 
+class _Flight:
+    """A query shared by identical concurrent callers. It is made with the highest priority among
+    its callers.
+    """
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.task = None
+
+    async def run(self, coro):
+        _current_flight.set(self)
+        return await coro
+
+    def join(self, priority):
+        if priority < self.priority:
+            self.priority = priority
+            _limiter.promote(self.task, priority)
+
+
+_inflight_queries = {}
+
+
+def cf_singleflight(f):
+    """Identical concurrent queries, by path and params, share a single request to the API."""
+
+    @functools.wraps(f)
+    async def wrapped(path, params=None, *, stream=None, parse=None):
+        key = (path, tuple(sorted((params or {}).items())), stream, parse)
+        flight = _inflight_queries.get(key)
+        if flight is None:
+            flight = _Flight(_priority.get())
+            flight.task = asyncio.ensure_future(
+                flight.run(f(path, params, stream=stream, parse=parse)))
+            _inflight_queries[key] = flight
+
+            def on_done(task):
+                if _inflight_queries.get(key) is flight:
+                    del _inflight_queries[key]
+                if not task.cancelled():
+                    # Mark the exception retrieved in case every waiter was cancelled.
+                    task.exception()
+
+            flight.task.add_done_callback(on_done)
+        else:
+            logger.info(f'Joining in-flight query to CF API at {path} with {params}')
+            # An interactive caller must not wait behind background queries for the token.
+            flight.join(_priority.get())
+        # Shielded so that a cancelled caller does not cancel the query for the others.
+        return await asyncio.shield(flight.task)
+    return wrapped
+
+
+class _JsonStreamReader:
+    """Reads JSON values one at a time from text fed to it in chunks. Reading methods are
+    generators that yield whenever they need the next chunk, which is sent to them, and return
+    what they read. An empty chunk marks the end of the stream.
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            raise ValueError('Unexpected end of JSON stream')
+        chunk = yield
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.utf8_decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            yield from self._fill()
+
+    def expect(self, chars):
+        char = yield from self.peek()
+        if char not in chars:
+            raise ValueError(f'Expected one of {chars!r} in JSON stream, got {char!r}')
+        self.pos += 1
+        return char
+
+    def value(self):
+        yield from self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            yield from self._fill()
+
+    def object(self, hooks):
+        """Reads an object. The value of a key present in `hooks` is read by `hook(self)` instead
+        of being decoded whole.
+        """
+        obj = {}
+        yield from self.expect('{')
+        if (yield from self.peek()) == '}':
+            self.pos += 1
+            return obj
+        while True:
+            key = yield from self.value()
+            yield from self.expect(':')
+            hook = hooks.get(key)
+            obj[key] = yield from (hook(self) if hook else self.value())
+            if (yield from self.expect(',}')) == '}':
+                return obj
+
+    def array(self, make_item):
+        """Reads an array, keeping `make_item(element)` for every element for which it is not
+        None. Elements are converted as soon as they are read.
+        """
+        items = []
+        yield from self.expect('[')
+        if (yield from self.peek()) == ']':
+            self.pos += 1
+            return items
+        while True:
+            item = make_item((yield from self.value()))
+            if item is not None:
+                items.append(item)
+            if (yield from self.expect(',]')) == ']':
+                return items
+
+
+def _feed(parser, chunk):
+    """Sends the chunk to the parser, returning whether it is done and what it read if so."""
+    begin = time.perf_counter()
+    try:
+        parser.send(chunk)
+        return False, None
+    except StopIteration as e:
+        return True, e.value
+    finally:
+        _offloaded_decode_timer.record(time.perf_counter() - begin)
+
+
+async def _read_streaming(resp, stream):
+    """Reads a successful response, where `stream` is an `(array_key, make_item)` pair. The array
+    `result[array_key]` is read element by element as bytes arrive and replaced by the list of items
+    made from it, so the raw array is never held in memory as a whole. Each chunk received is
+    parsed in the decoding executor, so the loop only waits for the network.
+    """
+    array_key, make_item = stream
+
+    def read_result(reader):
+        return reader.object({array_key: lambda reader: reader.array(make_item)})
+
+    parser = _JsonStreamReader().object({'result': read_result})
+    # Runs until the parser asks for the first chunk.
+    next(parser)
+    loop = asyncio.get_running_loop()
+    try:
+        done = False
+        while not done:
+            chunk = await resp.content.read(STREAM_CHUNK_SIZE)
+            done, respjson = await loop.run_in_executor(_executor, _feed, parser, chunk)
+    except ValueError as e:
+        logger.warning(f'CF API responded with malformed JSON: {e!r}')
+        raise CodeforcesApiError
+    return respjson['result']
+
+
+@cf_singleflight
 @cf_ratelimit
-async def _query_api(path, params=None):
+async def _query_api(path, params=None, *, stream=None, parse=None):
+    """Queries the API and returns the result. If `stream` is given the response is read as
+    described in `_read_streaming`. Otherwise the result is converted by `parse`, if given, which
+    happens in the decoding executor for large responses. Results may be shared by coalesced
+    queries and must not be modified.
+    """
     url = API_BASE_URL + path
     try:
         logger.info(f'Querying CF API at {url} with {params}')
         # Explicitly state encoding (though aiohttp accepts gzip by default)
         headers = {'Accept-Encoding': 'gzip'}
         async with _session.get(url, params=params, headers=headers) as resp:
-            try:
-                respjson = await resp.json()
-            except aiohttp.ContentTypeError:
+            if stream is not None and resp.status == 200 and resp.content_type == 'application/json':
+                return await _read_streaming(resp, stream)
+            if resp.content_type != 'application/json':
                 logger.warning(f'CF API did not respond with JSON, status {resp.status}.')
                 raise CodeforcesApiError
+            body = await resp.read()
             if resp.status == 200:
-                return respjson['result']
+                return await _decode(body, parse)
+            respjson = json.loads(body)
             comment = f'HTTP Error {resp.status}, {respjson.get("comment")}'
     except aiohttp.ClientError as e:
         logger.error(f'Request to CF API encountered error: {e!r}')
@@ -273,25 +705,28 @@ class contest:
         params = {}
         if gym is not None:
             params['gym'] = _bool_to_str(gym)
-        resp = await _query_api('contest.list', params)
-        return [make_from_dict(Contest, contest_dict) for contest_dict in resp]
+        resp = await _query_api('contest.list', params, parse=_make_contests)
+        return list(resp)
 
     @staticmethod
     async def ratingChanges(*, contest_id):
         params = {'contestId': contest_id}
         try:
-            resp = await _query_api('contest.ratingChanges', params)
+            resp = await _query_api('contest.ratingChanges', params, parse=_make_rating_changes)
         except TrueApiError as e:
             if 'not found' in e.comment:
                 raise ContestNotFoundError(e.comment, contest_id)
             if 'Rating changes are unavailable' in e.comment:
                 raise RatingChangesUnavailableError(e.comment, contest_id)
             raise
-        return [make_from_dict(RatingChange, change_dict) for change_dict in resp]
+        return list(resp)
 
     @staticmethod
     async def standings(*, contest_id, from_=None, count=None, handles=None, room=None,
-                        show_unofficial=None):
+                        show_unofficial=None, party_filter=None):
+        """Rows are decoded as they are received. If `party_filter` is given, only rows whose
+        `Party` it accepts are kept. Queries with the same `party_filter` object may be coalesced.
+        """
         params = {'contestId': contest_id}
         if from_ is not None:
             params['from'] = from_
@@ -303,21 +738,17 @@ class contest:
             params['room'] = room
         if show_unofficial is not None:
             params['showUnofficial'] = _bool_to_str(show_unofficial)
+        stream = ('rows', _ranklist_row_maker(party_filter))
         try:
-            resp = await _query_api('contest.standings', params)
+            resp = await _query_api('contest.standings', params, stream=stream)
         except TrueApiError as e:
             if 'not found' in e.comment:
                 raise ContestNotFoundError(e.comment, contest_id)
             raise
         contest_ = make_from_dict(Contest, resp['contest'])
         problems = [make_from_dict(Problem, problem_dict) for problem_dict in resp['problems']]
-        for row in resp['rows']:
-            row['party']['members'] = [make_from_dict(Member, member)
-                                       for member in row['party']['members']]
-            row['party'] = make_from_dict(Party, row['party'])
-            row['problemResults'] = [make_from_dict(ProblemResult, problem_result)
-                                     for problem_result in row['problemResults']]
-        ranklist = [make_from_dict(RanklistRow, row_dict) for row_dict in resp['rows']]
+        # Copied since the list may be shared with coalesced queries.
+        ranklist = list(resp['rows'])
         return contest_, problems, ranklist
 
 
@@ -329,11 +760,9 @@ class problemset:
             params['tags'] = ';'.join(tags)
         if problemset_name is not None:
             params['problemsetName'] = problemset_name
-        resp = await _query_api('problemset.problems', params)
-        problems = [make_from_dict(Problem, problem_dict) for problem_dict in resp['problems']]
-        problemstats = [make_from_dict(ProblemStatistics, problemstat_dict) for problemstat_dict in
-                        resp['problemStatistics']]
-        return problems, problemstats
+        problems, problemstats = await _query_api('problemset.problems', params,
+                                                  parse=_make_problemset)
+        return list(problems), list(problemstats)
 
 
 class user:
@@ -348,36 +777,36 @@ class user:
         for chunk in chunks:
             params = {'handles': ';'.join(chunk)}
             try:
-                resp = await _query_api('user.info', params)
+                resp = await _query_api('user.info', params, parse=_make_users)
             except TrueApiError as e:
                 if 'not found' in e.comment:
                     # Comment format is "handles: User with handle ***** not found"
                     handle = e.comment.partition('not found')[0].split()[-1]
                     raise HandleNotFoundError(e.comment, handle)
                 raise
-            result += [make_from_dict(User, user_dict) for user_dict in resp]
+            result += resp
         return result
 
     @staticmethod
     async def rating(*, handle):
         params = {'handle': handle}
         try:
-            resp = await _query_api('user.rating', params)
+            resp = await _query_api('user.rating', params, parse=_make_rating_changes)
         except TrueApiError as e:
             if 'not found' in e.comment:
                 raise HandleNotFoundError(e.comment, handle)
             if 'should contain' in e.comment:
                 raise HandleInvalidError(e.comment, handle)
             raise
-        return [make_from_dict(RatingChange, ratingchange_dict) for ratingchange_dict in resp]
+        return list(resp)
 
     @staticmethod
     async def ratedList(*, activeOnly=None):
         params = {}
         if activeOnly is not None:
             params['activeOnly'] = _bool_to_str(activeOnly)
-        resp = await _query_api('user.ratedList', params=params)
-        return [make_from_dict(User, user_dict) for user_dict in resp]
+        resp = await _query_api('user.ratedList', params=params, parse=_make_users)
+        return list(resp)
 
     @staticmethod
     async def status(*, handle, from_=None, count=None):
@@ -387,19 +816,14 @@ class user:
         if count is not None:
             params['count'] = count
         try:
-            resp = await _query_api('user.status', params)
+            resp = await _query_api('user.status', params, parse=_make_submissions)
         except TrueApiError as e:
             if 'not found' in e.comment:
                 raise HandleNotFoundError(e.comment, handle)
             if 'should contain' in e.comment:
                 raise HandleInvalidError(e.comment, handle)
             raise
-        for submission in resp:
-            submission['problem'] = make_from_dict(Problem, submission['problem'])
-            submission['author']['members'] = [make_from_dict(Member, member)
-                                               for member in submission['author']['members']]
-            submission['author'] = make_from_dict(Party, submission['author'])
-        return [make_from_dict(Submission, submission_dict) for submission_dict in resp]
+        return list(resp)
 
 async def resolve_redirect(handle):
     url = 'http://codeforces.com/profile/' + handle
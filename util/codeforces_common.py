@@ -1,3 +1,4 @@
+import asyncio
 import functools
 import json
 import logging
@@ -8,12 +9,15 @@ from collections import defaultdict
 import itertools
 from discord.ext import commands
 import discord
+import numpy as np
 
 import TLEconstants
 from util import cache_system2
 from util import codeforces_api as cf
 from util import db
 from util import events
+from util import loop_monitor
+from util.submission_frame import SubmissionFrame
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +49,7 @@ async def initialize(nodb):
         # when it reconnects.
         return
 
+    loop_monitor.monitor.start()
     await cf.initialize()
 
     if nodb:
@@ -53,7 +58,7 @@ async def initialize(nodb):
         user_db = db.UserDbConn(TLEconstants.USER_DB_FILE_PATH)
 
     cache_db = db.CacheDbConn(TLEconstants.CACHE_DB_FILE_PATH)
-    cache2 = cache_system2.CacheSystem(cache_db)
+    cache2 = cache_system2.CacheSystem(cache_db, TLEconstants.CACHE_SNAPSHOT_FILE_PATH)
     await cache2.run()
 
     try:
@@ -103,19 +108,46 @@ _NONSTANDARD_CONTEST_INDICATORS = [
     'marathon', 'kotlin', 'onsite', 'experimental', 'abbyy']
 
 
+def is_nonstandard_contest_name(name):
+    name = name.lower()
+    return any(string in name for string in _NONSTANDARD_CONTEST_INDICATORS)
+
 def is_nonstandard_contest(contest):
-    return any(string in contest.name.lower() for string in _NONSTANDARD_CONTEST_INDICATORS)
+    return cache2.contest_cache.is_nonstandard(contest)
 
 def is_nonstandard_problem(problem):
     return (is_nonstandard_contest(cache2.contest_cache.get_contest(problem.contestId)) or
-            problem.tag_matches(['*special']))
+            cache2.problem_cache.is_special(problem))
+
+
+_FETCH_CONCURRENCY = 4
+
+
+async def fetch_for_handles(fetch, handles, *, limit=_FETCH_CONCURRENCY):
+    """Awaits `fetch(handle)` for each handle, with at most `limit` in progress at once, and
+    returns the results in the order of the handles. Requests made by the fetches still wait on
+    the API rate limiter, at the priority of the caller. If any fetch fails, the error of the
+    first failing handle is raised once the other fetches are done.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def fetch_one(handle):
+        async with semaphore:
+            return await fetch(handle)
+
+    results = await asyncio.gather(*(fetch_one(handle) for handle in handles),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
 
 
 async def get_visited_contests(handles : [str]):
     """ Returns a set of contest ids of contests that any of the given handles
         has at least one non-CE submission.
     """
-    user_submissions = [await cf.user.status(handle=handle) for handle in handles]
+    user_submissions = await fetch_for_handles(cache2.user_history_cache.get_submissions, handles)
     problem_to_contests = cache2.problemset_cache.problem_to_contests
 
     contest_ids = []
@@ -222,7 +254,7 @@ async def resolve_handles(ctx, converter, handles, *, mincnt=1, maxcnt=5, defaul
     if '+server' in handles:
         handles.remove('+server')
         guild_handles = {handle for discord_id, handle
-                            in user_db.get_handles_for_guild(ctx.guild.id)}
+                            in await user_db.get_handles_for_guild(ctx.guild.id)}
         handles.update(guild_handles)
     if len(handles) < mincnt or (maxcnt and maxcnt < len(handles)):
         raise HandleCountOutOfBoundsError(mincnt, maxcnt)
@@ -235,7 +267,7 @@ async def resolve_handles(ctx, converter, handles, *, mincnt=1, maxcnt=5, defaul
                 member = await converter.convert(ctx, member_identifier)
             except commands.errors.CommandError:
                 raise FindMemberFailedError(member_identifier)
-            handle = user_db.get_handle(member.id, ctx.guild.id)
+            handle = await user_db.get_handle(member.id, ctx.guild.id)
             if handle is None:
                 raise HandleNotRegisteredError(member)
         if handle in HandleIsVjudgeError.HANDLES:
@@ -243,10 +275,10 @@ async def resolve_handles(ctx, converter, handles, *, mincnt=1, maxcnt=5, defaul
         resolved_handles.append(handle)
     return resolved_handles
 
-def members_to_handles(members: [discord.Member], guild_id):
+async def members_to_handles(members: [discord.Member], guild_id):
     handles = []
     for member in members:
-        handle = user_db.get_handle(member.id, guild_id)
+        handle = await user_db.get_handle(member.id, guild_id)
         if handle is None:
             raise HandleNotRegisteredError(member)
         handles.append(handle)
@@ -332,49 +364,75 @@ class SubFilter:
         self.types = self.types or ['CONTESTANT', 'OUT_OF_COMPETITION', 'VIRTUAL', 'PRACTICE']
         return rest
 
+    @staticmethod
+    def _first_solves(frame):
+        """Returns the positions of the first accepted submission of each problem, in order of
+        submission time.
+        """
+        contest_by_id = cache2.contest_cache.contest_by_id
+
+        def start_time(contest_id):
+            contest = contest_by_id.get(contest_id)
+            return contest.startTimeSeconds if contest else 0
+
+        # Assume (name, contest start time) is a unique identifier for problems
+        _, start_code = np.unique(frame.by_contest(start_time, dtype=np.int64),
+                                  return_inverse=True)
+        problem_key = frame.name_code * (start_code.max(initial=0) + 1) + start_code
+        order = np.argsort(frame.creation_time, kind='stable')
+        order = order[frame.accepted[order]]
+        _, first = np.unique(problem_key[order], return_index=True)
+        return order[np.sort(first)]
+
     @staticmethod
     def filter_solved(submissions):
         """Filters and keeps only solved submissions. If a problem is solved multiple times the first
         accepted submission is kept. The unique id for a problem is (problem name, contest start time).
         """
-        submissions.sort(key=lambda sub: sub.creationTimeSeconds)
-        problems = set()
-        solved_subs = []
-
-        for submission in submissions:
-            problem = submission.problem
-            contest = cache2.contest_cache.contest_by_id.get(problem.contestId, None)
-            if submission.verdict == 'OK':
-                # Assume (name, contest start time) is a unique identifier for problems
-                problem_key = (problem.name, contest.startTimeSeconds if contest else 0)
-                if problem_key not in problems:
-                    solved_subs.append(submission)
-                    problems.add(problem_key)
-        return solved_subs
+        frame = SubmissionFrame(submissions)
+        return frame.take(SubFilter._first_solves(frame))
+
+    def _mask(self, frame):
+        """Returns which submissions of the frame meet the criteria other than being solved."""
+        contest_by_id = cache2.contest_cache.contest_by_id
+        in_cache = frame.by_contest(lambda contest_id: contest_id in contest_by_id)
+        mask = frame.code_mask(frame.participant_type_code, frame.participant_types, self.types)
+        mask &= (self.dlo <= frame.creation_time) & (frame.creation_time < self.dhi)
+        if self.tags:
+            mask &= frame.tag_mask(self.tags)
+        if self.indices:
+            mask &= frame.code_mask(frame.index_code, frame.indices,
+                                    [index.lower() for index in self.indices])
+        if self.contests:
+            mask &= frame.by_contest(lambda contest_id: contest_id in contest_by_id and
+                                     contest_by_id[contest_id].matches(self.contests))
+        if not self.team:
+            mask &= frame.team_size == 1
+
+        nonstandard = frame.by_contest(lambda contest_id: contest_id in contest_by_id and
+                                       is_nonstandard_contest(contest_by_id[contest_id]))
+        nonstandard |= frame.tag_mask(['*special'])
+        gym = frame.contest_id >= cf.GYM_ID_THRESHOLD
+        if self.rated:
+            mask &= in_cache & ~gym & ~nonstandard
+            # NaN ratings of unrated problems compare false.
+            mask &= (self.rlo <= frame.rating) & (frame.rating <= self.rhi)
+        else:
+            # acmsguru and gym allowed
+            mask &= ~in_cache | gym | ~nonstandard
+        return mask
 
     def filter_subs(self, submissions):
-        submissions = SubFilter.filter_solved(submissions)
-        filtered_subs = []
-        for submission in submissions:
-            problem = submission.problem
-            contest = cache2.contest_cache.contest_by_id.get(problem.contestId, None)
-            type_ok = submission.author.participantType in self.types
-            date_ok = self.dlo <= submission.creationTimeSeconds < self.dhi
-            tag_ok = not self.tags or problem.tag_matches(self.tags)
-            index_ok = not self.indices or any(index.lower() == problem.index.lower() for index in self.indices)
-            contest_ok = not self.contests or (contest and contest.matches(self.contests))
-            team_ok = self.team or len(submission.author.members) == 1
-            if self.rated:
-                problem_ok = contest and contest.id < cf.GYM_ID_THRESHOLD and not is_nonstandard_problem(problem)
-                rating_ok = problem.rating and self.rlo <= problem.rating <= self.rhi
-            else:
-                # acmsguru and gym allowed
-                problem_ok = (not contest or contest.id >= cf.GYM_ID_THRESHOLD
-                              or not is_nonstandard_problem(problem))
-                rating_ok = True
-            if type_ok and date_ok and rating_ok and tag_ok and team_ok and problem_ok and contest_ok and index_ok:
-                filtered_subs.append(submission)
-        return filtered_subs
+        """Filters a list of submissions or a `SubmissionFrame`, returning the list of the first
+        accepted submissions of the problems that meet the criteria, oldest first.
+        """
+        if isinstance(submissions, SubmissionFrame):
+            frame = submissions
+        else:
+            frame = SubmissionFrame(submissions)
+        positions = SubFilter._first_solves(frame)
+        positions = positions[self._mask(frame)[positions]]
+        return frame.take(positions)
 
     def filter_rating_changes(self, rating_changes):
         rating_changes = [change for change in rating_changes
@@ -1,14 +1,23 @@
 import json
-import sqlite3
+from collections import defaultdict
 
 from util import codeforces_api as cf
+from util import paginator
+from util.db import pool
+
+# Stays below the default SQLite limit on the number of parameters of a query.
+_MAX_QUERY_PARAMS = 900
 
 
 class CacheDbConn:
     def __init__(self, db_file):
-        self.conn = sqlite3.connect(db_file)
+        self.pool = pool.ConnectionPool(db_file, name='cache')
         self.create_tables()
 
+    @property
+    def conn(self):
+        return self.pool.conn
+
     def create_tables(self):
         # Table for contests from the contest.list endpoint.
         self.conn.execute(
@@ -39,6 +48,18 @@ class CacheDbConn:
             ')'
         )
 
+        # Tags of the problems in table problem, one row per tag. Column tags of table problem
+        # is only read to move the tags of problems saved before this table existed.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS problem_tag ('
+            'problem_name     TEXT NOT NULL,'
+            'tag              TEXT NOT NULL,'
+            'PRIMARY KEY (problem_name, tag)'
+            ')'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_problem_tag_tag '
+                          'ON problem_tag (tag)')
+
         # Table for rating changes fetched from contest.ratingChanges endpoint for every contest.
         self.conn.execute(
             'CREATE TABLE IF NOT EXISTS rating_change ('
@@ -56,6 +77,21 @@ class CacheDbConn:
         self.conn.execute('CREATE INDEX IF NOT EXISTS ix_rating_change_handle '
                           'ON rating_change (handle)')
 
+        # The rating of every handle after its latest saved rating change, kept up to date with
+        # table rating_change so that it need not be scanned in full.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS latest_rating ('
+            'handle               TEXT NOT NULL,'
+            'rating               INTEGER,'
+            'rating_update_time   INTEGER,'
+            'PRIMARY KEY (handle)'
+            ')'
+        )
+        if self.conn.execute('SELECT 1 FROM latest_rating LIMIT 1').fetchone() is None:
+            # Fill it in for rating changes saved before it existed.
+            self._rebuild_latest_rating()
+            self.conn.commit()
+
         # Table for problems fetched from contest.standings endpoint for every contest.
         # This is separate from table problem as it contains the same problem twice if it
         # appeared in both Div 1 and Div 2 of some round.
@@ -75,6 +111,87 @@ class CacheDbConn:
         self.conn.execute('CREATE INDEX IF NOT EXISTS ix_problem2_contest_id '
                           'ON problem2 (contest_id)')
 
+        # Tags of the problems in table problem2, like table problem_tag.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS problem2_tag ('
+            'contest_id       INTEGER,'
+            '[index]          TEXT NOT NULL,'
+            'tag              TEXT NOT NULL,'
+            'PRIMARY KEY (contest_id, [index], tag)'
+            ')'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_problem2_tag_tag '
+                          'ON problem2_tag (tag)')
+
+        self._migrate_problem_tags()
+
+        # Table for submissions fetched from the user.status endpoint, keyed by the lowercase
+        # handle for which they were fetched.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS submission ('
+            'handle                 TEXT NOT NULL,'
+            'id                     INTEGER NOT NULL,'
+            'contest_id             INTEGER,'
+            'problem_contest_id     INTEGER,'
+            'problemset_name        TEXT,'
+            '[index]                TEXT,'
+            'problem_name           TEXT,'
+            'problem_type           TEXT,'
+            'points                 REAL,'
+            'rating                 INTEGER,'
+            'tags                   TEXT,'
+            'members                TEXT,'
+            'participant_type       TEXT,'
+            'team_id                INTEGER,'
+            'team_name              TEXT,'
+            'ghost                  INTEGER,'
+            'room                   INTEGER,'
+            'start_time             INTEGER,'
+            'programming_language   TEXT,'
+            'verdict                TEXT,'
+            'creation_time          INTEGER,'
+            'relative_time          INTEGER,'
+            'PRIMARY KEY (handle, id)'
+            ')'
+        )
+
+        # Table for rating histories fetched from the user.rating endpoint.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_rating_change ('
+            'handle               TEXT NOT NULL,'
+            'contest_id           INTEGER NOT NULL,'
+            'contest_name         TEXT,'
+            'cf_handle            TEXT,'
+            'rank                 INTEGER,'
+            'rating_update_time   INTEGER,'
+            'old_rating           INTEGER,'
+            'new_rating           INTEGER,'
+            'UNIQUE (handle, contest_id)'
+            ')'
+        )
+
+        # Status of each contest in long running jobs that fetch data for many contests, so that
+        # an interrupted job can be resumed.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS contest_job ('
+            'job          TEXT NOT NULL,'
+            'contest_id   INTEGER NOT NULL,'
+            'status       TEXT NOT NULL,'
+            'PRIMARY KEY (job, contest_id)'
+            ')'
+        )
+
+        # Last time the data of some kind was fetched for a handle.
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_fetch_time ('
+            'handle       TEXT NOT NULL,'
+            'kind         TEXT NOT NULL,'
+            'fetch_time   INTEGER,'
+            'PRIMARY KEY (handle, kind)'
+            ')'
+        )
+
+    @pool.write
     def cache_contests(self, contests):
         query = ('INSERT OR REPLACE INTO contest '
                  '(id, name, start_time, duration, type, phase, prepared_by) '
@@ -83,37 +200,92 @@ class CacheDbConn:
         self.conn.commit()
         return rc
 
+    @pool.read
     def fetch_contests(self):
         query = ('SELECT id, name, start_time, duration, type, phase, prepared_by '
                  'FROM contest')
         res = self.conn.execute(query).fetchall()
         return [cf.Contest._make(contest) for contest in res]
 
+    def _migrate_problem_tags(self):
+        """Moves tags saved as JSON in column tags of tables problem and problem2 to tables
+        problem_tag and problem2_tag.
+        """
+        res = self.conn.execute('SELECT name, tags FROM problem WHERE tags IS NOT NULL')
+        rows = [(name, tag) for name, tags in res for tag in json.loads(tags)]
+        self.conn.executemany('INSERT OR IGNORE INTO problem_tag (problem_name, tag) '
+                              'VALUES (?, ?)', rows)
+        self.conn.execute('UPDATE problem SET tags = NULL WHERE tags IS NOT NULL')
+        res = self.conn.execute('SELECT contest_id, [index], tags '
+                                'FROM problem2 WHERE tags IS NOT NULL')
+        rows = [(contest_id, index, tag) for contest_id, index, tags in res
+                for tag in json.loads(tags)]
+        self.conn.executemany('INSERT OR IGNORE INTO problem2_tag (contest_id, [index], tag) '
+                              'VALUES (?, ?, ?)', rows)
+        self.conn.execute('UPDATE problem2 SET tags = NULL WHERE tags IS NOT NULL')
+        self.conn.commit()
+
     @staticmethod
-    def _squish_tags(problem):
+    def _problem_row(problem):
         return (problem.contestId, problem.problemsetName, problem.index, problem.name,
-                problem.type, problem.points, problem.rating, json.dumps(problem.tags))
+                problem.type, problem.points, problem.rating)
+
+    def _fetch_tags(self, query, params=()):
+        """Returns the tags by problem from a query of rows of the columns identifying the
+        problem followed by a tag.
+        """
+        tags_by_problem = defaultdict(list)
+        for *key, tag in self.conn.execute(query, params):
+            tags_by_problem[tuple(key)].append(tag)
+        return tags_by_problem
 
+    @pool.write
     def cache_problems(self, problems):
         query = ('INSERT OR REPLACE INTO problem '
-                 '(contest_id, problemset_name, [index], name, type, points, rating, tags) '
-                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
-        rc = self.conn.executemany(query, list(map(self._squish_tags, problems))).rowcount
+                 '(contest_id, problemset_name, [index], name, type, points, rating) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)')
+        rc = self.conn.executemany(query, list(map(self._problem_row, problems))).rowcount
+        self.conn.executemany('DELETE FROM problem_tag WHERE problem_name = ?',
+                              [(problem.name,) for problem in problems])
+        self.conn.executemany('INSERT OR IGNORE INTO problem_tag (problem_name, tag) '
+                              'VALUES (?, ?)',
+                              [(problem.name, tag) for problem in problems
+                               for tag in problem.tags])
         self.conn.commit()
         return rc
 
-    @staticmethod
-    def _unsquish_tags(problem):
-        args, tags = problem[:-1], json.loads(problem[-1])
-        return cf.Problem(*args, tags)
-
+    @pool.read
     def fetch_problems(self):
-        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating, tags '
+        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating '
                  'FROM problem')
         res = self.conn.execute(query).fetchall()
-        return list(map(self._unsquish_tags, res))
+        tags_by_problem = self._fetch_tags('SELECT problem_name, tag FROM problem_tag '
+                                           'ORDER BY rowid')
+        return [cf.Problem(*row, tags_by_problem.get((row[3],), [])) for row in res]
 
+    @pool.write
     def save_rating_changes(self, changes):
+        rc = self._insert_rating_changes(changes)
+        self.conn.commit()
+        return rc
+
+    @pool.write
+    def replace_contest_rating_changes(self, contest_id, changes, *, job=None):
+        """Replaces the saved rating changes of the contest with the given ones in one
+        transaction, marking the contest done in the job if one is given.
+        """
+        handles = {handle for handle, in self.conn.execute(
+            'SELECT handle FROM rating_change WHERE contest_id = ?', (contest_id,))}
+        self.conn.execute('DELETE FROM rating_change WHERE contest_id = ?', (contest_id,))
+        rc = self._insert_rating_changes(changes)
+        # The latest ratings of handles that had old changes may have come from those.
+        self._rebuild_latest_rating(handles)
+        if job is not None:
+            self._set_contest_job_status(job, [contest_id], 'done')
+        self.conn.commit()
+        return rc
+
+    def _insert_rating_changes(self, changes):
         change_tuples = [(change.contestId,
                           change.handle,
                           change.rank,
@@ -124,18 +296,50 @@ class CacheDbConn:
                  '(contest_id, handle, rank, rating_update_time, old_rating, new_rating) '
                  'VALUES (?, ?, ?, ?, ?, ?)')
         rc = self.conn.executemany(query, change_tuples).rowcount
-        self.conn.commit()
+        query = ('INSERT INTO latest_rating (handle, rating, rating_update_time) '
+                 'VALUES (?, ?, ?) '
+                 'ON CONFLICT (handle) DO UPDATE '
+                 'SET rating = excluded.rating, rating_update_time = excluded.rating_update_time '
+                 'WHERE excluded.rating_update_time >= latest_rating.rating_update_time')
+        self.conn.executemany(query, [(handle, new_rating, update_time)
+                                      for _, handle, _, update_time, _, new_rating
+                                      in sorted(change_tuples, key=lambda change: change[3])])
         return rc
 
+    @pool.write
     def clear_rating_changes(self, contest_id=None):
         if contest_id is None:
             query = 'DELETE FROM rating_change'
             self.conn.execute(query)
+            self.conn.execute('DELETE FROM latest_rating')
         else:
             query = 'DELETE FROM rating_change WHERE contest_id = ?'
+            handles = [handle for handle, in self.conn.execute(
+                'SELECT handle FROM rating_change WHERE contest_id = ?', (contest_id,))]
             self.conn.execute(query, (contest_id,))
+            self._rebuild_latest_rating(handles)
         self.conn.commit()
 
+    def _rebuild_latest_rating(self, handles=None):
+        """Recompute the latest ratings of the given handles, or of all handles, from table
+        rating_change.
+        """
+        # With MAX, SQLite takes the other columns from the row holding the maximum.
+        select = ('SELECT handle, new_rating, MAX(rating_update_time) '
+                  'FROM rating_change ')
+        if handles is None:
+            self.conn.execute('DELETE FROM latest_rating')
+            self.conn.execute('INSERT INTO latest_rating (handle, rating, rating_update_time) ' +
+                              select + 'GROUP BY handle')
+            return
+        for chunk in paginator.chunkify(list(handles), _MAX_QUERY_PARAMS):
+            placeholders = ', '.join('?' * len(chunk))
+            self.conn.execute(f'DELETE FROM latest_rating WHERE handle IN ({placeholders})',
+                              chunk)
+            self.conn.execute('INSERT INTO latest_rating (handle, rating, rating_update_time) ' +
+                              select + f'WHERE handle IN ({placeholders}) GROUP BY handle', chunk)
+
+    @pool.read
     def get_users_with_more_than_n_contests(self, time_cutoff, n):
         query = ('SELECT handle, COUNT(*) AS num_contests '
                  'FROM rating_change GROUP BY handle HAVING num_contests >= ? '
@@ -143,15 +347,32 @@ class CacheDbConn:
         res = self.conn.execute(query, (n, time_cutoff,)).fetchall()
         return [user[0] for user in res]
 
+    @pool.read
     def get_all_rating_changes(self):
         query = ('SELECT contest_id, name, handle, rank, rating_update_time, old_rating, new_rating '
                  'FROM rating_change r '
                  'LEFT JOIN contest c '
                  'ON r.contest_id = c.id '
                  'ORDER BY rating_update_time')
-        res = self.conn.execute(query)
-        return (cf.RatingChange._make(change) for change in res)
+        res = self.conn.execute(query).fetchall()
+        return [cf.RatingChange._make(change) for change in res]
 
+    @pool.read
+    def get_latest_rating_by_handle(self, handles=None):
+        """Returns the rating after the latest saved rating change of the given handles, or of
+        all handles.
+        """
+        if handles is None:
+            res = self.conn.execute('SELECT handle, rating FROM latest_rating')
+            return dict(res)
+        rating_by_handle = {}
+        for chunk in paginator.chunkify(list(handles), _MAX_QUERY_PARAMS):
+            placeholders = ', '.join('?' * len(chunk))
+            query = f'SELECT handle, rating FROM latest_rating WHERE handle IN ({placeholders})'
+            rating_by_handle.update(self.conn.execute(query, chunk))
+        return rating_by_handle
+
+    @pool.read
     def get_rating_changes_for_contest(self, contest_id):
         query = ('SELECT contest_id, name, handle, rank, rating_update_time, old_rating, new_rating '
                  'FROM rating_change r '
@@ -161,13 +382,12 @@ class CacheDbConn:
         res = self.conn.execute(query, (contest_id,)).fetchall()
         return [cf.RatingChange._make(change) for change in res]
 
-    def has_rating_changes_saved(self, contest_id):
-        query = ('SELECT contest_id '
-                 'FROM rating_change '
-                 'WHERE contest_id = ?')
-        res = self.conn.execute(query, (contest_id,)).fetchone()
-        return res is not None
+    @pool.read
+    def get_contest_ids_with_rating_changes(self):
+        query = 'SELECT DISTINCT contest_id FROM rating_change'
+        return {contest_id for contest_id, in self.conn.execute(query)}
 
+    @pool.read
     def get_rating_changes_for_handle(self, handle):
         query = ('SELECT contest_id, name, handle, rank, rating_update_time, old_rating, new_rating '
                  'FROM rating_change r '
@@ -177,39 +397,231 @@ class CacheDbConn:
         res = self.conn.execute(query, (handle,)).fetchall()
         return [cf.RatingChange._make(change) for change in res]
 
+    @pool.write
     def cache_problemset(self, problemset):
         query = ('INSERT OR REPLACE INTO problem2 '
-                 '(contest_id, problemset_name, [index], name, type, points, rating, tags) '
-                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
-        rc = self.conn.executemany(query, list(map(self._squish_tags, problemset))).rowcount
+                 '(contest_id, problemset_name, [index], name, type, points, rating) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)')
+        rc = self.conn.executemany(query, list(map(self._problem_row, problemset))).rowcount
+        self.conn.executemany('DELETE FROM problem2_tag WHERE contest_id = ? AND [index] = ?',
+                              [(problem.contestId, problem.index) for problem in problemset])
+        self.conn.executemany('INSERT OR IGNORE INTO problem2_tag (contest_id, [index], tag) '
+                              'VALUES (?, ?, ?)',
+                              [(problem.contestId, problem.index, tag) for problem in problemset
+                               for tag in problem.tags])
         self.conn.commit()
         return rc
 
+    def _delete_problemsets(self, contest_ids):
+        for chunk in paginator.chunkify(list(contest_ids), _MAX_QUERY_PARAMS):
+            placeholders = ', '.join('?' * len(chunk))
+            self.conn.execute(f'DELETE FROM problem2 WHERE contest_id IN ({placeholders})', chunk)
+            self.conn.execute(f'DELETE FROM problem2_tag WHERE contest_id IN ({placeholders})',
+                              chunk)
+
+    @pool.write
+    def replace_problemsets(self, contest_ids, problems, *, job=None):
+        """Replaces the saved problemsets of the contests with the given problems in one
+        transaction, marking the contests done in the job if one is given.
+        """
+        self._delete_problemsets(contest_ids)
+        query = ('INSERT OR REPLACE INTO problem2 '
+                 '(contest_id, problemset_name, [index], name, type, points, rating) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)')
+        rc = self.conn.executemany(query, list(map(self._problem_row, problems))).rowcount
+        self.conn.executemany('INSERT OR IGNORE INTO problem2_tag (contest_id, [index], tag) '
+                              'VALUES (?, ?, ?)',
+                              [(problem.contestId, problem.index, tag) for problem in problems
+                               for tag in problem.tags])
+        if job is not None:
+            self._set_contest_job_status(job, contest_ids, 'done')
+        self.conn.commit()
+        return rc
+
+    @pool.read
+    def get_problemset_contest_ids(self):
+        query = 'SELECT DISTINCT contest_id FROM problem2'
+        return {contest_id for contest_id, in self.conn.execute(query)}
+
+    @pool.read
+    def get_incomplete_problemsets(self):
+        """Returns the indices of the rated problems of each contest whose saved problemset has
+        some unrated problem.
+        """
+        query = ('SELECT contest_id, [index], rating '
+                 'FROM problem2 '
+                 'WHERE contest_id IN ('
+                 '    SELECT contest_id FROM problem2 '
+                 '    GROUP BY contest_id HAVING COUNT(rating) < COUNT(*)'
+                 ')')
+        rated_indices_by_contest = defaultdict(set)
+        for contest_id, index, rating in self.conn.execute(query):
+            rated_indices = rated_indices_by_contest[contest_id]
+            if rating is not None:
+                rated_indices.add(index)
+        return dict(rated_indices_by_contest)
+
+    @pool.read
     def fetch_problems2(self):
-        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating, tags '
+        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating '
                  'FROM problem2 ')
         res = self.conn.execute(query).fetchall()
-        return list(map(self._unsquish_tags, res))
+        tags_by_problem = self._fetch_tags('SELECT contest_id, [index], tag FROM problem2_tag '
+                                           'ORDER BY rowid')
+        return [cf.Problem(*row, tags_by_problem.get((row[0], row[2]), [])) for row in res]
 
+    @pool.write
     def clear_problemset(self, contest_id=None):
         if contest_id is None:
             query = 'DELETE FROM problem2'
             self.conn.execute(query)
+            self.conn.execute('DELETE FROM problem2_tag')
         else:
             query = 'DELETE FROM problem2 WHERE contest_id = ?'
             self.conn.execute(query, (contest_id,))
+            self.conn.execute('DELETE FROM problem2_tag WHERE contest_id = ?', (contest_id,))
 
+    @pool.read
     def fetch_problemset(self, contest_id):
-        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating, tags '
+        query = ('SELECT contest_id, problemset_name, [index], name, type, points, rating '
                  'FROM problem2 '
                  'WHERE contest_id = ?')
         res = self.conn.execute(query, (contest_id,)).fetchall()
-        return list(map(self._unsquish_tags, res))
+        tags_by_problem = self._fetch_tags('SELECT contest_id, [index], tag FROM problem2_tag '
+                                           'WHERE contest_id = ? ORDER BY rowid', (contest_id,))
+        return [cf.Problem(*row, tags_by_problem.get((row[0], row[2]), [])) for row in res]
 
+    @pool.read
     def problemset_empty(self):
         query = 'SELECT 1 FROM problem2'
         res = self.conn.execute(query).fetchone()
         return res is None
 
+    @staticmethod
+    def _squish_submission(handle, submission):
+        problem, author = submission.problem, submission.author
+        members = json.dumps([member.handle for member in author.members])
+        ghost = None if author.ghost is None else int(author.ghost)
+        return (handle, submission.id, submission.contestId, problem.contestId,
+                problem.problemsetName, problem.index, problem.name, problem.type, problem.points,
+                problem.rating, json.dumps(problem.tags), members, author.participantType,
+                author.teamId, author.teamName, ghost, author.room, author.startTimeSeconds,
+                submission.programmingLanguage, submission.verdict,
+                submission.creationTimeSeconds, submission.relativeTimeSeconds)
+
+    @staticmethod
+    def _unsquish_submission(row):
+        (id_, contest_id, problem_contest_id, problemset_name, index, problem_name, problem_type,
+         points, rating, tags, members, participant_type, team_id, team_name, ghost, room,
+         start_time, programming_language, verdict, creation_time, relative_time) = row
+        problem = cf.Problem(problem_contest_id, problemset_name, index, problem_name,
+                             problem_type, points, rating, json.loads(tags))
+        members = [cf.Member(handle) for handle in json.loads(members)]
+        ghost = None if ghost is None else bool(ghost)
+        author = cf.Party(contest_id, members, participant_type, team_id, team_name, ghost, room,
+                          start_time)
+        return cf.Submission(id_, contest_id, problem, author, programming_language, verdict,
+                             creation_time, relative_time)
+
+    @pool.write
+    def save_submissions(self, handle, submissions):
+        query = ('INSERT OR REPLACE INTO submission '
+                 '(handle, id, contest_id, problem_contest_id, problemset_name, [index], '
+                 'problem_name, problem_type, points, rating, tags, members, participant_type, '
+                 'team_id, team_name, ghost, room, start_time, programming_language, verdict, '
+                 'creation_time, relative_time) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+        rows = [self._squish_submission(handle, submission) for submission in submissions]
+        rc = self.conn.executemany(query, rows).rowcount
+        self.conn.commit()
+        return rc
+
+    @pool.read
+    def fetch_submissions(self, handle):
+        """Returns the saved submissions of the handle, newest first like the API."""
+        query = ('SELECT id, contest_id, problem_contest_id, problemset_name, [index], '
+                 'problem_name, problem_type, points, rating, tags, members, participant_type, '
+                 'team_id, team_name, ghost, room, start_time, programming_language, verdict, '
+                 'creation_time, relative_time '
+                 'FROM submission '
+                 'WHERE handle = ? '
+                 'ORDER BY id DESC')
+        res = self.conn.execute(query, (handle,)).fetchall()
+        return list(map(self._unsquish_submission, res))
+
+    @pool.read
+    def get_last_judged_submission_id(self, handle):
+        """Returns the greatest id among saved submissions of the handle that have been judged."""
+        query = ('SELECT MAX(id) '
+                 'FROM submission '
+                 'WHERE handle = ? AND verdict IS NOT NULL AND verdict != \'TESTING\'')
+        return self.conn.execute(query, (handle,)).fetchone()[0]
+
+    @pool.write
+    def save_user_rating_changes(self, handle, changes):
+        """Replaces the saved rating history of the handle."""
+        self.conn.execute('DELETE FROM user_rating_change WHERE handle = ?', (handle,))
+        query = ('INSERT OR REPLACE INTO user_rating_change '
+                 '(handle, contest_id, contest_name, cf_handle, rank, rating_update_time, '
+                 'old_rating, new_rating) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+        rc = self.conn.executemany(query, [(handle, *change) for change in changes]).rowcount
+        self.conn.commit()
+        return rc
+
+    @pool.read
+    def fetch_user_rating_changes(self, handle):
+        query = ('SELECT contest_id, contest_name, cf_handle, rank, rating_update_time, '
+                 'old_rating, new_rating '
+                 'FROM user_rating_change '
+                 'WHERE handle = ? '
+                 'ORDER BY rating_update_time')
+        res = self.conn.execute(query, (handle,)).fetchall()
+        return [cf.RatingChange._make(change) for change in res]
+
+    @pool.write
+    def start_contest_job(self, job, contest_ids):
+        """Replaces the contests of the job with the given ones, all pending."""
+        self.conn.execute('DELETE FROM contest_job WHERE job = ?', (job,))
+        self.conn.executemany('INSERT INTO contest_job (job, contest_id, status) '
+                              'VALUES (?, ?, ?)',
+                              [(job, contest_id, 'pending') for contest_id in contest_ids])
+        self.conn.commit()
+
+    def _set_contest_job_status(self, job, contest_ids, status):
+        self.conn.executemany('UPDATE contest_job SET status = ? WHERE job = ? AND contest_id = ?',
+                              [(status, job, contest_id) for contest_id in contest_ids])
+
+    @pool.write
+    def set_contest_job_status(self, job, contest_ids, status):
+        self._set_contest_job_status(job, contest_ids, status)
+        self.conn.commit()
+
+    @pool.read
+    def get_contest_job_statuses(self, job):
+        """Returns the status of each contest of the job."""
+        query = 'SELECT contest_id, status FROM contest_job WHERE job = ?'
+        return dict(self.conn.execute(query, (job,)))
+
+    @pool.read
+    def get_user_fetch_time(self, handle, kind):
+        query = ('SELECT fetch_time '
+                 'FROM user_fetch_time '
+                 'WHERE handle = ? AND kind = ?')
+        res = self.conn.execute(query, (handle, kind)).fetchone()
+        return res[0] if res else None
+
+    @pool.write
+    def set_user_fetch_time(self, handle, kind, fetch_time):
+        query = ('INSERT OR REPLACE INTO user_fetch_time (handle, kind, fetch_time) '
+                 'VALUES (?, ?, ?)')
+        self.conn.execute(query, (handle, kind, fetch_time))
+        self.conn.commit()
+
+    @pool.write
+    def clear_user_fetch_times(self, kind):
+        self.conn.execute('DELETE FROM user_fetch_time WHERE kind = ?', (kind,))
+        self.conn.commit()
+
     def close(self):
-        self.conn.close()
+        self.pool.close()
@@ -0,0 +1,131 @@
+import asyncio
+import bisect
+import functools
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bounds in seconds of the buckets of the query latency histograms.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float('inf'))
+
+QueryLatencyStats = namedtuple('QueryLatencyStats',
+                               'database query count total_latency p50_latency p95_latency '
+                               'max_latency histogram')
+
+
+class _LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the `q` quantile, capped at the max."""
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+
+class ConnectionPool:
+    """Connections to one SQLite database, used from worker threads so that queries do not block
+    the event loop. Writes are serialized on a single writer thread and connection, and reads are
+    spread over a pool of read-only connections. The database is in WAL mode, so reads go ahead
+    while a write is in progress.
+    """
+
+    def __init__(self, db_file, *, name, readers=4, row_factory=None):
+        self.name = name
+        self.row_factory = row_factory
+        self.latency = defaultdict(_LatencyHistogram)
+        self._local = threading.local()
+        self._reader_conns = []
+
+        self.writer_conn = self._connect(db_file)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{name}-db-writer',
+                                          initializer=self._set_conn,
+                                          initargs=(self.writer_conn,))
+        if str(db_file) == ':memory:':
+            # Other connections would open different databases.
+            self._readers = self._writer
+        else:
+            self.writer_conn.execute('PRAGMA journal_mode = WAL')
+            self._readers = ThreadPoolExecutor(max_workers=readers,
+                                               thread_name_prefix=f'{name}-db-reader',
+                                               initializer=self._open_reader, initargs=(db_file,))
+
+    @property
+    def conn(self):
+        """The connection of the current thread. The writer's, outside of reader threads."""
+        return getattr(self._local, 'conn', self.writer_conn)
+
+    def _connect(self, db_file):
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        conn.row_factory = self.row_factory
+        return conn
+
+    def _set_conn(self, conn):
+        self._local.conn = conn
+
+    def _open_reader(self, db_file):
+        conn = self._connect(db_file)
+        conn.execute('PRAGMA query_only = ON')
+        self._reader_conns.append(conn)
+        self._set_conn(conn)
+
+    async def read(self, query, fn, *args, **kwargs):
+        return await self._run(self._readers, query, fn, *args, **kwargs)
+
+    async def write(self, query, fn, *args, **kwargs):
+        return await self._run(self._writer, query, fn, *args, **kwargs)
+
+    async def _run(self, executor, query, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        begin = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            # Includes the time spent waiting for a free connection, as the caller sees it.
+            self.latency[query].add(time.perf_counter() - begin)
+
+    def get_latency_stats(self):
+        return [QueryLatencyStats(self.name, query, hist.count, hist.total, hist.quantile(0.5),
+                                  hist.quantile(0.95), hist.max, list(hist.counts))
+                for query, hist in self.latency.items()]
+
+    def close(self):
+        self._writer.shutdown()
+        if self._readers is not self._writer:
+            self._readers.shutdown()
+        for conn in self._reader_conns:
+            conn.close()
+        self.writer_conn.close()
+
+
+def read(method):
+    """Makes a method of a class with a `pool` run on a reader thread. The method becomes a
+    coroutine, and its latency is recorded under its name.
+    """
+    @functools.wraps(method)
+    async def wrapped(self, *args, **kwargs):
+        return await self.pool.read(method.__name__, method, self, *args, **kwargs)
+    return wrapped
+
+
+def write(method):
+    """Like `read`, but runs the method on the writer thread."""
+    @functools.wraps(method)
+    async def wrapped(self, *args, **kwargs):
+        return await self.pool.write(method.__name__, method, self, *args, **kwargs)
+    return wrapped
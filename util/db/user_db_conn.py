@@ -1,10 +1,10 @@
-import sqlite3
 from enum import IntEnum
 from collections import namedtuple
 
 from discord.ext import commands
 
 from util import codeforces_api as cf
+from util.db import pool
 
 _DEFAULT_VC_RATING = 1500
 
@@ -62,10 +62,13 @@ def namedtuple_factory(cursor, row):
 
 class UserDbConn:
     def __init__(self, dbfile):
-        self.conn = sqlite3.connect(dbfile)
-        self.conn.row_factory = namedtuple_factory
+        self.pool = pool.ConnectionPool(dbfile, name='user', row_factory=namedtuple_factory)
         self.create_tables()
 
+    @property
+    def conn(self):
+        return self.pool.conn
+
     def create_tables(self):
         self.conn.execute(
             'CREATE TABLE IF NOT EXISTS user_handle ('
@@ -208,6 +211,7 @@ class UserDbConn:
         self.conn.row_factory = None
         return res
 
+    @pool.write
     def new_challenge(self, user_id, issue_time, prob, delta):
         query1 = '''
             INSERT INTO challenge
@@ -237,6 +241,7 @@ class UserDbConn:
         self.conn.commit()
         return 1
 
+    @pool.read
     def check_challenge(self, user_id):
         query1 = '''
             SELECT active_challenge_id, issue_time FROM user_challenge
@@ -253,24 +258,28 @@ class UserDbConn:
         if res is None: return None
         return c_id, issue_time, res[0], res[1], res[2], res[3]
 
+    @pool.read
     def get_gudgitters(self):
         query = '''
             SELECT user_id, score FROM user_challenge
         '''
         return self.conn.execute(query).fetchall()
 
+    @pool.read
     def howgud(self, user_id):
         query = '''
             SELECT rating_delta FROM challenge WHERE user_id = ? AND finish_time IS NOT NULL
         '''
         return self.conn.execute(query, (user_id,)).fetchall()
 
+    @pool.read
     def get_noguds(self, user_id):
         query = ('SELECT problem_name '
                  'FROM challenge '
                  f'WHERE user_id = ? AND status = {Gitgud.NOGUD}')
         return {name for name, in self.conn.execute(query, (user_id,)).fetchall()}
 
+    @pool.read
     def gitlog(self, user_id):
         query = f'''
             SELECT issue_time, finish_time, problem_name, contest_id, p_index, rating_delta, status
@@ -278,6 +287,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (user_id,)).fetchall()
 
+    @pool.write
     def complete_challenge(self, user_id, challenge_id, finish_time, delta):
         query1 = f'''
             UPDATE challenge SET finish_time = ?, status = {Gitgud.GOTGUD}
@@ -299,6 +309,7 @@ class UserDbConn:
         self.conn.commit()
         return 1
 
+    @pool.write
     def skip_challenge(self, user_id, challenge_id, status):
         query1 = '''
             UPDATE user_challenge SET active_challenge_id = NULL, issue_time = NULL
@@ -318,6 +329,7 @@ class UserDbConn:
         self.conn.commit()
         return 1
 
+    @pool.write
     def cache_cf_user(self, user):
         query = ('INSERT OR REPLACE INTO cf_user_cache '
                  '(handle, first_name, last_name, country, city, organization, contribution, '
@@ -326,6 +338,7 @@ class UserDbConn:
         with self.conn:
             return self.conn.execute(query, user).rowcount
 
+    @pool.read
     def fetch_cf_user(self, handle):
         query = ('SELECT handle, first_name, last_name, country, city, organization, contribution, '
                  '    rating, maxRating, last_online_time, registration_time, friend_of_count, title_photo '
@@ -334,6 +347,7 @@ class UserDbConn:
         user = self.conn.execute(query, (handle,)).fetchone()
         return cf.User._make(user) if user else None
 
+    @pool.write
     def set_handle(self, user_id, guild_id, handle):
         query = ('SELECT user_id '
                  'FROM user_handle '
@@ -348,6 +362,7 @@ class UserDbConn:
         with self.conn:
             return self.conn.execute(query, (user_id, guild_id, handle)).rowcount
 
+    @pool.write
     def set_inactive(self, guild_id_user_id_pairs):
         query = ('UPDATE user_handle '
                  'SET active = 0 '
@@ -355,6 +370,7 @@ class UserDbConn:
         with self.conn:
             return self.conn.executemany(query, guild_id_user_id_pairs).rowcount
 
+    @pool.read
     def get_handle(self, user_id, guild_id):
         query = ('SELECT handle '
                  'FROM user_handle '
@@ -362,6 +378,7 @@ class UserDbConn:
         res = self.conn.execute(query, (user_id, guild_id)).fetchone()
         return res[0] if res else None
 
+    @pool.read
     def get_user_id(self, handle, guild_id):
         query = ('SELECT user_id '
                  'FROM user_handle '
@@ -369,12 +386,14 @@ class UserDbConn:
         res = self.conn.execute(query, (handle, guild_id)).fetchone()
         return int(res[0]) if res else None
 
+    @pool.write
     def remove_handle(self, user_id, guild_id):
         query = ('DELETE FROM user_handle '
                  'WHERE user_id = ? AND guild_id = ?')
         with self.conn:
             return self.conn.execute(query, (user_id, guild_id)).rowcount
 
+    @pool.read
     def get_handles_for_guild(self, guild_id):
         query = ('SELECT user_id, handle '
                  'FROM user_handle '
@@ -382,6 +401,7 @@ class UserDbConn:
         res = self.conn.execute(query, (guild_id,)).fetchall()
         return [(int(user_id), handle) for user_id, handle in res]
 
+    @pool.read
     def get_cf_users_for_guild(self, guild_id):
         query = ('SELECT u.user_id, c.handle, c.first_name, c.last_name, c.country, c.city, '
                  '    c.organization, c.contribution, c.rating, c.maxRating, c.last_online_time, '
@@ -393,6 +413,7 @@ class UserDbConn:
         res = self.conn.execute(query, (guild_id,)).fetchall()
         return [(int(t[0]), cf.User._make(t[1:])) for t in res]
 
+    @pool.read
     def get_reminder_settings(self, guild_id):
         query = '''
             SELECT channel_id, role_id, before
@@ -401,6 +422,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (guild_id,)).fetchone()
 
+    @pool.write
     def set_reminder_settings(self, guild_id, channel_id, role_id, before):
         query = '''
             INSERT OR REPLACE INTO reminder (guild_id, channel_id, role_id, before)
@@ -409,17 +431,20 @@ class UserDbConn:
         self.conn.execute(query, (guild_id, channel_id, role_id, before))
         self.conn.commit()
 
+    @pool.write
     def clear_reminder_settings(self, guild_id):
         query = '''DELETE FROM reminder WHERE guild_id = ?'''
         self.conn.execute(query, (guild_id,))
         self.conn.commit()
 
+    @pool.read
     def get_starboard(self, guild_id):
         query = ('SELECT channel_id '
                  'FROM starboard '
                  'WHERE guild_id = ?')
         return self.conn.execute(query, (guild_id,)).fetchone()
 
+    @pool.write
     def set_starboard(self, guild_id, channel_id):
         query = ('INSERT OR REPLACE INTO starboard '
                  '(guild_id, channel_id) '
@@ -427,12 +452,14 @@ class UserDbConn:
         self.conn.execute(query, (guild_id, channel_id))
         self.conn.commit()
 
+    @pool.write
     def clear_starboard(self, guild_id):
         query = ('DELETE FROM starboard '
                  'WHERE guild_id = ?')
         self.conn.execute(query, (guild_id,))
         self.conn.commit()
 
+    @pool.write
     def add_starboard_message(self, original_msg_id, starboard_msg_id, guild_id):
         query = ('INSERT INTO starboard_message '
                  '(original_msg_id, starboard_msg_id, guild_id) '
@@ -440,6 +467,7 @@ class UserDbConn:
         self.conn.execute(query, (original_msg_id, starboard_msg_id, guild_id))
         self.conn.commit()
 
+    @pool.read
     def check_exists_starboard_message(self, original_msg_id):
         query = ('SELECT 1 '
                  'FROM starboard_message '
@@ -447,6 +475,7 @@ class UserDbConn:
         res = self.conn.execute(query, (original_msg_id,)).fetchone()
         return res is not None
 
+    @pool.write
     def remove_starboard_message(self, *, original_msg_id=None, starboard_msg_id=None):
         assert (original_msg_id is None) ^ (starboard_msg_id is None)
         if original_msg_id is not None:
@@ -460,6 +489,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.write
     def clear_starboard_messages_for_guild(self, guild_id):
         query = ('DELETE FROM starboard_message '
                  'WHERE guild_id = ?')
@@ -467,6 +497,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.read
     def check_duel_challenge(self, userid):
         query = f'''
             SELECT id FROM duel
@@ -474,6 +505,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()
 
+    @pool.read
     def check_duel_accept(self, challengee):
         query = f'''
             SELECT id, challenger, problem_name FROM duel
@@ -481,6 +513,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (challengee,)).fetchone()
 
+    @pool.read
     def check_duel_decline(self, challengee):
         query = f'''
             SELECT id, challenger FROM duel
@@ -488,6 +521,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (challengee,)).fetchone()
 
+    @pool.read
     def check_duel_withdraw(self, challenger):
         query = f'''
             SELECT id, challengee FROM duel
@@ -495,6 +529,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (challenger,)).fetchone()
 
+    @pool.read
     def check_duel_draw(self, userid):
         query = f'''
             SELECT id, challenger, challengee, start_time, type FROM duel
@@ -502,6 +537,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()
 
+    @pool.read
     def check_duel_complete(self, userid):
         query = f'''
             SELECT id, challenger, challengee, start_time, problem_name, contest_id, p_index, type FROM duel
@@ -509,6 +545,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()
 
+    @pool.write
     def create_duel(self, challenger, challengee, issue_time, prob, dtype):
         query = f'''
             INSERT INTO duel (challenger, challengee, issue_time, problem_name, contest_id, p_index, status, type) VALUES (?, ?, ?, ?, ?, ?, {Duel.PENDING}, ?)
@@ -517,6 +554,7 @@ class UserDbConn:
         self.conn.commit()
         return duelid
 
+    @pool.write
     def cancel_duel(self, duelid, status):
         query = f'''
             UPDATE duel SET status = ? WHERE id = ? AND status = {Duel.PENDING}
@@ -528,6 +566,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.write
     def invalidate_duel(self, duelid):
         query = f'''
             UPDATE duel SET status = {Duel.INVALID} WHERE id = ? AND status = {Duel.ONGOING}
@@ -539,6 +578,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.write
     def start_duel(self, duelid, start_time):
         query = f'''
             UPDATE duel SET start_time = ?, status = {Duel.ONGOING}
@@ -551,6 +591,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.write
     def complete_duel(self, duelid, winner, finish_time, winner_id = -1, loser_id = -1, delta = 0, dtype = DuelType.OFFICIAL):
         query = f'''
             UPDATE duel SET status = {Duel.COMPLETE}, finish_time = ?, winner = ? WHERE id = ? AND status = {Duel.ONGOING}
@@ -561,13 +602,17 @@ class UserDbConn:
             return 0
 
         if dtype == DuelType.OFFICIAL:
-            self.update_duel_rating(winner_id, +delta)
-            self.update_duel_rating(loser_id, -delta)
+            self._update_duel_rating(winner_id, +delta)
+            self._update_duel_rating(loser_id, -delta)
 
         self.conn.commit()
         return 1
 
+    @pool.write
     def update_duel_rating(self, userid, delta):
+        return self._update_duel_rating(userid, delta)
+
+    def _update_duel_rating(self, userid, delta):
         query = '''
             UPDATE duelist SET rating = rating + ? WHERE user_id = ?
         '''
@@ -575,6 +620,7 @@ class UserDbConn:
         self.conn.commit()
         return rc
 
+    @pool.read
     def get_duel_wins(self, userid):
         query = f'''
             SELECT start_time, finish_time, problem_name, challenger, challengee FROM duel
@@ -582,18 +628,21 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid, userid)).fetchall()
 
+    @pool.read
     def get_duels(self, userid):
         query = f'''
             SELECT id, start_time, finish_time, problem_name, challenger, challengee, winner FROM duel WHERE (challengee = ? OR challenger = ?) AND status == {Duel.COMPLETE} ORDER BY start_time DESC
         '''
         return self.conn.execute(query, (userid, userid)).fetchall()
 
+    @pool.read
     def get_duel_problem_names(self, userid):
         query = f'''
             SELECT problem_name FROM duel WHERE (challengee = ? OR challenger = ?) AND (status == {Duel.COMPLETE} OR status == {Duel.INVALID})
         '''
         return self.conn.execute(query, (userid, userid)).fetchall()
 
+    @pool.read
     def get_pair_duels(self, userid1, userid2):
         query = f'''
             SELECT id, start_time, finish_time, problem_name, challenger, challengee, winner FROM duel
@@ -601,12 +650,14 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid1, userid2, userid2, userid1)).fetchall()
 
+    @pool.read
     def get_recent_duels(self):
         query = f'''
             SELECT id, start_time, finish_time, problem_name, challenger, challengee, winner FROM duel WHERE status == {Duel.COMPLETE} ORDER BY start_time DESC LIMIT 7
         '''
         return self.conn.execute(query).fetchall()
 
+    @pool.read
     def get_ongoing_duels(self):
         query = f'''
             SELECT start_time, problem_name, challenger, challengee FROM duel
@@ -614,18 +665,21 @@ class UserDbConn:
         '''
         return self.conn.execute(query).fetchall()
 
+    @pool.read
     def get_num_duel_completed(self, userid):
         query = f'''
             SELECT COUNT(*) FROM duel WHERE (challengee = ? OR challenger = ?) AND status == {Duel.COMPLETE}
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()[0]
 
+    @pool.read
     def get_num_duel_draws(self, userid):
         query = f'''
             SELECT COUNT(*) FROM duel WHERE (challengee = ? OR challenger = ?) AND winner == {Winner.DRAW}
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()[0]
 
+    @pool.read
     def get_num_duel_losses(self, userid):
         query = f'''
             SELECT COUNT(*) FROM duel
@@ -633,30 +687,35 @@ class UserDbConn:
         '''
         return self.conn.execute(query, (userid, userid)).fetchone()[0]
 
+    @pool.read
     def get_num_duel_declined(self, userid):
         query = f'''
             SELECT COUNT(*) FROM duel WHERE challengee = ? AND status == {Duel.DECLINED}
         '''
         return self.conn.execute(query, (userid,)).fetchone()[0]
 
+    @pool.read
     def get_num_duel_rdeclined(self, userid):
         query = f'''
             SELECT COUNT(*) FROM duel WHERE challenger = ? AND status == {Duel.DECLINED}
         '''
         return self.conn.execute(query, (userid,)).fetchone()[0]
 
+    @pool.read
     def get_duel_rating(self, userid):
         query = '''
             SELECT rating FROM duelist WHERE user_id = ?
         '''
         return self.conn.execute(query, (userid,)).fetchone()[0]
 
+    @pool.read
     def is_duelist(self, userid):
         query = '''
             SELECT 1 FROM duelist WHERE user_id = ?
         '''
         return self.conn.execute(query, (userid,)).fetchone()
 
+    @pool.write
     def register_duelist(self, userid):
         query = '''
             INSERT OR IGNORE INTO duelist (user_id, rating)
@@ -665,12 +724,14 @@ class UserDbConn:
         with self.conn:
             return self.conn.execute(query, (userid,)).rowcount
 
+    @pool.read
     def get_duelists(self):
         query = '''
             SELECT user_id, rating FROM duelist ORDER BY rating DESC
         '''
         return self.conn.execute(query).fetchall()
 
+    @pool.read
     def get_complete_official_duels(self):
         query = f'''
             SELECT challenger, challengee, winner, finish_time FROM duel WHERE status={Duel.COMPLETE}
@@ -678,6 +739,7 @@ class UserDbConn:
         '''
         return self.conn.execute(query).fetchall()
 
+    @pool.read
     def get_rankup_channel(self, guild_id):
         query = ('SELECT channel_id '
                  'FROM rankup '
@@ -685,6 +747,7 @@ class UserDbConn:
         channel_id = self.conn.execute(query, (guild_id,)).fetchone()
         return int(channel_id[0]) if channel_id else None
 
+    @pool.write
     def set_rankup_channel(self, guild_id, channel_id):
         query = ('INSERT OR REPLACE INTO rankup '
                  '(guild_id, channel_id) '
@@ -692,12 +755,14 @@ class UserDbConn:
         with self.conn:
             self.conn.execute(query, (guild_id, channel_id))
 
+    @pool.write
     def clear_rankup_channel(self, guild_id):
         query = ('DELETE FROM rankup '
                  'WHERE guild_id = ?')
         with self.conn:
             return self.conn.execute(query, (guild_id,)).rowcount
 
+    @pool.write
     def enable_auto_role_update(self, guild_id):
         query = ('INSERT OR REPLACE INTO auto_role_update '
                  '(guild_id) '
@@ -705,18 +770,21 @@ class UserDbConn:
         with self.conn:
             return self.conn.execute(query, (guild_id,)).rowcount
 
+    @pool.write
     def disable_auto_role_update(self, guild_id):
         query = ('DELETE FROM auto_role_update '
                  'WHERE guild_id = ?')
         with self.conn:
             return self.conn.execute(query, (guild_id,)).rowcount
 
+    @pool.read
     def has_auto_role_update_enabled(self, guild_id):
         query = ('SELECT 1 '
                  'FROM auto_role_update '
                  'WHERE guild_id = ?')
         return self.conn.execute(query, (guild_id,)).fetchone() is not None
 
+    @pool.write
     def reset_status(self, id):
         inactive_query = '''
             UPDATE user_handle
@@ -726,6 +794,7 @@ class UserDbConn:
         self.conn.execute(inactive_query, (id,))
         self.conn.commit()
 
+    @pool.write
     def update_status(self, guild_id: str, active_ids: list):
         placeholders = ', '.join(['?'] * len(active_ids))
         if not active_ids: return 0
@@ -741,6 +810,7 @@ class UserDbConn:
 
     # Rated VC stuff
 
+    @pool.write
     def create_rated_vc(self, contest_id: int, start_time: float, finish_time: float, guild_id: str, user_ids: [str]):
         """ Creates a rated vc and returns its id.
         """
@@ -757,6 +827,7 @@ class UserDbConn:
                 self.conn.execute(query, (id, user_id))
         return id
 
+    @pool.read
     def get_rated_vc(self, vc_id: int):
         query = ('SELECT * '
                 'FROM rated_vcs '
@@ -764,6 +835,7 @@ class UserDbConn:
         vc = self._fetchone(query, params=(vc_id,), row_factory=namedtuple_factory)
         return vc
 
+    @pool.read
     def get_ongoing_rated_vc_ids(self):
         query = ('SELECT id '
                  'FROM rated_vcs '
@@ -773,6 +845,7 @@ class UserDbConn:
         vc_ids = [vc.id for vc in vcs]
         return vc_ids
 
+    @pool.read
     def get_rated_vc_user_ids(self, vc_id: int):
         query = ('SELECT user_id '
                  'FROM rated_vc_users '
@@ -782,6 +855,7 @@ class UserDbConn:
         user_ids = [user.user_id for user in users]
         return user_ids
 
+    @pool.write
     def finish_rated_vc(self, vc_id: int):
         query = ('UPDATE rated_vcs '
                 'SET status = ? '
@@ -790,6 +864,7 @@ class UserDbConn:
         with self.conn:
             self.conn.execute(query, (RatedVC.FINISHED, vc_id))
 
+    @pool.write
     def update_vc_rating(self, vc_id: int, user_id: str, rating: int):
         query = ('INSERT OR REPLACE INTO rated_vc_users '
                  '(vc_id, user_id, rating) '
@@ -798,6 +873,7 @@ class UserDbConn:
         with self.conn:
             self.conn.execute(query, (vc_id, user_id, rating))
 
+    @pool.read
     def get_vc_rating(self, user_id: str, default_if_not_exist: bool = True):
         query = ('SELECT MAX(vc_id) AS latest_vc_id, rating '
                  'FROM rated_vc_users '
@@ -810,6 +886,7 @@ class UserDbConn:
             return None
         return rating
 
+    @pool.read
     def get_vc_rating_history(self, user_id: str):
         """ Return [vc_id, rating].
         """
@@ -820,6 +897,7 @@ class UserDbConn:
         ratings = self._fetchall(query, params=(user_id,), row_factory=namedtuple_factory)
         return ratings
 
+    @pool.write
     def set_rated_vc_channel(self, guild_id, channel_id):
         query = ('INSERT OR REPLACE INTO rated_vc_settings '
                  ' (guild_id, channel_id) VALUES (?, ?)'
@@ -827,6 +905,7 @@ class UserDbConn:
         with self.conn:
             self.conn.execute(query, (guild_id, channel_id))
 
+    @pool.read
     def get_rated_vc_channel(self, guild_id):
         query = ('SELECT channel_id '
                  'FROM rated_vc_settings '
@@ -834,6 +913,7 @@ class UserDbConn:
         channel_id = self.conn.execute(query, (guild_id,)).fetchone()
         return int(channel_id[0]) if channel_id else None
 
+    @pool.write
     def remove_last_ratedvc_participation(self, user_id: str):
         query = ('SELECT MAX(vc_id) AS vc_id '
                  'FROM rated_vc_users '
@@ -846,4 +926,4 @@ class UserDbConn:
             return self.conn.execute(query, (user_id, vc_id)).rowcount
 
     def close(self):
-        self.conn.close()
+        self.pool.close()
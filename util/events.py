@@ -12,8 +12,25 @@ class Event:
 
 
 class ContestListRefresh(Event):
-    def __init__(self, contests):
+    """The contest list changed. `added` and `removed` hold contests, `changed` holds pairs of
+    old and new data of contests.
+    """
+
+    def __init__(self, contests, *, added=(), removed=(), changed=()):
         self.contests = contests
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    @property
+    def phase_changes(self):
+        return [(old, new) for old, new in self.changed if old.phase != new.phase]
+
+    @property
+    def time_changes(self):
+        return [(old, new) for old, new in self.changed
+                if (old.startTimeSeconds, old.durationSeconds) !=
+                (new.startTimeSeconds, new.durationSeconds)]
 
 
 class RatingChangesUpdate(Event):
@@ -1,14 +1,16 @@
-import os
+import asyncio
 import io
+import multiprocessing
 import discord
-import time
 import matplotlib.font_manager
 import matplotlib
 matplotlib.use('agg') # Explicitly set the backend to avoid issues
 
+import seaborn as sns
 import TLEconstants
-from matplotlib import pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import rcParams
+from matplotlib.figure import Figure
 from cycler import cycler
 
 rating_color_cycler = cycler('color', ['#5d4dff',
@@ -31,23 +33,59 @@ class StrWrap:
     def __str__(self):
         return self.string
 
-def get_current_figure_as_file():
-    filename = os.path.join(TLEconstants.TEMP_DIR, f'tempplot_{time.time()}.png')
-    plt.savefig(filename, facecolor=plt.gca().get_facecolor(), bbox_inches='tight', pad_inches=0.25)
+def set_style():
+    rcParams['figure.figsize'] = 7.0, 3.5
+    sns.set()
+    options = {
+        'axes.edgecolor': '#A0A0C5',
+        'axes.spines.top': False,
+        'axes.spines.right': False,
+    }
+    sns.set_style('darkgrid', options)
 
-    with open(filename, 'rb') as file:
-        discord_file = discord.File(io.BytesIO(file.read()), filename='plot.png')
 
-    os.remove(filename)
-    return discord_file
+# Figures are drawn in worker processes, as drawing takes long enough to stall the bot and
+# pyplot's global state is not safe to share between commands. Workers are spawned rather than
+# forked, as the bot runs threads that may hold locks at the time of a fork.
+_RENDER_WORKERS = 2
+_render_pool = None
 
-def plot_rating_bg(ranks):
-    ymin, ymax = plt.gca().get_ylim()
-    bgcolor = plt.gca().get_facecolor()
+
+def _render(draw, args, figsize):
+    fig = Figure(figsize=figsize)
+    draw(fig, *args)
+    facecolor = fig.axes[0].get_facecolor() if fig.axes else None
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', facecolor=facecolor, bbox_inches='tight', pad_inches=0.25)
+    return buffer.getvalue()
+
+
+async def render(draw, *args, figsize=None):
+    """Calls `draw(fig, *args)` on a new figure in a worker process and returns the figure as
+    PNG bytes. `draw` and the arguments must be picklable, so `draw` must be defined at module
+    level.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=_RENDER_WORKERS,
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=set_style)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_render_pool, _render, draw, args, figsize)
+
+
+async def render_as_file(draw, *args, figsize=None):
+    """Like `render`, but returns the figure as a discord.File."""
+    png = await render(draw, *args, figsize=figsize)
+    return discord.File(io.BytesIO(png), filename='plot.png')
+
+
+def plot_rating_bg(ax, ranks):
+    ymin, ymax = ax.get_ylim()
+    bgcolor = ax.get_facecolor()
     for rank in ranks:
-        plt.axhspan(rank.low, rank.high, facecolor=rank.color_graph, alpha=0.8, edgecolor=bgcolor, linewidth=0.5)
+        ax.axhspan(rank.low, rank.high, facecolor=rank.color_graph, alpha=0.8, edgecolor=bgcolor, linewidth=0.5)
 
-    locs, labels = plt.xticks()
-    for loc in locs:
-        plt.axvline(loc, color=bgcolor, linewidth=0.5)
-    plt.ylim(ymin, ymax)
+    for loc in ax.get_xticks():
+        ax.axvline(loc, color=bgcolor, linewidth=0.5)
+    ax.set_ylim(ymin, ymax)
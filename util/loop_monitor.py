@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+LoopLagStats = namedtuple('LoopLagStats', 'samples p99_lag max_lag blocks last_block_time')
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep. A late wake up means some
+    code held the loop, delaying every command and the Discord heartbeat by the same amount.
+    """
+    _RECENT_LAGS_KEPT = 1200
+
+    def __init__(self, interval=0.25, block_threshold=0.1):
+        """Lags of at least `block_threshold` seconds are counted as blocks."""
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.samples = 0
+        self.max_lag = 0.0
+        self.blocks = 0
+        self.last_block_time = None
+        self.recent_lags = deque(maxlen=self._RECENT_LAGS_KEPT)
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def get_stats(self):
+        lags = sorted(self.recent_lags)
+        p99_lag = lags[int(0.99 * (len(lags) - 1))] if lags else 0.0
+        return LoopLagStats(self.samples, p99_lag, self.max_lag, self.blocks, self.last_block_time)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            begin = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - begin - self.interval)
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            self.recent_lags.append(lag)
+            if lag >= self.block_threshold:
+                self.blocks += 1
+                self.last_block_time = time.time()
+                logger.info(f'Event loop was blocked for {lag:.3f}s')
+
+
+monitor = LoopLagMonitor()
@@ -1,6 +1,7 @@
 from discord.ext import commands
 
 from util.ranklist.rating_calculator import CodeforcesRatingCalculator
+from util.ranklist.standings import ColumnarStandings
 from util.handledict import HandleDict
 
 
@@ -31,22 +32,20 @@ class Ranklist:
     def __init__(self, contest, problems, standings, fetch_time, *, is_rated):
         self.contest = contest
         self.problems = problems
-        self.standings = standings
+        # Kept column-wise, a big round would otherwise take millions of small objects.
+        self.standings = ColumnarStandings(standings, len(problems))
         self.fetch_time = fetch_time
 
         self.is_rated = is_rated
 
+        # Maps the id of a row to its index in the standings.
         self.standing_by_id = HandleDict()
-        for row in self.standings:
-            if row.party.ghost:
-                # Apparently ghosts don't have team ID.
-                id_ = row.party.teamName
-            else:
-                id_ = row.party.teamId or row.party.members[0].handle
-            self.standing_by_id[id_] = row
+        for i, id_ in enumerate(self.standings.row_ids()):
+            self.standing_by_id[id_] = i
 
         self.delta_by_handle = None
         self.deltas_status = None
+        self.rating_calculator = None
 
     def set_deltas(self, delta_by_handle):
         if not self.is_rated:
@@ -54,13 +53,39 @@ class Ranklist:
         self.delta_by_handle = delta_by_handle.copy()
         self.deltas_status = 'Final'
 
-    def predict(self, current_rating):
+    def predict(self, current_rating, previous=None):
+        """Predict rating changes. `previous` may be an earlier ranklist of the same contest, whose
+        prediction is then updated instead of redone from scratch where possible.
+        """
         if not self.is_rated:
             raise ContestNotRatedError(self.contest)
-        standings = [(id_, row.points, row.penalty, current_rating[id_])
-                     for id_, row in self.standing_by_id.items() if id_ in current_rating]
+        points, penalty = self.standings.points.tolist(), self.standings.penalty.tolist()
+        standings = [(id_, points[i], penalty[i], current_rating[id_])
+                     for id_, i in self.standing_by_id.items() if id_ in current_rating]
         if standings:
-            self.delta_by_handle = CodeforcesRatingCalculator(standings).calculate_rating_changes()
+            previous_calculator = previous and previous.rating_calculator
+            self.rating_calculator = CodeforcesRatingCalculator(standings, previous_calculator)
+            self.delta_by_handle = self.rating_calculator.calculate_rating_changes()
+        self.deltas_status = 'Predicted'
+
+    def predict_inserted(self, current_rating, inserted_rating):
+        """Predict rating changes for the handles in `inserted_rating` only, each as if it were
+        the only one of them taking part alongside the handles in `current_rating`.
+        """
+        if not self.is_rated:
+            raise ContestNotRatedError(self.contest)
+        points, penalty = self.standings.points.tolist(), self.standings.penalty.tolist()
+        standings = [(id_, points[i], penalty[i], current_rating[id_])
+                     for id_, i in self.standing_by_id.items()
+                     if id_ in current_rating and id_ not in inserted_rating]
+        inserted = []
+        for handle, rating in inserted_rating.items():
+            i = self.standing_by_id[handle]
+            inserted.append((handle, points[i], penalty[i], rating))
+        self.delta_by_handle = {}
+        if standings and inserted:
+            calculator = CodeforcesRatingCalculator(standings)
+            self.delta_by_handle = calculator.predict_inserted(inserted)
         self.deltas_status = 'Predicted'
 
     def get_delta(self, handle):
@@ -72,6 +97,6 @@ class Ranklist:
 
     def get_standing_row(self, handle):
         try:
-            return self.standing_by_id[handle]
+            return self.standings.row(self.standing_by_id[handle])
         except KeyError:
             raise HandleNotPresentError(self.contest, handle)
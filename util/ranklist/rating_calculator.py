@@ -4,106 +4,247 @@ by Mike Mirzayanov (mirzayanovmr@gmail.com) at https://codeforces.com/contest/1/
 Updated to use the current rating formula.
 """
 
-from dataclasses import dataclass
+import functools
 
 import numpy as np
 from numpy.fft import fft, ifft
 
+_MAX = 6144
+
+# The ELO win probability for all possible rating differences, and its FFT. Neither depends on
+# the contestants, so they are shared by all calculators.
+_ELO_WIN_PROB = np.roll(1 / (1 + pow(10, np.arange(-_MAX, _MAX) / 400)), -_MAX)
+_ELO_WIN_PROB_FFT = fft(_ELO_WIN_PROB)
+_ELO_WIN_PROB.flags.writeable = False
+
 
 def intdiv(x, y):
     return -(-x // y) if x < 0 else x // y
 
 
-@dataclass
-class Contestant:
-    party: str
-    points: float
-    penalty: int
-    rating: int
-    need_rating: int = 0
-    delta: int = 0
-    rank: float = 0.0
-    seed: float = 0.0
+def rating_histogram(ratings):
+    """Return the histogram of the given ratings, which may be passed to
+    `CodeforcesRatingCalculator` to skip building it.
+    """
+    histogram = np.zeros(2 * _MAX)
+    np.add.at(histogram, np.asarray(ratings, dtype=np.int64), 1)
+    return histogram
+
+
+@functools.lru_cache(maxsize=8)
+def _seed_for_histogram(histogram_bytes):
+    """Compute the seed for all possible ratings using FFT. Cached, as the same field is often
+    predicted for repeatedly.
+    """
+    histogram = np.frombuffer(histogram_bytes)
+    seed = 1 + ifft(fft(histogram) * _ELO_WIN_PROB_FFT).real
+    seed.flags.writeable = False
+    return seed
+
+
+def _intdiv_array(x, y):
+    """`intdiv` applied elementwise to an integer array `x`."""
+    return np.where(x < 0, -(-x // y), x // y)
 
 
 class CodeforcesRatingCalculator:
-    def __init__(self, standings):
-        """Calculate Codeforces rating changes and seeds given contest and user information."""
-        self.contestants = [Contestant(handle, points, penalty, rating)
-                            for handle, points, penalty, rating in standings]
-        self._precalc_seed()
+    """Calculates rating changes for all contestants at once over NumPy arrays. Arrays of
+    per-contestant values are in order of rank, as after `_reassign_ranks`.
+    """
+    _MIN_APPROXIMATED_FIELD = 5000
+
+    def __init__(self, standings, previous=None, *, histogram=None):
+        """Calculate Codeforces rating changes and seeds given contest and user information.
+
+        `previous` may be the calculator for an earlier snapshot of the same contest. If the
+        contestants and their ratings are unchanged the seeds are reused, and performance ratings
+        are only searched for again for contestants whose rank moved.
+
+        `histogram` may be the `rating_histogram` of the ratings in `standings`, if already known.
+        """
+        parties, points, penalty, ratings = zip(*standings)
+        self.parties = np.array(parties, dtype=object)
+        self.points = np.array(points, dtype=np.float64)
+        self.penalty = np.array(penalty, dtype=np.int64)
+        self.ratings = np.array(ratings, dtype=np.int64)
         self._reassign_ranks()
-        self._process()
+        previous_index = self._match_previous(previous)
+        self.elo_win_prob = _ELO_WIN_PROB
+        if previous_index is None:
+            self._precalc_seed(histogram)
+            self._process()
+        else:
+            self.histogram = previous.histogram
+            self.seed = previous.seed
+            self._process_changed(previous, previous_index)
         self._update_delta()
 
     def calculate_rating_changes(self):
         """Return a mapping between contestants and their corresponding delta."""
-        return {contestant.party: contestant.delta for contestant in self.contestants}
-
-    def get_seed(self, rating, me=None):
-        """Get seed given a rating and user."""
+        return dict(zip(self.parties.tolist(), self.deltas.tolist()))
+
+    def predict_inserted(self, standings):
+        """Predict the delta of each of the given extra contestants, each as if it alone were
+        added to the field, without recalculating the field for every one of them.
+
+        The rank, seed and performance rating of an inserted contestant are exact. The zero-sum
+        corrections are approximate: they are applied using the deltas of the field as calculated
+        without the inserted contestant, who would in truth shift those slightly. This is only
+        done for fields of at least `_MIN_APPROXIMATED_FIELD` contestants, where the result is off
+        by at most one; smaller fields are recalculated with each contestant inserted.
+        """
+        if len(self.parties) < self._MIN_APPROXIMATED_FIELD:
+            field = list(zip(self.parties.tolist(), self.points.tolist(), self.penalty.tolist(),
+                             self.ratings.tolist()))
+            delta_by_party = {}
+            for row in standings:
+                histogram = self.histogram.copy()
+                histogram[row[3]] += 1
+                calculator = CodeforcesRatingCalculator(field + [row], histogram=histogram)
+                delta_by_party[row[0]] = calculator.calculate_rating_changes()[row[0]]
+            return delta_by_party
+
+        parties, points, penalty, ratings = zip(*standings)
+        points = np.array(points, dtype=np.float64)
+        penalty = np.array(penalty, dtype=np.int64)
+        ratings = np.array(ratings, dtype=np.int64)
+
+        # The contestant goes after everyone in the field who did at least as well.
+        at_least_as_good = ((self.points[None, :] > points[:, None]) |
+                            ((self.points[None, :] == points[:, None]) &
+                             (self.penalty[None, :] <= penalty[:, None])))
+        positions = at_least_as_good.sum(axis=1)
+        ranks = positions + 1
+
+        # Excluding themselves, the seed of an inserted contestant is that of the field.
+        seeds = self.get_seed(ratings)
+        mid_ranks = np.array([x ** 0.5 for x in (ranks * seeds).tolist()])
+        deltas = _intdiv_array(self._rank_to_rating(mid_ranks, None) - ratings, 2)
+
+        n = len(self.uncorrected_deltas) + 1
+        zero_sum_count = min(4 * round(n ** 0.5), n)
+        top_delta_sums = np.concatenate(([0], np.cumsum(self.uncorrected_deltas[self.by_rating])))
+        ratings_desc = self.ratings[self.by_rating]
+        field_delta_sum = int(self.uncorrected_deltas.sum())
+
+        delta_by_party = {}
+        for party, delta, rating, position in zip(parties, deltas.tolist(), ratings.tolist(),
+                                                  positions.tolist()):
+            correction = intdiv(-(field_delta_sum + delta), n) - 1
+            # Ties in rating are broken by rank.
+            higher_rated = (int(np.searchsorted(-ratings_desc, -rating, side='left')) +
+                            int(np.count_nonzero(self.ratings[:position] == rating)))
+            if higher_rated < zero_sum_count:
+                top_sum = int(top_delta_sums[zero_sum_count - 1]) + delta
+            else:
+                top_sum = int(top_delta_sums[zero_sum_count])
+            top_sum += zero_sum_count * correction
+            correction += min(0, max(-10, intdiv(-top_sum, zero_sum_count)))
+            delta_by_party[party] = delta + correction
+        return delta_by_party
+
+    def get_seed(self, rating, own_rating=None):
+        """Get seed given a rating, excluding the contestant with `own_rating` if given. Works
+        elementwise on arrays.
+        """
         seed = self.seed[rating]
-        if me:
-            seed -= self.elo_win_prob[rating - me.rating]
+        if own_rating is not None:
+            seed = seed - self.elo_win_prob[rating - own_rating]
         return seed
 
-    def _precalc_seed(self):
-        MAX = 6144
-
-        # Precompute the ELO win probability for all possible rating differences.
-        self.elo_win_prob = np.roll(1 / (1 + pow(10, np.arange(-MAX, MAX) / 400)), -MAX)
-
-        # Compute the rating histogram.
-        count = np.zeros(2 * MAX)
-        for a in self.contestants:
-            count[a.rating] += 1
-
-        # Precompute the seed for all possible ratings using FFT.
-        self.seed = 1 + ifft(fft(count) * fft(self.elo_win_prob)).real
+    def _match_previous(self, previous):
+        """Return the index in `previous` of each contestant if `previous` has exactly the same
+        contestants with the same ratings. Otherwise return None.
+        """
+        if previous is None or len(previous.parties) != len(self.parties):
+            return None
+        # Both are in order of rank, so only contestants whose position changed are looked up.
+        moved = np.flatnonzero(self.parties != previous.parties)
+        index = np.arange(len(self.parties))
+        if len(moved):
+            previous_index_by_party = dict(zip(previous.parties[moved].tolist(), moved.tolist()))
+            try:
+                index[moved] = [previous_index_by_party[party]
+                                for party in self.parties[moved].tolist()]
+            except KeyError:
+                return None
+        if (previous.ratings[index] != self.ratings).any():
+            return None
+        return index
+
+    def _precalc_seed(self, histogram):
+        if histogram is None:
+            histogram = rating_histogram(self.ratings)
+        self.histogram = histogram
+        self.seed = _seed_for_histogram(np.asarray(histogram, dtype=np.float64).tobytes())
 
     def _reassign_ranks(self):
         """Find the rank of each contestant."""
-        contestants = self.contestants
-        contestants.sort(key=lambda o: (-o.points, o.penalty))
-        points = penalty = rank = None
-        for i in reversed(range(len(contestants))):
-            if contestants[i].points != points or contestants[i].penalty != penalty:
-                rank = i + 1
-                points = contestants[i].points
-                penalty = contestants[i].penalty
-            contestants[i].rank = rank
+        # Stable sort by (-points, penalty).
+        order = np.lexsort((self.penalty, -self.points))
+        self.parties = self.parties[order]
+        self.points = self.points[order]
+        self.penalty = self.penalty[order]
+        self.ratings = self.ratings[order]
+
+        # Tied contestants all get the lowest rank of the tie.
+        n = len(order)
+        last_of_tie = np.ones(n, dtype=bool)
+        last_of_tie[:-1] = ((self.points[1:] != self.points[:-1]) |
+                            (self.penalty[1:] != self.penalty[:-1]))
+        tie_index = np.cumsum(last_of_tie) - last_of_tie
+        self.ranks = np.flatnonzero(last_of_tie)[tie_index] + 1
 
     def _process(self):
         """Process and assign approximate delta for each contestant."""
-        for a in self.contestants:
-            a.seed = self.get_seed(a.rating, a)
-            mid_rank = (a.rank * a.seed) ** 0.5
-            a.need_rating = self._rank_to_rating(mid_rank, a)
-            a.delta = intdiv(a.need_rating - a.rating, 2)
-
-    def _rank_to_rating(self, rank, me):
-        """Binary Search to find the performance rating for a given rank."""
-        left, right = 1, 8000
-        while right - left > 1:
+        self.seeds = self.get_seed(self.ratings, self.ratings)
+        self.need_ratings = self._need_ratings(self.ranks, self.seeds, self.ratings)
+        self.deltas = _intdiv_array(self.need_ratings - self.ratings, 2)
+
+    def _process_changed(self, previous, previous_index):
+        """Like `_process`, but reuses the performance ratings from `previous` for contestants
+        whose rank did not change. `previous_index` is the index in `previous` of each contestant.
+        """
+        self.seeds = previous.seeds[previous_index]
+        self.need_ratings = previous.need_ratings[previous_index]
+        moved = previous.ranks[previous_index] != self.ranks
+        if moved.any():
+            self.need_ratings[moved] = self._need_ratings(self.ranks[moved], self.seeds[moved],
+                                                          self.ratings[moved])
+        self.deltas = _intdiv_array(self.need_ratings - self.ratings, 2)
+
+    def _need_ratings(self, ranks, seeds, ratings):
+        # Python's pow is used rather than np.power, whose vectorized versions may round
+        # differently, to keep results identical to the scalar formula.
+        mid_ranks = np.array([x ** 0.5 for x in (ranks * seeds).tolist()])
+        return self._rank_to_rating(mid_ranks, ratings)
+
+    def _rank_to_rating(self, ranks, own_ratings):
+        """Binary Search to find the performance rating for given ranks, for all contestants at
+        once.
+        """
+        left = np.ones(len(ranks), dtype=np.int64)
+        right = np.full(len(ranks), 8000, dtype=np.int64)
+        while True:
+            active = right - left > 1
+            if not active.any():
+                return left
             mid = (left + right) // 2
-            if self.get_seed(mid, me) < rank:
-                right = mid
-            else:
-                left = mid
-        return left
+            below = self.get_seed(mid, own_ratings) < ranks
+            right = np.where(active & below, mid, right)
+            left = np.where(active & ~below, mid, left)
 
     def _update_delta(self):
         """Update the delta of each contestant."""
-        contestants = self.contestants
-        n = len(contestants)
+        self.uncorrected_deltas = self.deltas.copy()
+        n = len(self.deltas)
 
-        contestants.sort(key=lambda o: -o.rating)
-        correction = intdiv(-sum(c.delta for c in contestants), n) - 1
-        for contestant in contestants:
-            contestant.delta += correction
+        correction = intdiv(-int(self.deltas.sum()), n) - 1
+        self.deltas += correction
 
+        # Stable sort by -rating.
+        self.by_rating = np.argsort(-self.ratings, kind='stable')
         zero_sum_count = min(4 * round(n ** 0.5), n)
-        delta_sum = -sum(contestants[i].delta for i in range(zero_sum_count))
+        delta_sum = -int(self.deltas[self.by_rating[:zero_sum_count]].sum())
         correction = min(0, max(-10, intdiv(delta_sum, zero_sum_count)))
-        for contestant in contestants:
-            contestant.delta += correction
+        self.deltas += correction
@@ -0,0 +1,177 @@
+import numpy as np
+
+from util import codeforces_api as cf
+
+# Sentinel stored in integer columns for None.
+_NONE = -1
+
+_PARTICIPANT_TYPES = cf.Party.PARTICIPANT_TYPES
+_PROBLEM_RESULT_TYPES = ('PRELIMINARY', 'FINAL')
+
+
+def _encode(value):
+    return _NONE if value is None else value
+
+
+def _decode(value):
+    return None if value == _NONE else value
+
+
+def _coder(values, known):
+    """Returns a function giving the index of a value in `values`, which starts as the `known`
+    values. Unknown values are appended to `values`.
+    """
+    values.extend(known)
+    index_by_value = {value: index for index, value in enumerate(values)}
+
+    def code(value):
+        index = index_by_value.get(value)
+        if index is None:
+            index = index_by_value[value] = len(values)
+            values.append(value)
+        return index
+
+    return code
+
+
+class ColumnarStandings:
+    """Standings rows stored column-wise in NumPy arrays instead of as one `RanklistRow` per row.
+    Strings such as handles and team names are kept once in a shared table and referenced by
+    index. Rows are rebuilt as `RanklistRow`s on access, and the object can be used like a
+    read-only list of rows.
+    """
+
+    def __init__(self, rows, num_problems):
+        n = len(rows)
+        self.num_problems = num_problems
+        # Rows are expected to have a result per problem, but any row may have more or fewer. The
+        # problem columns are as wide as the longest row, and shorter rows are padded.
+        problem_count = [len(row.problemResults) for row in rows]
+        width = max([num_problems, *problem_count])
+
+        # Types the API may add later are appended after the known ones.
+        self.participant_types = []
+        participant_type_code = _coder(self.participant_types, _PARTICIPANT_TYPES)
+        self.problem_result_types = []
+        problem_result_type_code = _coder(self.problem_result_types, _PROBLEM_RESULT_TYPES)
+
+        self.strings = []
+        string_index = {}
+
+        def intern(string):
+            if string is None:
+                return _NONE
+            index = string_index.get(string)
+            if index is None:
+                index = string_index[string] = len(self.strings)
+                self.strings.append(string)
+            return index
+
+        contest_id, participant_type, team_id, team_name, ghost, room, start_time = (
+            [], [], [], [], [], [], [])
+        member_offset, member_handle = [0], []
+        pr_points, pr_penalty, pr_rejected, pr_type, pr_best_time = [], [], [], [], []
+        for row in rows:
+            party = row.party
+            contest_id.append(_encode(party.contestId))
+            participant_type.append(participant_type_code(party.participantType))
+            team_id.append(_encode(party.teamId))
+            team_name.append(intern(party.teamName))
+            ghost.append(_encode(party.ghost))
+            room.append(_encode(party.room))
+            start_time.append(_encode(party.startTimeSeconds))
+            member_handle += [intern(member.handle) for member in party.members]
+            member_offset.append(len(member_handle))
+            for result in row.problemResults:
+                pr_points.append(result.points)
+                pr_penalty.append(_encode(result.penalty))
+                pr_rejected.append(_encode(result.rejectedAttemptCount))
+                pr_type.append(_encode(result.type and problem_result_type_code(result.type)))
+                pr_best_time.append(_encode(result.bestSubmissionTimeSeconds))
+            padding = width - len(row.problemResults)
+            pr_points += [0.0] * padding
+            for column in (pr_penalty, pr_rejected, pr_type, pr_best_time):
+                column += [_NONE] * padding
+
+        self.rank = np.array([row.rank for row in rows], dtype=np.int32)
+        self.points = np.array([row.points for row in rows], dtype=np.float64)
+        self.penalty = np.array([row.penalty for row in rows], dtype=np.int32)
+
+        self.contest_id = np.array(contest_id, dtype=np.int32)
+        self.participant_type = np.array(participant_type, dtype=np.int8)
+        self.team_id = np.array(team_id, dtype=np.int32)
+        self.team_name = np.array(team_name, dtype=np.int32)
+        self.ghost = np.array(ghost, dtype=np.int8)
+        self.room = np.array(room, dtype=np.int32)
+        self.start_time = np.array(start_time, dtype=np.int64)
+        self.member_offset = np.array(member_offset, dtype=np.int32)
+        self.member_handle = np.array(member_handle, dtype=np.int32)
+
+        self.problem_count = np.array(problem_count, dtype=np.int16)
+        shape = (n, width)
+        self.problem_points = np.array(pr_points, dtype=np.float64).reshape(shape)
+        self.problem_penalty = np.array(pr_penalty, dtype=np.int32).reshape(shape)
+        self.problem_rejected = np.array(pr_rejected, dtype=np.int16).reshape(shape)
+        self.problem_type = np.array(pr_type, dtype=np.int8).reshape(shape)
+        self.problem_best_time = np.array(pr_best_time, dtype=np.int32).reshape(shape)
+
+    def __len__(self):
+        return len(self.rank)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(j) for j in range(*i.indices(len(self)))]
+        return self.row(i)
+
+    def __iter__(self):
+        return (self.row(i) for i in range(len(self)))
+
+    @property
+    def nbytes(self):
+        arrays = [value for value in vars(self).values() if isinstance(value, np.ndarray)]
+        return sum(array.nbytes for array in arrays)
+
+    def _string(self, index):
+        return None if index == _NONE else self.strings[index]
+
+    def handles(self, i):
+        begin, end = self.member_offset[i], self.member_offset[i + 1]
+        return [self.strings[index] for index in self.member_handle[begin:end].tolist()]
+
+    def row_ids(self):
+        """Returns the id of every row: the team name for ghosts, the team id for teams and the
+        handle otherwise.
+        """
+        ghost, team_id = self.ghost.tolist(), self.team_id.tolist()
+        team_name = self.team_name.tolist()
+        member_offset, member_handle = self.member_offset.tolist(), self.member_handle.tolist()
+        ids = []
+        for i in range(len(ghost)):
+            if ghost[i] == 1:
+                # Apparently ghosts don't have team ID.
+                ids.append(self._string(team_name[i]))
+            else:
+                ids.append(_decode(team_id[i]) or self.strings[member_handle[member_offset[i]]])
+        return ids
+
+    def row(self, i):
+        ghost = _decode(self.ghost[i].item())
+        party = cf.Party(contestId=_decode(self.contest_id[i].item()),
+                         members=[cf.Member(handle) for handle in self.handles(i)],
+                         participantType=self.participant_types[self.participant_type[i]],
+                         teamId=_decode(self.team_id[i].item()),
+                         teamName=self._string(self.team_name[i]),
+                         ghost=None if ghost is None else bool(ghost),
+                         room=_decode(self.room[i].item()),
+                         startTimeSeconds=_decode(self.start_time[i].item()))
+        problem_results = []
+        for j in range(self.problem_count[i]):
+            type_ = _decode(self.problem_type[i, j].item())
+            problem_results.append(cf.ProblemResult(
+                points=self.problem_points[i, j].item(),
+                penalty=_decode(self.problem_penalty[i, j].item()),
+                rejectedAttemptCount=_decode(self.problem_rejected[i, j].item()),
+                type=None if type_ is None else self.problem_result_types[type_],
+                bestSubmissionTimeSeconds=_decode(self.problem_best_time[i, j].item())))
+        return cf.RanklistRow(party=party, rank=self.rank[i].item(), points=self.points[i].item(),
+                              penalty=self.penalty[i].item(), problemResults=problem_results)
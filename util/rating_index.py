@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class RatingIndex:
+    """Counts of ratings, kept in a Fenwick tree so that the number of ratings below some rating
+    is found in O(log n) and single ratings can be added or removed as they change. Ratings are
+    clamped to [low, high).
+    """
+
+    def __init__(self, ratings=(), *, low=-1000, high=6000):
+        self.low = low
+        self.high = high
+        self.counts = np.bincount(self._positions(ratings), minlength=high - low)
+        self.total = int(self.counts.sum())
+        # Node i of the tree covers the counts at positions [i - (i & -i), i), for i from 1.
+        self._tree = [0] + self.counts.tolist()
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def _position(self, rating):
+        return min(max(rating, self.low), self.high - 1) - self.low
+
+    def _positions(self, ratings):
+        ratings = np.asarray(ratings, dtype=np.int64)
+        return np.clip(ratings, self.low, self.high - 1) - self.low
+
+    def __len__(self):
+        return self.total
+
+    def add(self, rating, count=1):
+        """Adds `count` copies of the rating, or removes them if `count` is negative."""
+        position = self._position(rating)
+        self.counts[position] += count
+        self.total += count
+        i = position + 1
+        while i < len(self._tree):
+            self._tree[i] += count
+            i += i & -i
+
+    def update(self, old_rating, new_rating):
+        """Replaces one copy of `old_rating`, if not None, with `new_rating`."""
+        if old_rating is not None:
+            self.add(old_rating, -1)
+        self.add(new_rating)
+
+    def count_below(self, rating):
+        """Returns the number of ratings less than the given rating."""
+        if rating <= self.low:
+            return 0
+        i = min(rating, self.high) - self.low
+        count = 0
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def count_at_least(self, rating):
+        return self.total - self.count_below(rating)
+
+    def percentile(self, rating):
+        """Returns the percentage of ratings less than the given rating."""
+        return 100 * self.count_below(rating) / self.total
+
+    def histogram(self, bin_size, low=0, high=None):
+        """Returns the number of ratings in each bin of `bin_size` from `low` up to `high`."""
+        high = self.high if high is None else high
+        begin, end = self._position(low), self._position(high - 1) + 1
+        counts = self.counts[begin:end]
+        return np.add.reduceat(counts, np.arange(0, len(counts), bin_size))
+
+    def percentile_curve(self):
+        """Returns the points of the curve of the percentile of each rating in sorted order, with
+        all equal ratings merged into one vertical segment.
+        """
+        positions = np.flatnonzero(self.counts)
+        counts = self.counts[positions]
+        below = np.cumsum(counts) - counts
+        ratings = np.repeat(positions + self.low, 2)
+        percentiles = 100 * np.stack((below, below + counts - 1), axis=1).ravel() / self.total
+        return ratings, percentiles
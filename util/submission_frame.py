@@ -0,0 +1,102 @@
+from operator import attrgetter
+
+import numpy as np
+
+
+def _codes(values):
+    """Returns the distinct values in order of first appearance, and the position of each value
+    among them.
+    """
+    distinct = list(dict.fromkeys(values))
+    code_by_value = {value: code for code, value in enumerate(distinct)}
+    codes = np.fromiter(map(code_by_value.__getitem__, values), dtype=np.int64, count=len(values))
+    return distinct, codes
+
+
+def _column(values, dtype):
+    return np.fromiter(values, dtype=dtype, count=len(values))
+
+
+class SubmissionFrame:
+    """Columns of a list of submissions, so that they can be filtered with array operations
+    instead of one submission at a time. Text columns hold codes into lists of their distinct
+    values.
+    """
+
+    def __init__(self, submissions):
+        self.submissions = submissions
+        problems = list(map(attrgetter('problem'), submissions))
+        authors = list(map(attrgetter('author'), submissions))
+        self.creation_time = _column(list(map(attrgetter('creationTimeSeconds'), submissions)),
+                                     np.int64)
+        verdicts, verdict_code = _codes(list(map(attrgetter('verdict'), submissions)))
+        self.accepted = verdict_code == (verdicts.index('OK') if 'OK' in verdicts else -1)
+        self.participant_types, self.participant_type_code = _codes(
+            list(map(attrgetter('participantType'), authors)))
+        self.team_size = _column([len(members) for members in map(attrgetter('members'), authors)],
+                                 np.int64)
+        # Problems are told apart as by Codeforces, by problemset or contest and index. Keys are
+        # combined from codes rather than built as tuples, which would be slow to allocate.
+        problem_key = np.zeros(len(problems), dtype=np.int64)
+        for field in ('problemsetName', 'contestId', 'index'):
+            values, codes = _codes(list(map(attrgetter(field), problems)))
+            problem_key = problem_key * len(values) + codes
+        _, first, problem_code = np.unique(problem_key, return_index=True, return_inverse=True)
+
+        # The remaining columns depend only on the problem, so they are filled in once per
+        # distinct problem and then spread over the submissions.
+        distinct_problems = [problems[position] for position in first.tolist()]
+        self.names, name_code = _codes([problem.name for problem in distinct_problems])
+        # -1 for problems not in a contest, as those of acmsguru.
+        contest_id = _column([-1 if problem.contestId is None else problem.contestId
+                              for problem in distinct_problems], np.int64)
+        # NaN for unrated problems.
+        rating = _column([problem.rating or np.nan for problem in distinct_problems], float)
+        self.indices, index_code = _codes([problem.index.lower() for problem in distinct_problems])
+        self.name_code = name_code[problem_code]
+        self.contest_id = contest_id[problem_code]
+        self.rating = rating[problem_code]
+        self.index_code = index_code[problem_code]
+
+        code_by_tag = {}
+        rows, columns = [], []
+        for row, problem in enumerate(distinct_problems):
+            for tag in problem.tags:
+                rows.append(row)
+                columns.append(code_by_tag.setdefault(tag, len(code_by_tag)))
+        self.tags = list(code_by_tag)
+        has_tag = np.zeros((len(distinct_problems), len(self.tags)), dtype=bool)
+        has_tag[rows, columns] = True
+        # Row i, column j is set if the problem of submission i has tag j.
+        self.has_tag = has_tag[problem_code]
+
+    def __len__(self):
+        return len(self.submissions)
+
+    def tag_mask(self, query_tags):
+        """Returns which submissions are of problems for which every query tag is a substring
+        of some tag of the problem, like `Problem.tag_matches`.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for query_tag in query_tags:
+            columns = [code for code, tag in enumerate(self.tags) if query_tag in tag]
+            mask &= self.has_tag[:, columns].any(axis=1)
+        return mask
+
+    def code_mask(self, codes, values, wanted):
+        """Returns which submissions have a value in `wanted` in the column of `codes` into
+        distinct `values`.
+        """
+        wanted = set(wanted)
+        return np.isin(codes, [code for code, value in enumerate(values) if value in wanted])
+
+    def by_contest(self, fn, dtype=bool):
+        """Returns the column of `fn` of the contest of each submission's problem, calling `fn`
+        once per distinct contest id.
+        """
+        contest_ids, contest_code = np.unique(self.contest_id, return_inverse=True)
+        return np.array([fn(contest_id) for contest_id in contest_ids.tolist()],
+                        dtype=dtype)[contest_code]
+
+    def take(self, positions):
+        return [self.submissions[position] for position in positions.tolist()]
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+class TagIndex:
+    """Inverted index from each tag to the sorted positions of the problems with the tag, so that
+    problems matching some tags are found by merging the lists of the matching tags instead of
+    checking the tags of every problem.
+    """
+
+    def __init__(self, problems=()):
+        self.size = 0
+        positions_by_tag = {}
+        for position, problem in enumerate(problems):
+            self.size += 1
+            for tag in problem.tags:
+                positions_by_tag.setdefault(tag, []).append(position)
+        self.positions_by_tag = {tag: np.array(positions, dtype=np.int64)
+                                 for tag, positions in positions_by_tag.items()}
+
+    def matching_tags(self, query_tag):
+        """Returns the tags of which `query_tag` is a substring, like `Problem.tag_matches`."""
+        return [tag for tag in self.positions_by_tag if query_tag in tag]
+
+    def positions(self, query_tags):
+        """Returns the sorted positions of the problems for which every query tag is a substring
+        of some tag of the problem.
+        """
+        result = np.arange(self.size)
+        for query_tag in query_tags:
+            postings = [self.positions_by_tag[tag] for tag in self.matching_tags(query_tag)]
+            if not postings:
+                return np.array([], dtype=np.int64)
+            positions = np.unique(np.concatenate(postings))
+            result = np.intersect1d(result, positions, assume_unique=True)
+        return result